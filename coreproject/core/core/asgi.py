@@ -9,19 +9,26 @@ https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 
 import os
 
-import users.routing
-from channels.auth import AuthMiddlewareStack
-from channels.routing import ProtocolTypeRouter, URLRouter
 from django.core.asgi import get_asgi_application
 
-
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
+# Sets up Django before the consumers and their models are imported
+django_asgi_app = get_asgi_application()
+
+import users.routing  # noqa: E402
+from channels.auth import AuthMiddlewareStack  # noqa: E402
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+from users.authentication import TokenAuthMiddleware  # noqa: E402
+
 application = ProtocolTypeRouter({
-    'http': get_asgi_application(),
+    'http': django_asgi_app,
+    # API clients hold bearer tokens, not sessions; a token takes precedence over the session user
     'websocket': AuthMiddlewareStack(
-        URLRouter(
-            users.routing.websocket_urlpatterns
+        TokenAuthMiddleware(
+            URLRouter(
+                users.routing.websocket_urlpatterns
+            )
         )
     )
 })
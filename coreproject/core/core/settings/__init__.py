@@ -0,0 +1,15 @@
+"""
+Settings, split by profile.
+
+``base`` holds what every process needs; ``DJANGO_ENV`` picks the profile
+layered on top of it: ``development`` (the default) adds the debug toolbar,
+Swagger/ReDoc and CKEditor, ``production`` loads only what serves the API.
+"""
+import os
+
+from .base import *  # noqa: F401,F403 (also loads .env, which may set DJANGO_ENV)
+
+if os.getenv('DJANGO_ENV', 'development') == 'production':
+    from .production import *  # noqa: F401,F403
+else:
+    from .development import *  # noqa: F401,F403
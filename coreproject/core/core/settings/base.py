@@ -1,5 +1,5 @@
 """
-Django settings for core project.
+Django settings for core project, shared by every profile (see ``core.settings``).
 
 Generated by 'django-admin startproject' using Django 5.1.
 
@@ -12,14 +12,12 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 
-import pymysql
-pymysql.install_as_MySQLdb()
-
 import os
+from celery.schedules import crontab
 from dotenv import load_dotenv
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
-BASE_DIR = Path(__file__).resolve().parent.parent
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
 
 dotenv_path = BASE_DIR / '.env'
 load_dotenv(dotenv_path=dotenv_path)
@@ -31,7 +29,7 @@ load_dotenv(dotenv_path=dotenv_path)
 SECRET_KEY = os.getenv('SERCRET_KEY', 'django-insecure-(ybtcxyr!qdgkzlnniv+h2)=i#0pc3t+n11kh+4e7^hi_8ekc%')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = False
 
 ALLOWED_HOSTS = ['*']
 
@@ -46,13 +44,8 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'users.apps.UsersConfig',
     'rest_framework',
-    'drf_yasg',
     'oauth2_provider',
     'corsheaders',
-    'cloudinary',
-    'ckeditor',
-    'ckeditor_uploader',
-    'debug_toolbar',
     'channels'
 ]
 
@@ -67,7 +60,11 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Publish channel-layer batches from a background thread after commit; off -> in the committing thread
+CHANNEL_DISPATCH_BACKGROUND = os.getenv('CHANNEL_DISPATCH_BACKGROUND', '1') == '1'
+
 MIDDLEWARE = [
+    'users.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -75,9 +72,9 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
     'oauth2_provider.middleware.OAuth2TokenMiddleware',
-    'corsheaders.middleware.CorsMiddleware'
+    'corsheaders.middleware.CorsMiddleware',
+    'users.middleware.UserActivityMiddleware',
 ]
 
 ROOT_URLCONF = 'core.urls'
@@ -111,9 +108,22 @@ DATABASES = {
         'PASSWORD': os.getenv('DATABASE_PASSWORD'),
         'HOST': os.getenv('DATABASE_HOST'),
         # 'PORT': os.getenv('DATABASE_PORT')
+        # Seconds a connection is reused across requests (0 closes it after each one)
+        'CONN_MAX_AGE': int(os.getenv('DATABASE_CONN_MAX_AGE', 0)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# DATABASE_ENGINE=sqlite runs against a local file, e.g. for `manage.py bench`
+if os.getenv('DATABASE_ENGINE') == 'sqlite':
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+    }
+else:
+    import pymysql
+    pymysql.install_as_MySQLdb()
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -148,6 +158,15 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+MEDIA_URL = '/media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# Uploaded avatars/cover images are staged here until the upload task runs;
+# web and Celery workers must share this directory.
+MEDIA_STAGING_DIR = os.getenv('MEDIA_STAGING_DIR', BASE_DIR / 'media' / 'staging')
+MEDIA_STORAGE_BACKEND = os.getenv('MEDIA_STORAGE_BACKEND', 'users.media.CloudinaryMediaStorage')
+DEFAULT_AVATAR_URL = os.getenv('DEFAULT_AVATAR_URL', '')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -157,8 +176,6 @@ CORS_ORIGIN_ALLOW_ALL = True
 
 AUTH_USER_MODEL = 'users.User'
 
-CKEDITOR_UPLOAD_PATH = 'ckeditor/images/'
-
 OAUTH2_PROVIDER = {
     'OAUTH2_BACKEND_CLASS': 'oauth2_provider.oauth2_backends.JSONOAuthLibCore',
     'ACCESS_TOKEN_EXPIRE_SECONDS': 36000,
@@ -169,15 +186,31 @@ OAUTH2_PROVIDER = {
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'oauth2_provider.contrib.rest_framework.OAuth2Authentication',
+        'users.authentication.CachedOAuth2Authentication',
     ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
 }
 
-INTERNAL_IPS = [
-    '127.0.0.1'
-]
+# Validated access tokens are cached per process for TOKEN_CACHE_TTL seconds;
+# set TOKEN_CACHE_ALIAS to a cache in CACHES (e.g. 'shared') to share them across workers.
+TOKEN_CACHE_TTL = int(os.getenv('TOKEN_CACHE_TTL', 30))
+TOKEN_CACHE_SIZE = 10000
+TOKEN_CACHE_ALIAS = os.getenv('TOKEN_CACHE_ALIAS') or None
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('SHARED_CACHE_URL', 'redis://localhost:6379/2'),
+    },
+}
+
+# current-user/profile responses, keyed by a per-user version in the users store
+RESPONSE_CACHE_ALIAS = os.getenv('RESPONSE_CACHE_ALIAS', 'default')
+RESPONSE_CACHE_TIMEOUT = 300
 
 AUTHENTICATION_BACKENDS = (
     # drf-social-oauth2
@@ -186,13 +219,12 @@ AUTHENTICATION_BACKENDS = (
     'django.contrib.auth.backends.ModelBackend',
 )
 
-import cloudinary
-
-cloudinary.config(
-    cloud_name=os.getenv('CLOUDINARY_NAME'),
-    api_key=os.getenv('CLOUDINARY_API_KEY'),
-    api_secret=os.getenv('CLOUDINARY_SECRET')
-)
+# Passed to cloudinary.config() by CloudinaryMediaStorage on first upload
+CLOUDINARY = {
+    'cloud_name': os.getenv('CLOUDINARY_NAME'),
+    'api_key': os.getenv('CLOUDINARY_API_KEY'),
+    'api_secret': os.getenv('CLOUDINARY_SECRET'),
+}
 
 CLIENT_ID = os.getenv('CLIENT_ID')
 CLIENT_SECRET = os.getenv('CLIENT_SECRET')
@@ -204,9 +236,55 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
+CELERY_BEAT_SCHEDULE = {
+    'flush-presence': {
+        'task': 'users.tasks.flush_presence_task',
+        'schedule': float(os.getenv('PRESENCE_FLUSH_INTERVAL', 15)),
+    },
+    'sweep-presence': {
+        'task': 'users.tasks.sweep_presence_task',
+        'schedule': float(os.getenv('PRESENCE_SWEEP_INTERVAL', 30)),
+    },
+    'recompute-friend-suggestions': {
+        'task': 'users.tasks.recompute_friend_suggestions_task',
+        'schedule': crontab(hour=3, minute=0),
+    },
+}
+
+# Redis used by the users app for presence and caches; empty -> in-process store
+USERS_STORE_URL = os.getenv('USERS_STORE_URL', 'redis://localhost:6379/1')
+
+# Seconds within which repeated activity from the same user is not re-recorded
+PRESENCE_GRANULARITY = int(os.getenv('PRESENCE_GRANULARITY', 60))
+
+# Seconds a heartbeat keeps a user online; must exceed PRESENCE_GRANULARITY
+PRESENCE_TTL = int(os.getenv('PRESENCE_TTL', 120))
+
+# Seconds a publisher trusts its last look at whether any msgpack socket is open
+MSGPACK_SUBSCRIBERS_REFRESH = float(os.getenv('MSGPACK_SUBSCRIBERS_REFRESH', 1))
+
+# Friend adjacency cache: per-process LRU size and TTL, and TTL of the shared Redis sets
+FRIEND_GRAPH_LOCAL_SIZE = 10000
+FRIEND_GRAPH_LOCAL_TTL = 5
+FRIEND_GRAPH_TTL = 24 * 60 * 60
+
+# "People you may know": suggestions kept per user, and users per sparse-product block
+FRIEND_SUGGESTIONS_K = 20
+FRIEND_SUGGESTIONS_BLOCK_SIZE = int(os.getenv('FRIEND_SUGGESTIONS_BLOCK_SIZE', 2000))
+
+# /metrics: bearer token required to scrape it (empty -> open), and the share of
+# requests profiled with cProfile, of which those slower than the threshold (seconds) are kept
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+METRICS_PROFILE_RATE = float(os.getenv('METRICS_PROFILE_RATE', 0))
+METRICS_PROFILE_THRESHOLD = float(os.getenv('METRICS_PROFILE_THRESHOLD', 0.5))
+METRICS_PROFILE_DIR = os.getenv('METRICS_PROFILE_DIR', BASE_DIR / 'profiles')
+
+# Committed OpenAPI schema, written by `manage.py generate_schema` and served at /swagger.json|.yaml
+OPENAPI_SCHEMA_DIR = BASE_DIR / 'openapi'
 
 
 #redis
 #daphne -p 8000 core.asgi:application
 #celery
 # celery -A core worker --loglevel=info
+# celery -A core beat --loglevel=info
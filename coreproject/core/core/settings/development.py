@@ -0,0 +1,28 @@
+"""Local development: debugging aids and API docs on top of ``base``."""
+from .base import *  # noqa: F401,F403
+
+DEBUG = True
+
+ALLOWED_HOSTS = ['*']
+
+INSTALLED_APPS = INSTALLED_APPS + [
+    'drf_yasg',
+    'cloudinary',
+    'ckeditor',
+    'ckeditor_uploader',
+    'debug_toolbar',
+]
+
+MIDDLEWARE = MIDDLEWARE.copy()
+MIDDLEWARE.insert(MIDDLEWARE.index('oauth2_provider.middleware.OAuth2TokenMiddleware'),
+                  'debug_toolbar.middleware.DebugToolbarMiddleware')
+
+INTERNAL_IPS = [
+    '127.0.0.1'
+]
+
+CKEDITOR_UPLOAD_PATH = 'ckeditor/images/'
+
+# Swagger UI and ReDoc load the prebuilt schema instead of introspecting the API
+SWAGGER_SETTINGS = {'SPEC_URL': ('schema-json', {'format': '.json'})}
+REDOC_SETTINGS = {'SPEC_URL': ('schema-json', {'format': '.json'})}
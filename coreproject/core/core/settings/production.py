@@ -0,0 +1,30 @@
+"""
+Production: only the apps and middleware the API needs.
+
+The secret key, allowed hosts and the ``/metrics`` bearer token must come
+from the environment. Database
+connections are kept for ``DATABASE_CONN_MAX_AGE`` seconds (60 by default)
+and health-checked before reuse, and DRF renders JSON only, so the browsable
+API's templates are never loaded.
+"""
+from django.core.exceptions import ImproperlyConfigured
+
+from .base import *  # noqa: F401,F403
+
+DEBUG = False
+
+if not os.getenv('SERCRET_KEY'):
+    raise ImproperlyConfigured('Set SERCRET_KEY for DJANGO_ENV=production')
+
+if not METRICS_TOKEN:
+    raise ImproperlyConfigured('Set METRICS_TOKEN for DJANGO_ENV=production')
+
+ALLOWED_HOSTS = [host for host in os.getenv('ALLOWED_HOSTS', '').split(',') if host]
+
+DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv('DATABASE_CONN_MAX_AGE', 60))
+DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    'DEFAULT_RENDERER_CLASSES': ('rest_framework.renderers.JSONRenderer',),
+}
@@ -13,40 +13,51 @@ Class-based views
 Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
+
+Swagger/ReDoc, CKEditor uploads and the debug toolbar are only routed when
+their apps are installed (the development settings profile), and only then
+imported. The schema itself is the prebuilt file from users.schema, served in
+every profile.
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include, re_path
-from drf_yasg import openapi
-from drf_yasg.views import get_schema_view
-from rest_framework import permissions
-import debug_toolbar
-
-schema_view = get_schema_view(
-    openapi.Info(
-        title="Social Network API",
-        default_version='v1',
-        description="APIs for Social Media",
-        contact=openapi.Contact(email="2151010040chinh@ou.edu.vn"),
-        license=openapi.License(name="Trần Chinh@2023"),
-    ),
-    public=True,
-    permission_classes=[permissions.AllowAny]
-)
+
+from users.views import metrics_export, openapi_schema
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('users.urls')),
-    path('__debug__/', include(debug_toolbar.urls)),
-    re_path(r'^swagger(?P<format>\.json|\.yaml)$',
-            schema_view.without_ui(cache_timeout=0),
-            name='schema-json'),
-    re_path(r'^swagger/$',
-            schema_view.with_ui('swagger', cache_timeout=0),
-            name='schema-swagger-ui'),
-    re_path(r'^redoc/$',
-            schema_view.with_ui('redoc', cache_timeout=0),
-            name='schema-redoc'),
+    path('metrics', metrics_export, name='metrics'),
+    re_path(r'^swagger(?P<format>\.json|\.yaml)$', openapi_schema, name='schema-json'),
     path('o/', include('oauth2_provider.urls',
                        namespace='oauth2_provider')),
-    re_path(r'^ckeditor/', include('ckeditor_uploader.urls')),
 ]
+
+if 'drf_yasg' in settings.INSTALLED_APPS:
+    from drf_yasg.views import get_schema_view
+    from rest_framework import permissions
+
+    from users.schema import api_info
+
+    # The UIs only render the page and load the prebuilt schema-json (see SPEC_URL)
+    schema_view = get_schema_view(
+        api_info(),
+        public=True,
+        permission_classes=[permissions.AllowAny]
+    )
+
+    urlpatterns += [
+        re_path(r'^swagger/$',
+                schema_view.with_ui('swagger', cache_timeout=0),
+                name='schema-swagger-ui'),
+        re_path(r'^redoc/$',
+                schema_view.with_ui('redoc', cache_timeout=0),
+                name='schema-redoc'),
+    ]
+
+if 'ckeditor_uploader' in settings.INSTALLED_APPS:
+    urlpatterns.append(re_path(r'^ckeditor/', include('ckeditor_uploader.urls')))
+
+if 'debug_toolbar' in settings.INSTALLED_APPS:
+    urlpatterns.append(path('__debug__/', include('debug_toolbar.urls')))
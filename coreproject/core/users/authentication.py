@@ -0,0 +1,229 @@
+"""
+OAuth2 authentication with a cache of validated access tokens.
+
+A hit skips oauthlib's token validation and its ``AccessToken``/``User``
+query. Entries live in a per-process LRU for at most ``TOKEN_CACHE_TTL``
+seconds (never past the token's own expiry) and, when ``TOKEN_CACHE_ALIAS``
+names a Django cache, in that shared tier as well. Revoking, refreshing or
+editing a token and saving its user evict it (see ``users.signals``); other
+processes' local entries age out within the TTL.
+
+``TokenAuthMiddleware`` authenticates WebSocket connections with the same
+bearer tokens, read from the ``Authorization`` header or the
+``access_token`` query parameter (browsers cannot set headers on a socket).
+"""
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.utils import timezone
+from oauth2_provider.contrib.rest_framework import OAuth2Authentication
+
+
+def token_key(token):
+    return 'auth:token:' + hashlib.sha256(token.encode()).hexdigest()
+
+
+def user_tokens_key(user_id):
+    return f'auth:user-tokens:{user_id}'
+
+
+def detached(access_token):
+    """Shallow copies of the token and its user, so callers can't mutate cached objects."""
+    access_token = copy.copy(access_token)
+    access_token.user = copy.copy(access_token.user)
+    return access_token
+
+
+class TokenCache:
+
+    def __init__(self):
+        self._local = OrderedDict()
+        self._user_keys = {}
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'TOKEN_CACHE_TTL', 30)
+
+    @property
+    def max_size(self):
+        return getattr(settings, 'TOKEN_CACHE_SIZE', 10_000)
+
+    @property
+    def shared(self):
+        alias = getattr(settings, 'TOKEN_CACHE_ALIAS', None)
+        return caches[alias] if alias else None
+
+    def get(self, key):
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is not None:
+                expires_at, access_token = entry
+                if expires_at > time.monotonic():
+                    self._local.move_to_end(key)
+                    return access_token
+                del self._local[key]
+
+        shared = self.shared
+        if shared is not None:
+            access_token = shared.get(key)
+            if access_token is not None and not access_token.is_expired():
+                self._set_local(key, access_token, self._ttl_for(access_token))
+                return access_token
+        return None
+
+    def set(self, key, access_token):
+        ttl = self._ttl_for(access_token)
+        if ttl <= 0:
+            return
+        self._set_local(key, access_token, ttl)
+
+        shared = self.shared
+        if shared is not None:
+            shared.set(key, access_token, ttl)
+            user_keys = user_tokens_key(access_token.user_id)
+            shared.set(user_keys, list({*(shared.get(user_keys) or []), key}), self.ttl)
+
+    def evict(self, key):
+        with self._lock:
+            self._local.pop(key, None)
+        shared = self.shared
+        if shared is not None:
+            shared.delete(key)
+
+    def evict_user(self, user_id):
+        with self._lock:
+            for key in self._user_keys.pop(user_id, ()):
+                self._local.pop(key, None)
+        shared = self.shared
+        if shared is not None:
+            keys = shared.get(user_tokens_key(user_id)) or []
+            shared.delete_many([*keys, user_tokens_key(user_id)])
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+            self._user_keys.clear()
+
+    def _ttl_for(self, access_token):
+        remaining = (access_token.expires - timezone.now()).total_seconds()
+        return min(self.ttl, int(remaining))
+
+    def _set_local(self, key, access_token, ttl):
+        with self._lock:
+            self._local[key] = (time.monotonic() + ttl, access_token)
+            self._local.move_to_end(key)
+            self._user_keys.setdefault(access_token.user_id, set()).add(key)
+            while len(self._local) > self.max_size:
+                evicted, (_, evicted_token) = self._local.popitem(last=False)
+                self._user_keys.get(evicted_token.user_id, set()).discard(evicted)
+
+    def record(self, hit, seconds):
+        with self._lock:
+            if hit:
+                self._hits += 1
+                self._hit_seconds += seconds
+            else:
+                self._misses += 1
+                self._miss_seconds += seconds
+
+    def reset_stats(self):
+        self._hits = self._misses = 0
+        self._hit_seconds = self._miss_seconds = 0.0
+
+    def stats(self):
+        """Hit ratio and the authentication time saved by hits in this process."""
+        with self._lock:
+            hits, misses = self._hits, self._misses
+            hit_seconds, miss_seconds = self._hit_seconds, self._miss_seconds
+
+        avg_hit = hit_seconds / hits if hits else 0.0
+        avg_miss = miss_seconds / misses if misses else 0.0
+        saved = hits * max(avg_miss - avg_hit, 0.0) if misses else 0.0
+        requests = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': hits / requests if requests else 0.0,
+            'avg_hit_ms': avg_hit * 1000,
+            'avg_miss_ms': avg_miss * 1000,
+            'saved_seconds': saved,
+            'saved_ms_per_request': saved * 1000 / requests if requests else 0.0,
+        }
+
+
+token_cache = TokenCache()
+
+
+class CachedOAuth2Authentication(OAuth2Authentication):
+    """``OAuth2Authentication`` backed by ``token_cache`` for bearer tokens in the header."""
+
+    def authenticate(self, request):
+        header = request.META.get('HTTP_AUTHORIZATION', '')
+        scheme, _, token = header.partition(' ')
+        if scheme.lower() != 'bearer' or not token:
+            return super().authenticate(request)
+
+        key = token_key(token.strip())
+        start = time.perf_counter()
+        access_token = token_cache.get(key)
+        if access_token is not None and not access_token.is_expired():
+            access_token = detached(access_token)
+            token_cache.record(True, time.perf_counter() - start)
+            return access_token.user, access_token
+
+        result = super().authenticate(request)
+        if result is not None:
+            token_cache.set(key, detached(result[1]))
+            token_cache.record(False, time.perf_counter() - start)
+        return result
+
+
+def websocket_token(scope):
+    """The bearer token a WebSocket handshake carries, or ``None``."""
+    for name, value in scope.get('headers', ()):
+        if name == b'authorization':
+            scheme, _, token = value.decode('latin1').partition(' ')
+            if scheme.lower() == 'bearer' and token.strip():
+                return token.strip()
+    tokens = parse_qs(scope.get('query_string', b'').decode()).get('access_token')
+    return tokens[0] if tokens else None
+
+
+def authenticate_token(token):
+    """The active user ``token`` belongs to, through ``token_cache``; ``None`` when it is not valid."""
+    from oauth2_provider.models import AccessToken
+
+    key = token_key(token)
+    start = time.perf_counter()
+    access_token = token_cache.get(key)
+    hit = access_token is not None and not access_token.is_expired()
+    if not hit:
+        access_token = AccessToken.objects.select_related('user').filter(token=token).first()
+        if access_token is None or access_token.is_expired() or access_token.user is None:
+            return None
+        token_cache.set(key, detached(access_token))
+    token_cache.record(hit, time.perf_counter() - start)
+    user = detached(access_token).user
+    return user if user.is_active else None
+
+
+class TokenAuthMiddleware(BaseMiddleware):
+    """Sets ``scope['user']`` from an OAuth2 bearer token; scopes without one are left as they are."""
+
+    async def __call__(self, scope, receive, send):
+        token = websocket_token(scope)
+        if token is not None:
+            user = await database_sync_to_async(authenticate_token)(token)
+            scope = dict(scope, user=user or AnonymousUser())
+        return await super().__call__(scope, receive, send)
@@ -0,0 +1,97 @@
+"""
+Benchmarks for the users app, run with ``python manage.py bench <name>``.
+
+Every benchmark module exposes ``run(options)`` and returns a JSON-serializable
+dict. They run against a throwaway test database, never the configured one.
+"""
+import importlib
+import random
+import time
+from collections import Counter
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+BENCHMARKS = {
+    'accepts': 'users.benchmarks.accepts',
+    'consumers': 'users.benchmarks.consumers',
+    'directory': 'users.benchmarks.directory',
+    'encoding': 'users.benchmarks.encoding',
+    'endpoints': 'users.benchmarks.endpoints',
+    'friendship': 'users.benchmarks.friendship',
+    'online': 'users.benchmarks.online',
+    'passwords': 'users.benchmarks.passwords',
+    'presence': 'users.benchmarks.presence',
+    'suggestions': 'users.benchmarks.suggestions',
+    'startup': 'users.benchmarks.startup',
+}
+
+
+def load(name):
+    return importlib.import_module(BENCHMARKS[name])
+
+
+def seed_users(count, prefix='bench', batch_size=5000):
+    from users.models import User
+
+    User.objects.bulk_create(
+        (User(username=f'{prefix}-{i}', first_name=f'First{i}', last_name=f'Last{i}', avatar='')
+         for i in range(count)),
+        batch_size=batch_size,
+    )
+    return list(User.objects.filter(username__startswith=f'{prefix}-').order_by('id').values_list('id', flat=True))
+
+
+def random_pairs(user_ids, count, seed):
+    """``count`` distinct unordered pairs of ``user_ids`` as ``(low, high)`` tuples."""
+    rng = random.Random(seed)
+    count = min(count, len(user_ids) * (len(user_ids) - 1) // 2)
+    pairs = set()
+    while len(pairs) < count:
+        a, b = rng.sample(user_ids, 2)
+        pairs.add((min(a, b), max(a, b)))
+    return sorted(pairs)
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def summarize(durations, elapsed, queries=None):
+    """Throughput and latency percentiles for a list of per-call durations in seconds."""
+    calls = len(durations)
+    summary = {
+        'calls': calls,
+        'seconds': round(elapsed, 4),
+        'per_second': round(calls / elapsed, 1) if elapsed else None,
+        'p50_ms': round(percentile(durations, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(durations, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(durations, 0.99) * 1000, 3),
+    }
+    if queries is not None:
+        summary['queries_per_call'] = round(queries / calls, 3)
+    return summary
+
+
+def measure(func, iterations):
+    """Call ``func(i)`` for ``i`` in ``range(iterations)``; report throughput, latency and queries per call.
+
+    When ``func`` returns responses their status codes are tallied as well.
+    """
+    durations = []
+    statuses = Counter()
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        for i in range(iterations):
+            call_start = time.perf_counter()
+            result = func(i)
+            durations.append(time.perf_counter() - call_start)
+            if hasattr(result, 'status_code'):
+                statuses[str(result.status_code)] += 1
+        elapsed = time.perf_counter() - start
+
+    summary = summarize(durations, elapsed, len(queries.captured_queries))
+    if statuses:
+        summary['statuses'] = dict(statuses)
+    return summary
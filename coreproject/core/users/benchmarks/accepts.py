@@ -0,0 +1,89 @@
+"""
+Throughput and correctness of concurrent friend-request accepts.
+
+Fires ``--iterations`` accepts at the ``accept`` endpoint from
+``--concurrency`` threads, each with its own database connection, twice:
+once over distinct pending requests and once with every request accepted by
+``--concurrency`` clients at the same moment. The second run must produce exactly
+one 200 per request, one mirrored ``Friendship`` pair and one notification;
+``correct`` reports whether it did. Needs a database that takes concurrent
+writers, so it is skipped on the in-memory SQLite test database.
+"""
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection
+from django.db.models import Count
+from rest_framework.test import APIClient
+
+from users.models import FriendRequest, Friendship, Notification, User
+
+from . import seed_users, summarize
+
+
+def seed_requests(sender_ids, receiver):
+    FriendRequest.objects.bulk_create(FriendRequest(sender_id=sender_id, receiver=receiver)
+                                      for sender_id in sender_ids)
+    return list(FriendRequest.objects.filter(receiver=receiver, sender_id__in=sender_ids)
+                .order_by('id').values_list('id', flat=True))
+
+
+def accept_in_parallel(receiver, request_ids, concurrency, copies=1):
+    """POST ``accept`` for every id ``copies`` times at once; returns a latency summary with status counts."""
+    local = threading.local()
+    durations, statuses = [], Counter()
+
+    def accept(request_id):
+        if not hasattr(local, 'client'):
+            local.client = APIClient()
+            local.client.force_authenticate(receiver)
+        start = time.perf_counter()
+        try:
+            response = local.client.post(f'/api/v1/friend-request/{request_id}/accept/')
+        finally:
+            connection.close()
+        return time.perf_counter() - start, response.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        for duration, status_code in executor.map(accept, [request_id for request_id in request_ids
+                                                            for _ in range(copies)]):
+            durations.append(duration)
+            statuses[str(status_code)] += 1
+    summary = summarize(durations, time.perf_counter() - start)
+    summary['statuses'] = dict(statuses)
+    return summary
+
+
+def run(options):
+    if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+        return {'skipped': 'needs a database that takes writes from several connections'}
+
+    iterations = options['iterations']
+    concurrency = options['concurrency']
+    contested = max(iterations // concurrency, 1)
+    user_ids = seed_users(iterations + contested + 2, prefix='accept-bench')
+    receiver, contested_receiver = User.objects.filter(id__in=user_ids[:2]).order_by('id')
+
+    parallel_ids = seed_requests(user_ids[2:iterations + 2], receiver)
+    contested_ids = seed_requests(user_ids[iterations + 2:], contested_receiver)
+
+    results = {
+        'concurrency': concurrency,
+        'parallel': accept_in_parallel(receiver, parallel_ids, concurrency),
+        'contested': accept_in_parallel(contested_receiver, contested_ids, concurrency, copies=concurrency),
+    }
+
+    duplicates = Friendship.objects.values('user1', 'user2').annotate(rows=Count('id')).filter(rows__gt=1).count()
+    accepted = FriendRequest.objects.filter(status=FriendRequest.Status.ACCEPTED).count()
+    results['correct'] = {
+        'one_winner_per_request': results['contested']['statuses'].get('200') == len(contested_ids),
+        'no_pending_left': not FriendRequest.objects.filter(status=FriendRequest.Status.PENDING).exists(),
+        'duplicate_friendships': duplicates,
+        'friendship_rows_per_accept': Friendship.objects.count() / accepted if accepted else None,
+        'notifications_per_accept': Notification.objects.filter(
+            kind=Notification.Kind.FRIEND_REQUEST_ACCEPTED).count() / accepted if accepted else None,
+    }
+    return results
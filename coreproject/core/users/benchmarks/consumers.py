@@ -0,0 +1,84 @@
+"""
+Load test for ``UserActivityConsumer``; run it with ``--local`` so the
+in-memory channel layer is used.
+
+Opens one socket per synthetic user (``--users``, default 2000) over a random
+friend graph (``--edges``) plus a hub user befriended by everyone else, then
+measures connection rate, RSS growth per connection and the latency of a hub
+status change reaching every friend's socket. Note that the in-memory layer
+scans every channel on each receive, so at this scale its own bookkeeping
+dominates the fan-out figures; compare runs against each other, not Redis.
+"""
+import asyncio
+import time
+import resource
+
+from asgiref.sync import async_to_sync
+from channels.testing import WebsocketCommunicator
+
+from users.consumers import UserActivityConsumer
+from users.graph import friend_graph
+from users.models import Friendship, User
+
+from . import random_pairs, seed_users, summarize
+
+
+def drain(communicators):
+    for communicator in communicators:
+        while not communicator.output_queue.empty():
+            communicator.output_queue.get_nowait()
+
+
+async def load_test(users, hub, rounds):
+    application = UserActivityConsumer.as_asgi()
+    communicators = {}
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    for user in [hub] + users:
+        communicator = WebsocketCommunicator(application, '/ws/activity/')
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        assert connected
+        communicators[user.id] = communicator
+    connect_seconds = time.perf_counter() - start
+    rss_growth_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before
+
+    friends = [communicators[user.id] for user in users]
+    drain(communicators.values())
+
+    latencies = []
+    for i in range(rounds):
+        start = time.perf_counter()
+        await communicators[hub.id].send_json_to({'status': 'away' if i % 2 == 0 else 'active'})
+        await asyncio.gather(*(friend.receive_json_from(timeout=30) for friend in friends))
+        latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(communicator.disconnect() for communicator in communicators.values()))
+
+    return {
+        'connections': len(communicators),
+        'connections_per_second': round(len(communicators) / connect_seconds, 1),
+        'rss_per_connection_kb': round(rss_growth_kb / len(communicators), 2),
+        'fan_out': len(friends),
+        'fan_out_latency': summarize(latencies, sum(latencies)),
+    }
+
+
+def run(options):
+    count = options['users'] or 2000
+    user_ids = seed_users(count + 1, prefix='socket-bench')
+    hub_id, user_ids = user_ids[0], user_ids[1:]
+
+    pairs = [(hub_id, user_id) for user_id in user_ids]
+    pairs += random_pairs(user_ids, options['edges'] or count * 5, options['seed'])
+    for a, b in pairs:
+        Friendship.objects.befriend(a, b)
+
+    # Warm the adjacency cache so connects measure the consumer, not the first DB load
+    users = list(User.objects.filter(id__in=user_ids).order_by('id'))
+    hub = User.objects.get(pk=hub_id)
+    for user in [hub] + users:
+        friend_graph.get_friend_ids(user.id)
+
+    return async_to_sync(load_test)(users, hub, rounds=min(options['iterations'], 50))
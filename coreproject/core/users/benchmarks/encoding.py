@@ -0,0 +1,78 @@
+"""
+Encode cost per published event as a function of fan-out.
+
+Before, each receiving socket ran ``json.dumps`` on the event; now the
+publisher encodes it once (``users.encoding.encoded_event``) and the sockets
+forward the result. Reports microseconds per event for per-socket stdlib
+encoding against a single stdlib, orjson and msgpack encoding, plus the
+size of each framing. ``encoded_event`` is timed with no msgpack socket open
+and, as ``encoded_event_with_msgpack``, with one; ``repack_msgpack_us`` is
+what a msgpack socket's consumer adds for an event published before its
+publisher saw it. ``--iterations`` events are timed per fan-out size.
+"""
+import json
+import time
+
+from users import encoding
+
+FAN_OUTS = (1, 10, 100, 1000)
+
+MESSAGE = {
+    'id': 123456,
+    'kind': 'FRIEND_REQUEST_ACCEPTED',
+    'payload': {
+        'friend_request_ids': [98765, 98766],
+        'sender_id': 4321,
+        'message': 'Your friend request to nguyen.van.an has been accepted',
+    },
+}
+
+
+def per_event_us(encode, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        encode(MESSAGE)
+    return round((time.perf_counter() - start) / iterations * 1e6, 3)
+
+
+def encoded_event_us(iterations, msgpack_socket):
+    """``encoded_event`` per event, with or without a msgpack socket open."""
+    encoding.binary_subscribers.forget()
+    if msgpack_socket:
+        encoding.binary_subscribers.opened()
+    try:
+        return per_event_us(lambda message: encoding.encoded_event('send_notification', message), iterations)
+    finally:
+        if msgpack_socket:
+            encoding.binary_subscribers.closed()
+        encoding.binary_subscribers.forget()
+
+
+def run(options):
+    iterations = options['iterations']
+    once = {'stdlib': lambda message: json.dumps(message, separators=(',', ':'))}
+    if encoding.orjson is not None:
+        once['orjson'] = lambda message: encoding.orjson.dumps(message)
+    if encoding.msgpack is not None:
+        once['msgpack'] = encoding.msgpack.packb
+
+    results = {
+        'bytes': {
+            'json': len(json.dumps(MESSAGE, separators=(',', ':')).encode()),
+            **({'msgpack': len(encoding.msgpack.packb(MESSAGE))} if encoding.msgpack is not None else {}),
+        },
+    }
+    if encoding.msgpack is not None:
+        text = encoding.dumps(MESSAGE)
+        results['repack_msgpack_us'] = per_event_us(lambda message: encoding.msgpack.packb(encoding.loads(text)),
+                                                    iterations)
+    for fan_out in FAN_OUTS:
+        row = results[f'fan_out_{fan_out}'] = {
+            'per_socket_stdlib_us': per_event_us(lambda message: [json.dumps(message) for _ in range(fan_out)],
+                                                 max(iterations // fan_out, 10)),
+            **{f'once_{name}_us': per_event_us(encode, iterations) for name, encode in once.items()},
+            'once_encoded_event_us': encoded_event_us(iterations, msgpack_socket=False),
+        }
+        if encoding.msgpack is not None:
+            row['once_encoded_event_with_msgpack_us'] = encoded_event_us(iterations, msgpack_socket=True)
+    return results
@@ -0,0 +1,214 @@
+"""
+End-to-end latency of the users API and both WebSocket consumers.
+
+Seeds ``--users`` (default 1000) users with ``--edges`` random friendships,
+a hub befriended by everyone and an inbox holding a pending request from
+everyone, then drives each endpoint through ``APIClient`` with bearer tokens
+so authentication, permissions, serialization and response caching are all
+included. Run it with ``--local`` for the in-memory channel layer, eager Celery
+and ``LocalMediaStorage`` in place of Cloudinary; set ``DATABASE_ENGINE=sqlite``
+or point the MySQL settings at a local server to pick the database.
+
+Registration hashes a password per call, so it is capped at 20 iterations;
+the socket rounds are capped at 200.
+"""
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.utils import timezone
+from oauth2_provider.models import AccessToken, Application
+from rest_framework.test import APIClient
+
+from users.authentication import TokenAuthMiddleware
+from users.consumers import UserActivityConsumer
+from users.encoding import encoded_event
+from users.models import AlumniProfile, FriendRequest, Friendship, User
+from users.routing import websocket_urlpatterns
+
+from . import measure, random_pairs, seed_users, summarize
+
+
+def seed_friendships(pairs, batch_size=10_000):
+    rows = [Friendship(user1_id=a, user2_id=b) for pair in pairs for a, b in (pair, pair[::-1])]
+    Friendship.objects.bulk_create(rows, batch_size=batch_size, ignore_conflicts=True)
+
+
+def seed_profiles(user_ids, batch_size=10_000):
+    AlumniProfile.objects.bulk_create(
+        (AlumniProfile(user_id=user_id, graduation_year='2020', major='Computer Science',
+                       current_job_title='Engineer', current_company='Example')
+         for user_id in user_ids),
+        batch_size=batch_size,
+    )
+
+
+def seed_tokens(user_ids):
+    application = Application.objects.create(
+        name='bench', client_type=Application.CLIENT_CONFIDENTIAL,
+        authorization_grant_type=Application.GRANT_PASSWORD,
+    )
+    expires = timezone.now() + timezone.timedelta(days=1)
+    AccessToken.objects.bulk_create(
+        AccessToken(user_id=user_id, application=application, token=f'bench-token-{user_id}',
+                    scope='read write', expires=expires)
+        for user_id in user_ids
+    )
+
+
+class Client(APIClient):
+
+    def as_user(self, user_id):
+        if user_id is None:
+            self.credentials()
+        else:
+            self.credentials(HTTP_AUTHORIZATION=f'Bearer bench-token-{user_id}')
+        return self
+
+
+def register(client, i):
+    avatar = SimpleUploadedFile('avatar.png', f'avatar-{i}'.encode(), content_type='image/png')
+    return client.post('/api/v1/users/register/', {
+        'username': f'api-bench-register-{i}', 'password': 'secret', 'email': f'register-{i}@example.com',
+        'first_name': 'Bench', 'last_name': str(i), 'phone_number': '0123456789', 'avatar': avatar,
+    }, format='multipart')
+
+
+async def notification_round_trips(user_ids):
+    application = TokenAuthMiddleware(URLRouter(websocket_urlpatterns))
+    channel_layer = get_channel_layer()
+    connects, deliveries = [], []
+
+    for user_id in user_ids:
+        communicator = WebsocketCommunicator(application, f'/ws/notifications/{user_id}/',
+                                             headers=[(b'authorization', f'Bearer bench-token-{user_id}'.encode())])
+        start = time.perf_counter()
+        connected, _ = await communicator.connect()
+        connects.append(time.perf_counter() - start)
+        assert connected
+
+        start = time.perf_counter()
+        await channel_layer.group_send(f'user_{user_id}', encoded_event('send_notification', {
+            'payload': {'message': 'bench'},
+        }))
+        await communicator.receive_from(timeout=5)
+        deliveries.append(time.perf_counter() - start)
+        await communicator.disconnect()
+
+    return {
+        'connect': summarize(connects, sum(connects)),
+        'delivery': summarize(deliveries, sum(deliveries)),
+    }
+
+
+async def activity_round_trips(hub, friends, rounds):
+    application = UserActivityConsumer.as_asgi()
+    connects = []
+    communicators = []
+    for user in [hub] + friends:
+        communicator = WebsocketCommunicator(application, '/ws/activity/')
+        communicator.scope['user'] = user
+        start = time.perf_counter()
+        connected, _ = await communicator.connect()
+        connects.append(time.perf_counter() - start)
+        assert connected
+        communicators.append(communicator)
+
+    hub_socket, friend_sockets = communicators[0], communicators[1:]
+    for communicator in communicators:
+        while not communicator.output_queue.empty():
+            communicator.output_queue.get_nowait()
+
+    fan_out = []
+    for i in range(rounds):
+        start = time.perf_counter()
+        await hub_socket.send_json_to({'status': 'away' if i % 2 == 0 else 'active'})
+        for communicator in friend_sockets:
+            await communicator.receive_json_from(timeout=5)
+        fan_out.append(time.perf_counter() - start)
+
+    for communicator in communicators:
+        await communicator.disconnect()
+
+    return {
+        'fan_out': len(friend_sockets),
+        'connect': summarize(connects, sum(connects)),
+        'status_change': summarize(fan_out, sum(fan_out)),
+    }
+
+
+def run(options):
+    count = max(options['users'] or 1000, 3)
+    iterations = options['iterations']
+    seed = options['seed']
+
+    user_ids = seed_users(count, prefix='api-bench')
+    hub_id, inbox_id, others = user_ids[0], user_ids[1], user_ids[2:]
+    strangers = seed_users(iterations, prefix='api-bench-stranger')
+
+    start = time.perf_counter()
+    seed_friendships([(hub_id, user_id) for user_id in user_ids[1:]])
+    seed_friendships(random_pairs(others, options['edges'] or count * 10, seed))
+    FriendRequest.objects.bulk_create(
+        (FriendRequest(sender_id=user_id, receiver_id=inbox_id) for user_id in others), batch_size=10_000
+    )
+    seed_profiles(user_ids)
+    seed_tokens(user_ids)
+    seed_seconds = time.perf_counter() - start
+
+    request_ids = list(FriendRequest.objects.filter(receiver_id=inbox_id).order_by('id').values_list('id', flat=True))
+    half = len(request_ids) // 2
+    to_accept, to_reject = request_ids[:half], request_ids[half:]
+    client = Client()
+
+    results = {
+        'graph': {
+            'users': count,
+            'friendships': Friendship.objects.count() // 2,
+            'pending_requests': len(request_ids),
+            'seed_seconds': round(seed_seconds, 2),
+        },
+        'registration': measure(lambda i: register(client.as_user(None), i), min(iterations, 20)),
+        'current_user': measure(
+            lambda i: client.as_user(user_ids[i % count]).get('/api/v1/users/current-user/'), iterations),
+        'add_friend': measure(
+            lambda i: client.as_user(user_ids[i % count]).post('/api/v1/users/friends/', {'receiver': strangers[i]}),
+            iterations),
+        'received_requests': {
+            'page': measure(
+                lambda i: client.as_user(inbox_id).get(
+                    '/api/v1/friend-request/received-requests/', {'page': i % 10 + 1}), iterations),
+            'cursor': measure(
+                lambda i: client.as_user(inbox_id).get(
+                    '/api/v1/friend-request/received-requests/', {'pagination': 'cursor'}), iterations),
+        },
+        'list_friends': {
+            'page': measure(
+                lambda i: client.as_user(hub_id).get('/api/v1/friendship/friends/', {'page': i % 10 + 1}),
+                iterations),
+            'cursor': measure(
+                lambda i: client.as_user(hub_id).get('/api/v1/friendship/friends/', {'pagination': 'cursor'}),
+                iterations),
+        },
+        'accept': measure(
+            lambda i: client.as_user(inbox_id).post(f'/api/v1/friend-request/{to_accept[i]}/accept/'),
+            min(iterations, len(to_accept))),
+        'reject': measure(
+            lambda i: client.as_user(inbox_id).post(f'/api/v1/friend-request/{to_reject[i]}/reject/'),
+            min(iterations, len(to_reject))),
+    }
+
+    rounds = min(iterations, 200)
+    hub = User.objects.get(pk=hub_id)
+    friends = list(User.objects.filter(id__in=others[:rounds]).order_by('id'))
+    results['notification_socket'] = async_to_sync(notification_round_trips)(user_ids[:rounds])
+    results['activity_socket'] = async_to_sync(activity_round_trips)(hub, friends, rounds)
+
+    friend_ids = user_ids[1:]
+    results['unfriend'] = measure(
+        lambda i: client.as_user(hub_id).post('/api/v1/friendship/unfriend/', {'user_id': friend_ids[i]}),
+        min(iterations, len(friend_ids)))
+    return results
@@ -0,0 +1,92 @@
+"""
+Friend listing and membership checks before and after mirroring Friendship rows.
+
+The graph is first stored the old way (one row per pair, arbitrary order) and
+queried with the old OR-ed lookups, then migrated with the same function the
+0004 migration uses and queried through ``FriendshipManager``. Try
+``--users 200000 --edges 2000000`` for a production-sized graph.
+"""
+import importlib
+import random
+import time
+
+from django.db import connection
+from django.db.models import Q
+
+from users.models import Friendship, User
+
+from . import measure, random_pairs, seed_users
+
+mirror_migration = importlib.import_module('users.migrations.0004_friendship_mirrored_edges')
+
+
+def legacy_friend_ids(user_id):
+    return list(
+        User.objects.filter(
+            id__in=Friendship.objects.filter(user1_id=user_id).values('user2')
+        ).values_list('id', flat=True).union(
+            User.objects.filter(
+                id__in=Friendship.objects.filter(user2_id=user_id).values('user1')
+            ).values_list('id', flat=True)
+        )
+    )
+
+
+def legacy_are_friends(user_id, other_id):
+    return Friendship.objects.filter(
+        Q(user1_id=user_id, user2_id=other_id) | Q(user1_id=other_id, user2_id=user_id)
+    ).exists()
+
+
+def run(options):
+    users = options['users'] or 10_000
+    edges = options['edges'] or 100_000
+    iterations = options['iterations']
+    rng = random.Random(options['seed'])
+
+    user_ids = seed_users(users, prefix='graph-bench')
+    pairs = random_pairs(user_ids, edges, options['seed'])
+
+    start = time.perf_counter()
+    for offset in range(0, len(pairs), 10_000):
+        Friendship.objects.bulk_create(
+            Friendship(user1_id=a, user2_id=b) if rng.random() < 0.5 else Friendship(user1_id=b, user2_id=a)
+            for a, b in pairs[offset:offset + 10_000]
+        )
+    seed_seconds = time.perf_counter() - start
+
+    sample_users = [rng.choice(user_ids) for _ in range(iterations)]
+    sample_pairs = [rng.choice(pairs) for _ in range(iterations)]
+
+    results = {
+        'graph': {'users': users, 'edges': len(pairs), 'seed_seconds': round(seed_seconds, 2)},
+        'legacy': {
+            'list': measure(lambda i: legacy_friend_ids(sample_users[i]), iterations),
+            'membership': measure(lambda i: legacy_are_friends(*sample_pairs[i]), iterations),
+            'plans': {
+                'list': User.objects.filter(
+                    id__in=Friendship.objects.filter(user1_id=user_ids[0]).values('user2')
+                ).union(User.objects.filter(
+                    id__in=Friendship.objects.filter(user2_id=user_ids[0]).values('user1')
+                )).explain(),
+                'membership': Friendship.objects.filter(
+                    Q(user1_id=user_ids[0], user2_id=user_ids[1]) | Q(user1_id=user_ids[1], user2_id=user_ids[0])
+                ).explain(),
+            },
+        },
+    }
+
+    start = time.perf_counter()
+    mirror_migration.mirror(Friendship, connection)
+    results['graph']['migration_seconds'] = round(time.perf_counter() - start, 2)
+    results['graph']['rows_after_migration'] = Friendship.objects.count()
+
+    results['mirrored'] = {
+        'list': measure(lambda i: list(Friendship.objects.friend_ids(sample_users[i])), iterations),
+        'membership': measure(lambda i: Friendship.objects.are_friends(*sample_pairs[i]), iterations),
+        'plans': {
+            'list': Friendship.objects.friend_ids(user_ids[0]).explain(),
+            'membership': Friendship.objects.filter(user1_id=user_ids[0], user2_id=user_ids[1]).explain(),
+        },
+    }
+    return results
@@ -0,0 +1,79 @@
+"""
+Online friends of a user with many friends among many online users.
+
+Seeds a hub user with ``--edges`` friends (default 5000), a tenth of them
+online, inside ``--users`` online users overall (default 100000), each with a
+live heartbeat and an active ``UserActivity`` row. Times the store
+intersection behind ``presence_tracker.online_friends``, the
+``friendship/online`` endpoint that hydrates its hits, a user with a handful
+of friends for comparison, and the two approaches it replaces: reading the
+whole online set into the process, and joining ``Friendship`` with
+``UserActivity`` in the database.
+"""
+from rest_framework.test import APIClient
+
+from users.graph import friend_graph
+from users.models import Friendship, User, UserActivity
+from users.presence import ONLINE_KEY, presence_tracker, status_key
+from users.store import get_store
+
+from . import measure, seed_users
+
+BATCH_SIZE = 5000
+
+
+def go_online(user_ids):
+    store = get_store()
+    for start in range(0, len(user_ids), BATCH_SIZE):
+        batch = user_ids[start:start + BATCH_SIZE]
+        pipe = store.pipeline()
+        pipe.sadd(ONLINE_KEY, *batch)
+        for user_id in batch:
+            pipe.set(status_key(user_id), 'active', ex=presence_tracker.ttl)
+        pipe.execute()
+    UserActivity.objects.bulk_create((UserActivity(user_id=user_id, is_active=True) for user_id in user_ids),
+                                     batch_size=BATCH_SIZE)
+
+
+def run(options):
+    iterations = options['iterations']
+    friends = options['edges'] or 5000
+    online = max(options['users'] or 100_000, friends // 10)
+    few = 10
+
+    # hub, a small user, the hub's friends, then everyone else who is online
+    user_ids = seed_users(2 + friends + online - friends // 10, prefix='online-bench')
+    hub, small = user_ids[:2]
+    friend_ids = user_ids[2:friends + 2]
+    Friendship.objects.befriend_many([(hub, friend_id) for friend_id in friend_ids] +
+                                     [(small, friend_id) for friend_id in friend_ids[:few]])
+    online_ids = friend_ids[::10] + user_ids[friends + 2:]
+    go_online(online_ids)
+
+    friend_graph.load(hub)
+    friend_graph.load(small)
+    client = APIClient()
+    client.force_authenticate(User.objects.get(id=hub))
+
+    results = {
+        'friends': friends,
+        'online_users': get_store().scard(ONLINE_KEY),
+        'online_friends': len(presence_tracker.online_friends(hub)),
+        'intersect': measure(lambda i: presence_tracker.online_friends(hub), iterations),
+        'intersect_few_friends': measure(lambda i: presence_tracker.online_friends(small), iterations),
+        'endpoint': measure(lambda i: client.get('/api/v1/friendship/online/'), iterations),
+    }
+
+    # What it replaces: scanning every online user, or joining in the database
+    def scan(i):
+        return presence_tracker.online_ids() & friend_graph.get_friend_ids(hub)
+
+    def join(i):
+        return list(User.objects.filter(id__in=Friendship.objects.friend_ids(hub), useractivity__is_active=True)
+                    .values_list('id', 'first_name', 'last_name', 'avatar'))
+
+    legacy_iterations = max(iterations // 10, 1)
+    results['scan_online_set'] = measure(scan, legacy_iterations)
+    results['database_join'] = measure(join, legacy_iterations)
+    results['database_join']['online_friends'] = len(join(0))
+    return results
@@ -0,0 +1,45 @@
+"""
+Profile-update latency through ``UserSerializer`` (what update-alumni and
+update-lecturer do) with the old ``User.save``, which re-hashed the stored
+password on every call, and the current one.
+"""
+from unittest import mock
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import AbstractUser
+
+from users.models import User
+from users.serializers import UserSerializer
+
+from . import measure
+
+
+def legacy_save(self, *args, **kwargs):
+    if not self.verified and self.role == User.Roles.LECTURER:
+        self.password = make_password("123456")
+    self.password = make_password(self.password)
+    AbstractUser.save(self, *args, **kwargs)
+
+
+def update_profile(user, i):
+    serializer = UserSerializer(user, data={'first_name': f'Name{i}'}, partial=True)
+    serializer.is_valid(raise_exception=True)
+    serializer.save()
+
+
+def run(options):
+    iterations = min(options['iterations'], 50)
+    user = User.objects.create_user(username='password-bench', password='secret', avatar='')
+
+    with mock.patch.object(User, 'save', legacy_save):
+        legacy = measure(lambda i: update_profile(user, i), iterations)
+
+    user = User.objects.create_user(username='password-bench-2', password='secret', avatar='')
+    current = measure(lambda i: update_profile(user, i), iterations)
+    user.refresh_from_db()
+
+    return {
+        'legacy': legacy,
+        'current': current,
+        'password_still_valid': user.check_password('secret'),
+    }
@@ -0,0 +1,103 @@
+"""
+Compare the old per-request ``update_or_create`` presence write with the
+write-behind buffer and TTL heartbeats. The buffered figures include the
+amortized cost of the final flush to ``UserActivity``. ``heartbeats`` sends
+``--iterations`` WebSocket-style heartbeats round-robin over the users;
+``broadcasts`` (there and under ``buffered``) reports how many status updates
+were enqueued, requests skipped inside the presence window included, and how
+many were coalesced away instead of being published. ``sweep`` times marking every benchmark user offline once
+their heartbeats have expired.
+"""
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.db import connection, reset_queries
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from users.dispatch import dispatcher
+from users.middleware import UserActivityMiddleware
+from users.models import User, UserActivity
+from users.presence import presence_buffer, presence_tracker, status_key
+from users.store import get_store
+
+from . import measure
+
+
+class LegacyUserActivityMiddleware(UserActivityMiddleware):
+    def process_response(self, request, response):
+        if request.user.is_authenticated:
+            UserActivity.objects.update_or_create(
+                user=request.user,
+                defaults={
+                    'last_activity': timezone.now(),
+                    'is_active': True
+                }
+            )
+        return response
+
+
+def run(options):
+    iterations = options['iterations']
+    users = User.objects.bulk_create(
+        User(username=f'presence-bench-{i}', avatar='') for i in range(options['users'] or 100)
+    )
+    factory = RequestFactory()
+
+    def make_request(i):
+        request = factory.get('/api/v1/users/current-user/')
+        request.user = users[i % len(users)]
+        return request
+
+    results = {}
+    legacy = LegacyUserActivityMiddleware(lambda request: None)
+    results['legacy'] = measure(lambda i: legacy.process_response(make_request(i), None), iterations)
+
+    UserActivity.objects.all().delete()
+    presence_buffer.forget()
+    presence_tracker.reset_stats()
+    buffered = UserActivityMiddleware(lambda request: None)
+    results['buffered'] = measure(lambda i: buffered.process_response(make_request(i), None), iterations)
+    results['buffered']['broadcasts'] = presence_tracker.stats()
+
+    # Start offline, so each user's first heartbeat is a transition
+    presence_tracker.go_offline([user.id for user in users])
+    presence_tracker.reset_stats()
+    results['heartbeats'] = measure(lambda i: presence_tracker.heartbeat(users[i % len(users)].id), iterations)
+    results['heartbeats']['broadcasts'] = presence_tracker.stats()
+
+    # The query log holds 9000 entries; the legacy run alone can fill it
+    reset_queries()
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        written = presence_buffer.flush()
+        elapsed = time.perf_counter() - start
+
+    buffered = results['buffered']
+    total = buffered['seconds'] + elapsed
+    buffered.update({
+        'flush_seconds': round(elapsed, 4),
+        'flushed_users': written,
+        'per_second_with_flush': round(iterations / total, 1),
+        'queries_per_call_with_flush': round(
+            (buffered['queries_per_call'] * iterations + len(queries.captured_queries)) / iterations, 3
+        ),
+    })
+
+    # Heartbeats expire: backdate the activity rows and drop the status keys
+    UserActivity.objects.update(last_activity=timezone.now() - timedelta(seconds=presence_tracker.ttl + 1))
+    get_store().delete(*(status_key(user.id) for user in users))
+    reset_queries()
+    with mock.patch.object(dispatcher, 'submit') as submit, CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        swept = presence_tracker.sweep()
+        elapsed = time.perf_counter() - start
+    results['sweep'] = {
+        'seconds': round(elapsed, 4),
+        'swept_users': swept,
+        'offline_events': sum(len(call.args[0]) for call in submit.call_args_list),
+        'queries': len(queries.captured_queries),
+    }
+    return results
@@ -0,0 +1,102 @@
+"""
+Worker cold start and per-request middleware cost of each settings profile.
+
+Every ``DJANGO_ENV`` profile is started ``RUNS`` times in a fresh interpreter
+that builds the WSGI application and loads the URLconf, as a web worker does
+before its first request. ``process_seconds`` is the time from spawning the
+process until it is ready, interpreter start included; ``setup_seconds`` is the part
+spent in Django setup and imports; ``rss_mb`` is the peak resident set size
+afterwards. The same process then sends ``--iterations`` requests for
+``/metrics`` through the whole middleware stack and calls the view directly as
+often, so ``middleware_overhead_ms`` is what the stack adds to a request.
+Profiles run against ``core.settings`` with SQLite, whatever the benchmark
+command itself was started with.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+
+PROFILES = ('development', 'production')
+RUNS = 5
+
+
+# Runs in the fresh interpreter; nothing from the project is imported before the clock starts
+CHILD = """
+import json, os, resource, sys, time
+start = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+from django.urls import get_resolver, resolve
+get_wsgi_application()
+get_resolver().url_patterns
+setup_seconds = time.perf_counter() - start
+ready_at = time.time()
+try:
+    # ru_maxrss would carry over the forking parent's peak across exec
+    with open('/proc/self/status') as status:
+        rss_mb = int(status.read().split('VmHWM:')[1].split()[0]) / 1024
+except OSError:
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+from django.test import Client, RequestFactory
+iterations = int(sys.argv[1])
+authorization = {'HTTP_AUTHORIZATION': f"Bearer {os.environ['METRICS_TOKEN']}"}
+client = Client()
+assert client.get('/metrics', **authorization).status_code == 200
+start = time.perf_counter()
+for _ in range(iterations):
+    client.get('/metrics', **authorization)
+stack = time.perf_counter() - start
+
+view, request = resolve('/metrics').func, RequestFactory().get('/metrics', **authorization)
+start = time.perf_counter()
+for _ in range(iterations):
+    view(request)
+direct = time.perf_counter() - start
+
+print(json.dumps({
+    'ready_at': ready_at,
+    'setup_seconds': setup_seconds,
+    'rss_mb': rss_mb,
+    'request_ms': stack / iterations * 1000,
+    'middleware_overhead_ms': (stack - direct) / iterations * 1000,
+}))
+"""
+
+
+def start_worker(profile, iterations):
+    env = {
+        **os.environ,
+        'DJANGO_SETTINGS_MODULE': 'core.settings',
+        'DJANGO_ENV': profile,
+        'DATABASE_ENGINE': 'sqlite',
+        'SERCRET_KEY': os.environ.get('SERCRET_KEY') or 'startup-benchmark',
+        'ALLOWED_HOSTS': 'testserver',
+        'METRICS_TOKEN': os.environ.get('METRICS_TOKEN') or 'startup-benchmark',
+        'PYTHONWARNINGS': 'ignore',
+    }
+    spawned_at = time.time()
+    completed = subprocess.run([sys.executable, '-c', CHILD, str(iterations)],
+                               cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True)
+    measurement = json.loads(completed.stdout.strip().splitlines()[-1])
+    measurement['process_seconds'] = measurement['ready_at'] - spawned_at
+    return measurement
+
+
+def run(options):
+    results = {}
+    for profile in PROFILES:
+        measurements = [start_worker(profile, options['iterations']) for _ in range(RUNS)]
+        results[profile] = {
+            'process_seconds': round(statistics.median(m['process_seconds'] for m in measurements), 4),
+            'setup_seconds': round(statistics.median(m['setup_seconds'] for m in measurements), 4),
+            'rss_mb': round(max(m['rss_mb'] for m in measurements), 1),
+            'request_ms': round(statistics.median(m['request_ms'] for m in measurements), 4),
+            'middleware_overhead_ms': round(statistics.median(m['middleware_overhead_ms'] for m in measurements), 4),
+        }
+    return results
+
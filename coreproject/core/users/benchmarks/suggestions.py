@@ -0,0 +1,79 @@
+"""
+Recompute time and memory of the "people you may know" batch job.
+
+Seeds ``--users`` (default 50000) alumni over ``--edges`` (default ten per
+user) random friendships with random cohorts, then times loading the graph,
+the sparse products on their own and a full ``recompute`` including writes.
+Memory is the growth of the process's peak RSS plus the adjacency matrix's
+own size. ``--users 1000000 --edges 50000000`` is the one-machine target.
+"""
+import random
+import resource
+import time
+
+from django.conf import settings
+
+from users import suggestions
+from users.models import AlumniProfile, FriendSuggestion, Friendship
+
+from . import random_pairs, seed_users
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run(options):
+    users = options['users'] or 50_000
+    edges = options['edges'] or users * 10
+    rng = random.Random(options['seed'])
+
+    start = time.perf_counter()
+    user_ids = seed_users(users, prefix='suggest-bench')
+    pairs = random_pairs(user_ids, edges, options['seed'])
+    for offset in range(0, len(pairs), 10_000):
+        Friendship.objects.befriend_many(pairs[offset:offset + 10_000])
+    AlumniProfile.objects.bulk_create(
+        (AlumniProfile(user_id=user_id, graduation_year=str(rng.randint(2000, 2024)),
+                       major=f'Major {rng.randint(1, 40)}', current_job_title='Engineer',
+                       current_company=f'Company {rng.randint(1, 2000)}')
+         for user_id in user_ids),
+        batch_size=5000,
+    )
+    seed_seconds = time.perf_counter() - start
+
+    rss_before = peak_rss_mb()
+    start = time.perf_counter()
+    ids = suggestions.load_user_ids()
+    adjacency = suggestions.load_adjacency(ids)
+    cohorts = suggestions.load_cohorts(ids)
+    load_seconds = time.perf_counter() - start
+
+    k, block_size = settings.FRIEND_SUGGESTIONS_K, settings.FRIEND_SUGGESTIONS_BLOCK_SIZE
+    start = time.perf_counter()
+    candidates = 0
+    for block_start in range(0, len(ids), block_size):
+        block = suggestions.top_candidates(adjacency, cohorts, block_start,
+                                           min(block_start + block_size, len(ids)), k)
+        candidates += len(block[0])
+    compute_seconds = time.perf_counter() - start
+    compute_rss_mb = peak_rss_mb() - rss_before
+
+    start = time.perf_counter()
+    written = suggestions.recompute()
+    recompute_seconds = time.perf_counter() - start
+
+    return {
+        'graph': {'users': users, 'edges': len(pairs), 'seed_seconds': round(seed_seconds, 2)},
+        'k': k,
+        'block_size': block_size,
+        'load_seconds': round(load_seconds, 3),
+        'compute_seconds': round(compute_seconds, 3),
+        'recompute_seconds': round(recompute_seconds, 3),
+        'rows_written': written,
+        'rows_stored': FriendSuggestion.objects.count(),
+        'adjacency_mb': round((adjacency.data.nbytes + adjacency.indices.nbytes
+                               + adjacency.indptr.nbytes) / 2 ** 20, 2),
+        'peak_rss_growth_mb': round(compute_rss_mb, 1),
+        'candidates': candidates,
+    }
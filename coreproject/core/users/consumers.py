@@ -1,65 +1,133 @@
-import json
-from channels.generic.websocket import AsyncWebsocketConsumer, WebsocketConsumer
+import asyncio
+from urllib.parse import parse_qs
 
-from core.users import daos
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
 
+from . import daos, notifications
+from .encoding import EncodedEventsMixin
+from .metrics import InstrumentedConsumerMixin, channel_publish_seconds
+from .presence import PRESENCE_STATUSES, presence_group, presence_tracker
+
+
+class NotificationConsumer(InstrumentedConsumerMixin, EncodedEventsMixin, AsyncWebsocketConsumer):
+    """Live notifications for ``user_id``, who must be the authenticated user, after the unread backlog.
+
+    Pass ``?since=<id>`` to skip what the client already has. A notification can
+    arrive both live and in the backlog, so clients should drop repeated ids.
+    """
 
-class NotificationConsumer(AsyncWebsocketConsumer):
     async def connect(self):
-        # Join the room group
+        # Only the owner may join the room group: it carries their stored notifications
         self.user_id = self.scope['url_route']['kwargs']['user_id']
-        self.room_group_name = f"user_{self.user_id}"
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated or str(user.id) != str(self.user_id):
+            await self.close()
+            return
+
+        self.room_group_name = notifications.notification_group(self.user_id)
         await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name
         )
-        await self.accept()
+        await self.accept_negotiated()
+        await self.replay()
+
+    async def replay(self):
+        try:
+            since = int(parse_qs(self.scope.get('query_string', b'').decode()).get('since', ['0'])[0])
+        except ValueError:
+            since = 0
+        backlog = await database_sync_to_async(notifications.unseen)(int(self.user_id), since)
+        for notification in backlog:
+            await self.send_notification(notifications.notification_event(notification))
 
     async def disconnect(self, close_code):
+        if not hasattr(self, 'room_group_name'):
+            return
         # Leave the room group
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
 
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
         # Receive message from WebSocket
-        text_data_json = json.loads(text_data)
-        payload = text_data_json['payload']
+        payload = self.decode(text_data, bytes_data)['payload']
 
         # Send message to WebSocket
-        await self.send(text_data=json.dumps({
+        await self.send_message({
             'payload': payload
-        }))
+        })
 
     async def send_notification(self, event):
-        # Send message to WebSocket
-        await self.send(text_data=json.dumps({
-            'payload': event['payload']
-        }))
+        # Already encoded at publish time
+        await self.send_encoded(event)
+
+
+class UserActivityConsumer(InstrumentedConsumerMixin, EncodedEventsMixin, AsyncWebsocketConsumer):
+    """Pushes friends' status changes to the connected user.
+
+    On connect the socket joins the presence group of every friend (looked up
+    once through the friend-graph cache) and is sent a ``snapshot`` of the
+    friends already online, again on ``{"type": "snapshot"}``. Any message is
+    a heartbeat that keeps the user online for ``PRESENCE_TTL``;
+    ``{"status": "away"}`` also changes the status. Only transitions are
+    published, once, to the user's own presence group, and the channel layer
+    fans them out.
+    """
+
+    async def connect(self):
+        self.user = self.scope.get('user')
+        if self.user is None or not self.user.is_authenticated:
+            await self.close()
+            return
 
+        friend_ids = await database_sync_to_async(daos.FriendshipDAO.get_friend_ids)(self.user.id)
+        self.presence_groups = [presence_group(friend_id) for friend_id in friend_ids]
+        await asyncio.gather(*(
+            self.channel_layer.group_add(group, self.channel_name) for group in self.presence_groups
+        ))
+        await self.accept_negotiated()
 
-class UserActivityConsumer(WebsocketConsumer):
-    def connect(self):
-        self.accept()
+        self.status = 'active'
+        await self.publish(await sync_to_async(presence_tracker.connect)(self.user.id))
+        await self.send_snapshot()
 
-    def disconnect(self, code):
-        pass
+    async def disconnect(self, code):
+        if not hasattr(self, 'presence_groups'):
+            return
+        await asyncio.gather(*(
+            self.channel_layer.group_discard(group, self.channel_name) for group in self.presence_groups
+        ))
+        await self.publish(await sync_to_async(presence_tracker.disconnect)(self.user.id))
 
-    def receive(self, text_data=None, bytes_data=None):
-        data = json.loads(text_data)
-        user_id = data.get('user_id')
+    async def receive(self, text_data=None, bytes_data=None):
+        data = self.decode(text_data, bytes_data)
+        if data.get('type') == 'snapshot':
+            await self.send_snapshot()
+        status = data.get('status', self.status)
+        if status == 'offline':
+            await self.publish(await sync_to_async(presence_tracker.go_offline)([self.user.id]))
+        elif status in PRESENCE_STATUSES:
+            self.status = status
+            await self.publish(await sync_to_async(presence_tracker.heartbeat)(self.user.id, status))
 
-        self.send_activity_status_to_friends(user_id)
+    async def send_snapshot(self):
+        statuses = await sync_to_async(presence_tracker.online_friends)(self.user.id)
+        await self.send_message({
+            'type': 'snapshot',
+            'online': [{'user_id': user_id, 'status': status} for user_id, status in statuses.items()],
+        })
 
-    def send_activity_status_to_friends(self, user_id):
-        # Logic to get friends and send status
-        friends = self.get_friends(user_id)
-        for friend in friends:
-            self.send(text_data=json.dumps({
-                'user_id': user_id,
-                'status': 'active'
-            }))
+    async def publish(self, events):
+        if not events:
+            return
+        with channel_publish_seconds.time():
+            for group, event in events:
+                await self.channel_layer.group_send(group, event)
 
-    def get_friends(self, user_id):
-        return daos.FriendshipDAO.get_friends(user_id)
+    async def presence_status(self, event):
+        # Encoded once by the publisher, forwarded as-is to every friend
+        await self.send_encoded(event)
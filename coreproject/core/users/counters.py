@@ -0,0 +1,106 @@
+"""
+Denormalized social counters on ``User``.
+
+``friends_count``, ``pending_received_count`` and ``pending_sent_count`` are
+moved with ``F()`` UPDATEs (one per operation) by the code that changes the underlying
+``Friendship`` and ``FriendRequest`` rows, in the same transaction, so a
+profile header reads them from the user row alone. Rows changed any other
+way (the admin, bulk scripts, deleted users) leave them drifting until
+``manage.py reconcile_counters`` recomputes them with ``reconcile``.
+"""
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+
+from .authentication import token_cache
+from .models import FriendRequest, Friendship, User
+from .response_cache import response_cache
+
+COUNTER_FIELDS = ('friends_count', 'pending_received_count', 'pending_sent_count')
+
+
+def adjust(**deltas):
+    """Add ``deltas[field][user_id]`` to each counter in a single UPDATE; never below zero."""
+    updates, user_ids = {}, set()
+    for field, field_deltas in deltas.items():
+        by_delta = defaultdict(list)
+        for user_id, delta in field_deltas.items():
+            if delta:
+                by_delta[delta].append(user_id)
+        if by_delta:
+            whens = []
+            for delta, ids in by_delta.items():
+                if delta > 0:
+                    whens.append(When(id__in=ids, then=F(field) + delta))
+                else:
+                    # Checked before subtracting: on MySQL's unsigned columns F() + delta
+                    # below zero is an out-of-range error, not something to clamp afterwards
+                    whens.append(When(id__in=ids, **{f'{field}__gte': -delta}, then=F(field) + delta))
+                    whens.append(When(id__in=ids, then=Value(0)))
+            updates[field] = Case(*whens, default=F(field), output_field=IntegerField())
+            user_ids.update(user_id for ids in by_delta.values() for user_id in ids)
+
+    if updates:
+        User.objects.filter(id__in=user_ids).update(**updates)
+        transaction.on_commit(lambda: refresh(user_ids))
+
+
+def refresh(user_ids):
+    # Cached users and responses still hold the old counts
+    for user_id in user_ids:
+        token_cache.evict_user(user_id)
+        response_cache.bump(user_id)
+
+
+def friendships_changed(pairs, sign=1):
+    """Account for ``(user_id, other_id)`` friendships created (``sign=1``) or removed."""
+    counts = Counter(user_id for pair in pairs for user_id in pair)
+    adjust(friends_count={user_id: sign * count for user_id, count in counts.items()})
+
+
+def requests_changed(pairs, sign=1):
+    """Account for ``(sender_id, receiver_id)`` requests becoming (``sign=1``) or ceasing to be pending."""
+    received = Counter(receiver_id for _, receiver_id in pairs)
+    sent = Counter(sender_id for sender_id, _ in pairs)
+    adjust(pending_received_count={user_id: sign * count for user_id, count in received.items()},
+           pending_sent_count={user_id: sign * count for user_id, count in sent.items()})
+
+
+def expected_counts():
+    """Each counter recomputed from the edge tables, as expressions over a ``User`` row."""
+    def count(queryset, column):
+        return Coalesce(Subquery(queryset.filter(**{column: OuterRef('pk')}).order_by().values(column)
+                                 .annotate(count=Count('pk')).values('count')), Value(0),
+                        output_field=IntegerField())
+
+    pending = FriendRequest.objects.filter(status=FriendRequest.Status.PENDING)
+    return {
+        'friends_count': count(Friendship.objects.all(), 'user1'),
+        'pending_received_count': count(pending, 'receiver'),
+        'pending_sent_count': count(pending, 'sender'),
+    }
+
+
+def reconcile(batch_size=10000):
+    """Rewrite the counters that drifted, ``batch_size`` user ids per pass; returns the users corrected."""
+    expected = expected_counts()
+    drifted = Q()
+    for field in COUNTER_FIELDS:
+        drifted |= ~Q(**{field: F(f'expected_{field}')})
+
+    max_id = User.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    corrected = 0
+    for start in range(0, max_id, batch_size):
+        user_ids = list(User.objects.filter(id__gt=start, id__lte=start + batch_size)
+                        .alias(**{f'expected_{field}': expression for field, expression in expected.items()})
+                        .filter(drifted).values_list('id', flat=True))
+        if not user_ids:
+            continue
+        with transaction.atomic():
+            # Recomputed in the UPDATE itself, so increments since the check are not lost
+            User.objects.filter(id__in=user_ids).update(**expected)
+            transaction.on_commit(lambda user_ids=user_ids: refresh(user_ids))
+        corrected += len(user_ids)
+    return corrected
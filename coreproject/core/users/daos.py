@@ -1,20 +1,161 @@
-from core.users.models import User, Friendship
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import counters
+from .graph import friend_graph
+from .models import FriendRequest, User, Friendship
 
 
 class FriendshipDAO:
 
-    def __init__(self):
-        pass
+    @staticmethod
+    def get_friend_ids(user_id):
+        return friend_graph.get_friend_ids(user_id)
+
+    @staticmethod
+    def get_friends(user_id):
+        return User.objects.filter(id__in=friend_graph.get_friend_ids(user_id))
+
+    @staticmethod
+    def are_friends(user_id, other_id):
+        return friend_graph.are_friends(user_id, other_id)
+
+    @staticmethod
+    def create_friendship(user1, user2):
+        if Friendship.objects.befriend(user1.id, user2.id):
+            counters.friendships_changed([(user1.id, user2.id)])
+        transaction.on_commit(lambda: friend_graph.add_edge(user1.id, user2.id))
+
+    @staticmethod
+    def create_friendships(pairs):
+        pairs = Friendship.objects.befriend_many(pairs)
+        counters.friendships_changed(pairs)
+
+        def add_edges():
+            for user_id, other_id in pairs:
+                friend_graph.add_edge(user_id, other_id)
+        transaction.on_commit(add_edges)
+
+    @staticmethod
+    def delete_friendship(user1, user2):
+        deleted = Friendship.objects.unfriend(user1.id, user2.id)
+        if deleted:
+            counters.friendships_changed([(user1.id, user2.id)], -1)
+            transaction.on_commit(lambda: friend_graph.remove_edge(user1.id, user2.id))
+        return deleted
+
+
+class FriendRequestDAO:
+    """Friend-request operations on many items at once.
+
+    Each call runs a fixed number of queries however many ids it is given and
+    must run inside a transaction; results are keyed by the ids passed in.
+    """
+
+    @staticmethod
+    def send_requests(sender, receiver_ids):
+        """Returns ``(results, requests)``: a status per receiver id and the requests now pending.
+
+        Statuses are ``sent``, ``resent`` (a rejected request made pending again),
+        ``pending``, ``friends``, ``self`` and ``not_found``.
+        """
+        receiver_ids = list(dict.fromkeys(receiver_ids))
+        existing = set(User.objects.filter(id__in=receiver_ids).values_list('id', flat=True))
+        friends = FriendshipDAO.get_friend_ids(sender.id)
+        previous = {}
+        for friend_request in FriendRequest.objects.select_for_update().filter(
+                sender=sender, receiver_id__in=receiver_ids,
+                status__in=(FriendRequest.Status.PENDING, FriendRequest.Status.REJECTED),
+        ).only('id', 'receiver_id', 'status'):
+            if friend_request.receiver_id not in previous or friend_request.status == FriendRequest.Status.PENDING:
+                previous[friend_request.receiver_id] = friend_request
+
+        results, to_create, to_resend = {}, [], []
+        for receiver_id in receiver_ids:
+            friend_request = previous.get(receiver_id)
+            if receiver_id == sender.id:
+                results[receiver_id] = 'self'
+            elif receiver_id not in existing:
+                results[receiver_id] = 'not_found'
+            elif receiver_id in friends:
+                results[receiver_id] = 'friends'
+            elif friend_request is None:
+                results[receiver_id] = 'sent'
+                to_create.append(FriendRequest(sender=sender, receiver_id=receiver_id))
+            elif friend_request.status == FriendRequest.Status.PENDING:
+                results[receiver_id] = 'pending'
+            else:
+                results[receiver_id] = 'resent'
+                friend_request.status = FriendRequest.Status.PENDING
+                to_resend.append(friend_request)
+
+        if to_resend:
+            FriendRequest.objects.filter(id__in=[friend_request.id for friend_request in to_resend]).update(
+                status=FriendRequest.Status.PENDING, updated_at=timezone.now()
+            )
+        if to_create:
+            FriendRequest.objects.bulk_create(to_create)
+            if not connection.features.can_return_rows_from_bulk_insert:
+                # MySQL does not report the new ids
+                to_create = list(FriendRequest.objects.filter(
+                    sender=sender, status=FriendRequest.Status.PENDING,
+                    receiver_id__in=[friend_request.receiver_id for friend_request in to_create],
+                ).only('id', 'receiver_id'))
+        counters.requests_changed([(sender.id, friend_request.receiver_id)
+                                   for friend_request in to_resend + to_create])
+        return results, to_resend + to_create
+
+    @staticmethod
+    def respond_to_request(receiver, request_id, accept):
+        """Accept or reject one of ``receiver``'s requests; returns ``(result, sender_id)``.
+
+        The status only moves through a conditional UPDATE on ``status = PENDING``,
+        so of several concurrent calls exactly one wins and the rest get
+        ``processed``; ``not_found`` and ``processed`` return no sender.
+        """
+        new_status = FriendRequest.Status.ACCEPTED if accept else FriendRequest.Status.REJECTED
+        requests = FriendRequest.objects.filter(id=request_id, receiver=receiver)
+        if not requests.filter(status=FriendRequest.Status.PENDING).update(status=new_status,
+                                                                          updated_at=timezone.now()):
+            return ('processed' if requests.exists() else 'not_found'), None
 
-    def get_friends(self, user_id):
+        sender_id = requests.values_list('sender_id', flat=True).get()
+        counters.requests_changed([(sender_id, receiver.id)], -1)
+        if accept:
+            FriendshipDAO.create_friendships([(sender_id, receiver.id)])
+        return new_status.lower(), sender_id
 
-        user = User.objects.get(pk=user_id)
+    @staticmethod
+    def respond_to_requests(receiver, request_ids, accept):
+        """Accept or reject ``receiver``'s pending requests; returns ``(results, requests)``.
 
-        friends = User.objects.filter(
-            id__in=Friendship.objects.filter(user1=user).value('user2')
-        ) | User.objects.filter(
-            id__in=Friendship.objects.filter(user2=user).values('user1')
-        )
+        Statuses are ``accepted`` or ``rejected``, ``processed`` for requests that
+        are no longer pending and ``not_found``; ``requests`` are the ones updated.
+        """
+        request_ids = list(dict.fromkeys(request_ids))
+        found = FriendRequest.objects.select_for_update().filter(id__in=request_ids, receiver=receiver) \
+            .only('id', 'sender_id', 'receiver_id', 'status').in_bulk()
+        new_status = FriendRequest.Status.ACCEPTED if accept else FriendRequest.Status.REJECTED
 
-        return friends
+        results, updated = {}, []
+        for request_id in request_ids:
+            friend_request = found.get(request_id)
+            if friend_request is None:
+                results[request_id] = 'not_found'
+            elif friend_request.status != FriendRequest.Status.PENDING:
+                results[request_id] = 'processed'
+            else:
+                results[request_id] = new_status.lower()
+                friend_request.status = new_status
+                updated.append(friend_request)
 
+        if updated:
+            FriendRequest.objects.filter(id__in=[friend_request.id for friend_request in updated]).update(
+                status=new_status, updated_at=timezone.now()
+            )
+            counters.requests_changed([(friend_request.sender_id, receiver.id) for friend_request in updated], -1)
+            if accept:
+                FriendshipDAO.create_friendships(
+                    (friend_request.sender_id, friend_request.receiver_id) for friend_request in updated
+                )
+        return results, updated
@@ -0,0 +1,90 @@
+"""
+Batched channel-layer publishing.
+
+``dispatcher.publish`` takes any number of ``(group, event)`` pairs and sends
+them once the current transaction commits; if it rolls back they are
+dropped, and outside a transaction they go at once. The send itself happens
+on a background thread with its own event loop, so the request thread never
+waits on the channel layer. That thread picks up every batch handed over
+since its last pass and sends them together with ``asyncio.gather``, so one
+loop bridge and one burst of overlapping Redis round trips cover the lot
+instead of one ``async_to_sync`` call per message.
+
+With ``CHANNEL_DISPATCH_BACKGROUND = False`` batches are sent in the
+committing thread instead, which tests and short-lived commands rely on.
+"""
+import asyncio
+import logging
+import queue
+import threading
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+
+from .metrics import channel_publish_seconds
+
+logger = logging.getLogger(__name__)
+
+
+async def send_all(messages):
+    """``group_send`` every ``(group, event)`` pair concurrently; failures are logged, not raised."""
+    channel_layer = get_channel_layer()
+    with channel_publish_seconds.time():
+        results = await asyncio.gather(
+            *(channel_layer.group_send(group, event) for group, event in messages),
+            return_exceptions=True,
+        )
+    for (group, _), result in zip(messages, results):
+        if isinstance(result, Exception):
+            logger.error('Could not publish to %s', group, exc_info=result)
+
+
+class Dispatcher:
+
+    def __init__(self):
+        self.batches = queue.SimpleQueue()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def background(self):
+        return getattr(settings, 'CHANNEL_DISPATCH_BACKGROUND', True)
+
+    def publish(self, messages, using=None):
+        """Send ``(group, event)`` pairs after the transaction on ``using`` commits."""
+        messages = list(messages)
+        if messages:
+            transaction.on_commit(lambda: self.submit(messages), using=using)
+
+    def submit(self, messages):
+        if not self.background:
+            async_to_sync(send_all)(messages)
+            return
+        self.batches.put(messages)
+        self.ensure_thread()
+
+    def ensure_thread(self):
+        # Also restarts the thread in forked workers, where it does not survive
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='channel-dispatch', daemon=True)
+                self.thread.start()
+
+    def run(self):
+        loop = asyncio.new_event_loop()
+        while True:
+            messages = list(self.batches.get())
+            while True:
+                try:
+                    messages.extend(self.batches.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                loop.run_until_complete(send_all(messages))
+            except Exception:
+                logger.exception('Dropped a batch of %d channel-layer messages', len(messages))
+
+
+dispatcher = Dispatcher()
@@ -0,0 +1,140 @@
+"""
+Wire encoding for WebSocket events.
+
+Events are encoded once when they are published: ``encoded_event`` puts the
+JSON text (orjson when installed, else the stdlib) into the channel-layer
+message and, while any socket uses msgpack, the msgpack bytes as well.
+Consumers forward whichever one their client negotiated, unchanged. Clients
+choose msgpack by offering the ``msgpack`` WebSocket subprotocol; everyone
+else gets JSON text.
+
+Open msgpack sockets are counted in the shared store, which publishers read
+at most every ``MSGPACK_SUBSCRIBERS_REFRESH`` seconds. An event published
+before a publisher noticed a new msgpack socket is packed by that socket's
+consumer from its JSON.
+"""
+import json
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .store import get_store
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+MSGPACK = 'msgpack'
+MSGPACK_SOCKETS_KEY = 'encoding:msgpack-sockets'
+
+
+def dumps(message):
+    if orjson is not None:
+        return orjson.dumps(message).decode()
+    return json.dumps(message, separators=(',', ':'))
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class BinarySubscribers:
+    """Whether any msgpack socket is open in any process."""
+
+    def __init__(self):
+        # (open, monotonic time to read the store again); replaced whole, so it is read without a lock
+        self._state = (False, 0.0)
+
+    @property
+    def refresh(self):
+        return getattr(settings, 'MSGPACK_SUBSCRIBERS_REFRESH', 1.0)
+
+    def opened(self):
+        get_store().incr(MSGPACK_SOCKETS_KEY)
+        self._state = (True, self._state[1])
+
+    def closed(self):
+        get_store().incr(MSGPACK_SOCKETS_KEY, -1)
+
+    def any(self):
+        active, recheck_at = self._state
+        now = time.monotonic()
+        if now >= recheck_at:
+            try:
+                active = int(get_store().get(MSGPACK_SOCKETS_KEY) or 0) > 0
+            except Exception:
+                # Consumers pack what arrives without msgpack bytes, so publishing goes on without them
+                logger.warning('Could not count msgpack sockets', exc_info=True)
+                active = False
+            self._state = (active, now + self.refresh)
+        return active
+
+    def forget(self):
+        self._state = (False, 0.0)
+
+
+binary_subscribers = BinarySubscribers()
+
+
+def encoded_event(event_type, message):
+    """A channel-layer event of ``event_type`` carrying ``message`` pre-encoded for every client."""
+    event = {'type': event_type, 'text': dumps(message)}
+    if msgpack is not None and binary_subscribers.any():
+        event['binary'] = msgpack.packb(message)
+    return event
+
+
+def decode_event(event):
+    """The message inside ``encoded_event``; for tests and server-side consumers."""
+    return loads(event['text'])
+
+
+class EncodedEventsMixin:
+    """Consumer side of ``encoded_event``: negotiates the framing once, then forwards bytes as-is."""
+
+    binary = False
+
+    async def accept_negotiated(self):
+        self.binary = msgpack is not None and MSGPACK in self.scope.get('subprotocols', ())
+        if self.binary:
+            await sync_to_async(binary_subscribers.opened)()
+        await self.accept(subprotocol=MSGPACK if self.binary else None)
+
+    async def websocket_disconnect(self, message):
+        if self.binary:
+            await sync_to_async(binary_subscribers.closed)()
+        await super().websocket_disconnect(message)
+
+    async def send_encoded(self, event):
+        if self.binary:
+            binary = event.get('binary')
+            if binary is None:
+                # Published before the publisher saw this socket
+                binary = msgpack.packb(loads(event['text']))
+            await self.send(bytes_data=binary)
+        else:
+            await self.send(text_data=event['text'])
+
+    async def send_message(self, message):
+        """Encodes one message for this socket only (replies, not fan-out)."""
+        if self.binary:
+            await self.send(bytes_data=msgpack.packb(message))
+        else:
+            await self.send(text_data=dumps(message))
+
+    def decode(self, text_data=None, bytes_data=None):
+        if bytes_data is not None and self.binary:
+            return msgpack.unpackb(bytes_data)
+        return loads(text_data if text_data is not None else bytes_data)
@@ -0,0 +1,128 @@
+"""
+Friend-graph adjacency cache.
+
+Each user's friend ids live in two tiers: a per-process LRU and a set in the
+shared store (``friends:<user_id>``) used by every worker. ``add_edge`` and
+``remove_edge`` update both tiers in place when a friendship is created or
+removed; local entries additionally expire after ``FRIEND_GRAPH_LOCAL_TTL``
+seconds so edits made by other workers become visible.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .models import Friendship
+from .store import get_store
+
+# Member stored in every loaded set so that "loaded, no friends" differs from "not loaded".
+LOADED_MARKER = ''
+
+
+def friends_key(user_id):
+    return f'friends:{user_id}'
+
+
+class FriendGraph:
+
+    def __init__(self):
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def local_ttl(self):
+        return getattr(settings, 'FRIEND_GRAPH_LOCAL_TTL', 5)
+
+    @property
+    def local_size(self):
+        return getattr(settings, 'FRIEND_GRAPH_LOCAL_SIZE', 10_000)
+
+    @property
+    def shared_ttl(self):
+        return getattr(settings, 'FRIEND_GRAPH_TTL', 24 * 60 * 60)
+
+    def get_friend_ids(self, user_id):
+        """Return the ids of ``user_id``'s friends as a frozenset."""
+        friend_ids = self._get_local(user_id)
+        if friend_ids is not None:
+            return friend_ids
+
+        members = get_store().smembers(friends_key(user_id))
+        if LOADED_MARKER in members:
+            members.discard(LOADED_MARKER)
+            friend_ids = frozenset(int(member) for member in members)
+        else:
+            friend_ids = self.load(user_id)
+
+        self._set_local(user_id, friend_ids)
+        return friend_ids
+
+    def are_friends(self, user_id, other_id):
+        return other_id in self.get_friend_ids(user_id)
+
+    def add_edge(self, user_id, other_id):
+        self._update_edge(user_id, other_id, 'sadd', frozenset.union)
+
+    def remove_edge(self, user_id, other_id):
+        self._update_edge(user_id, other_id, 'srem', frozenset.difference)
+
+    def invalidate(self, *user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._local.pop(user_id, None)
+        get_store().delete(*(friends_key(user_id) for user_id in user_ids))
+
+    def clear_local(self):
+        with self._lock:
+            self._local.clear()
+
+    def load(self, user_id):
+        """Read ``user_id``'s friends from the database into the shared set."""
+        friend_ids = frozenset(Friendship.objects.friend_ids(user_id))
+
+        key = friends_key(user_id)
+        pipe = get_store().pipeline()
+        pipe.delete(key)
+        pipe.sadd(key, LOADED_MARKER, *friend_ids)
+        pipe.expire(key, self.shared_ttl)
+        pipe.execute()
+        return friend_ids
+
+    def _update_edge(self, user_id, other_id, command, combine):
+        # Sets that were never loaded are left alone; the next read loads them
+        # from the database. A partial set written here lacks the marker and is
+        # therefore never mistaken for a complete one.
+        pipe = get_store().pipeline()
+        for owner, friend in ((user_id, other_id), (other_id, user_id)):
+            getattr(pipe, command)(friends_key(owner), friend)
+            pipe.expire(friends_key(owner), self.shared_ttl)
+        pipe.execute()
+
+        with self._lock:
+            for owner, friend in ((user_id, other_id), (other_id, user_id)):
+                entry = self._local.get(owner)
+                if entry is not None:
+                    self._local[owner] = (entry[0], combine(entry[1], {friend}))
+
+    def _get_local(self, user_id):
+        with self._lock:
+            entry = self._local.get(user_id)
+            if entry is None:
+                return None
+            expires_at, friend_ids = entry
+            if expires_at <= time.monotonic():
+                del self._local[user_id]
+                return None
+            self._local.move_to_end(user_id)
+            return friend_ids
+
+    def _set_local(self, user_id, friend_ids):
+        with self._lock:
+            self._local[user_id] = (time.monotonic() + self.local_ttl, friend_ids)
+            self._local.move_to_end(user_id)
+            while len(self._local) > self.local_size:
+                self._local.popitem(last=False)
+
+
+friend_graph = FriendGraph()
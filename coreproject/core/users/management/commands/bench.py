@@ -0,0 +1,87 @@
+import json
+import logging
+import platform
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from users import benchmarks
+
+
+@contextmanager
+def benchmark_environment(local):
+    # DEBUG off like the test runner: the debug toolbar would otherwise instrument every request
+    setup_test_environment(debug=False)
+    # 4xx responses are tallied per benchmark, not logged one by one
+    logging.getLogger('django.request').setLevel(logging.ERROR)
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        if local:
+            from core.celery import app
+            app.conf.task_always_eager = True
+            media_root = tempfile.mkdtemp()
+            try:
+                with override_settings(
+                    USERS_STORE_URL='',
+                    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+                    CELERY_TASK_ALWAYS_EAGER=True,
+                    MEDIA_STORAGE_BACKEND='users.media.LocalMediaStorage',
+                    MEDIA_ROOT=media_root,
+                    MEDIA_STAGING_DIR=f'{media_root}/staging',
+                    TOKEN_CACHE_ALIAS=None,
+                    RESPONSE_CACHE_ALIAS='default',
+                ):
+                    yield
+            finally:
+                shutil.rmtree(media_root, ignore_errors=True)
+        else:
+            yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+class Command(BaseCommand):
+    help = 'Run users app benchmarks against a throwaway test database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*',
+                            help=f'Benchmarks to run (default: all): {", ".join(sorted(benchmarks.BENCHMARKS))}')
+        parser.add_argument('--local', action='store_true',
+                            help='Use in-process stand-ins for Redis, the channel layer, Celery and Cloudinary')
+        parser.add_argument('--output', help='Also write the results as JSON to this file')
+        parser.add_argument('--iterations', type=int, default=1000)
+        parser.add_argument('--users', type=int, help='Number of synthetic users (benchmark specific default)')
+        parser.add_argument('--edges', type=int, help='Number of synthetic friendships (benchmark specific default)')
+        parser.add_argument('--concurrency', type=int, default=8, help='Parallel clients, where a benchmark uses them')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        names = options['names'] or sorted(benchmarks.BENCHMARKS)
+        unknown = [name for name in names if name not in benchmarks.BENCHMARKS]
+        if unknown:
+            raise CommandError(f'Unknown benchmark(s): {", ".join(unknown)}')
+
+        with benchmark_environment(options['local']):
+            results = {
+                'environment': {
+                    'database': connection.vendor,
+                    'local': options['local'],
+                    'python': platform.python_version(),
+                    'django': django.get_version(),
+                    'options': {key: options[key] for key in ('iterations', 'users', 'edges', 'concurrency', 'seed')},
+                },
+            }
+            for name in names:
+                results[name] = benchmarks.load(name).run(options)
+
+        output = json.dumps(results, indent=2, default=str)
+        if options['output']:
+            with open(options['output'], 'w') as fp:
+                fp.write(output)
+        self.stdout.write(output)
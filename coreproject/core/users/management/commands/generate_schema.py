@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from users.schema import committed, generate, schema_path, write
+
+
+class Command(BaseCommand):
+    help = 'Write the OpenAPI schema served at /swagger.json and /swagger.yaml (needs drf_yasg)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only fail if the committed schema differs from the code')
+
+    def handle(self, *args, **options):
+        documents = generate()
+        stale = [format for format, content in committed().items() if content != documents[format]]
+        if options['check']:
+            if stale:
+                raise CommandError(f'Schema out of date ({", ".join(stale)}); run manage.py generate_schema')
+            self.stdout.write('Schema is up to date')
+            return
+
+        write(documents)
+        for format in documents:
+            self.stdout.write(f'Wrote {schema_path(format)}')
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from users.models import AlumniProfile
+from users.search import index_profiles
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the alumni directory search index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        profiles = AlumniProfile.objects.select_related('user').order_by('id')
+        batch_size = options['batch_size']
+        last_id = count = 0
+        while True:
+            batch = list(profiles.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            index_profiles(batch)
+            last_id = batch[-1].id
+            count += len(batch)
+        self.stdout.write(f'Indexed {count} alumni profiles')
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from users.counters import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Recompute the friend and pending-request counters that drifted from the edge tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        corrected = reconcile(options['batch_size'])
+        self.stdout.write(f'Corrected the counters of {corrected} users')
@@ -0,0 +1,121 @@
+"""
+Avatar and cover-image uploads.
+
+Requests only stage the file in ``MEDIA_STAGING_DIR``; ``upload_user_media_task``
+later pushes it to the storage backend named by ``MEDIA_STORAGE_BACKEND`` and
+patches the user row. Files are identified by their SHA-256 so identical
+content is uploaded once (see ``MediaAsset``).
+"""
+import contextlib
+import hashlib
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from .models import MediaAsset, User
+from .response_cache import response_cache
+
+USER_MEDIA_FOLDERS = {
+    'avatar': 'avatar/',
+    'cover_image': 'cover/',
+}
+
+
+class CloudinaryMediaStorage:
+
+    def upload(self, path, folder):
+        # Imported and configured here, in the Celery worker, not at web worker startup
+        import cloudinary
+        import cloudinary.uploader
+
+        cloudinary.config(**settings.CLOUDINARY)
+        res = cloudinary.uploader.upload(path, folder=folder)
+        return res['secure_url']
+
+
+class LocalMediaStorage:
+    """Copies files under ``MEDIA_ROOT``; meant for tests and local development."""
+
+    def upload(self, path, folder):
+        relative = Path(folder) / Path(path).name
+        destination = Path(settings.MEDIA_ROOT) / relative
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(path, destination)
+        return f'{settings.MEDIA_URL}{relative.as_posix()}'
+
+
+def get_media_storage():
+    return import_string(settings.MEDIA_STORAGE_BACKEND)()
+
+
+def stage_upload(uploaded_file):
+    """Write ``uploaded_file`` to the staging directory; returns ``(path, sha256)``."""
+    staging_dir = Path(settings.MEDIA_STAGING_DIR)
+    staging_dir.mkdir(parents=True, exist_ok=True)
+
+    digest = hashlib.sha256()
+    suffix = Path(getattr(uploaded_file, 'name', '') or '').suffix
+    with tempfile.NamedTemporaryFile(dir=staging_dir, suffix=suffix, delete=False) as staged:
+        try:
+            for chunk in uploaded_file.chunks():
+                digest.update(chunk)
+                staged.write(chunk)
+        except BaseException:
+            discard_staged([staged.name])
+            raise
+
+    return staged.name, digest.hexdigest()
+
+
+def find_media(content_hash):
+    return MediaAsset.objects.filter(content_hash=content_hash).values_list('url', flat=True).first()
+
+
+def store_media(path, content_hash, folder):
+    url = find_media(content_hash)
+    if url is None:
+        url = get_media_storage().upload(path, folder)
+        url = MediaAsset.objects.get_or_create(content_hash=content_hash, defaults={'url': url})[0].url
+    return url
+
+
+def schedule_user_media(user, field, uploaded_file):
+    """Attach ``uploaded_file`` to ``user.<field>`` once the current transaction commits.
+
+    Content that was uploaded before is attached straight away. Returns the
+    staged path, which the caller passes to ``discard_staged`` if it rolls back.
+    """
+    path, content_hash = stage_upload(uploaded_file)
+
+    url = find_media(content_hash)
+    if url is not None:
+        os.remove(path)
+        setattr(user, field, url)
+        User.objects.filter(pk=user.pk).update(**{field: url})
+        transaction.on_commit(lambda: response_cache.bump(user.pk))
+        return None
+
+    from .tasks import upload_user_media_task
+    transaction.on_commit(lambda: upload_user_media_task.delay(user.pk, field, path, content_hash))
+    return path
+
+
+def discard_staged(paths):
+    for path in paths:
+        if path is not None:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+
+
+def attach_user_media(user_id, field, path, content_hash):
+    url = store_media(path, content_hash, USER_MEDIA_FOLDERS[field])
+    User.objects.filter(pk=user_id).update(**{field: url})
+    response_cache.bump(user_id)
+    # Kept on failure for the task's retries, which discard it when they give up
+    os.remove(path)
+    return url
@@ -0,0 +1,212 @@
+"""
+Request, consumer and background-work instrumentation, exported for Prometheus.
+
+``MetricsMiddleware`` (see ``users.middleware``) times every request per view
+and records its queries, their time and the time spent in serializers built
+on ``InstrumentedSerializerMixin``; ``InstrumentedConsumerMixin`` times every
+consumer handler. Celery publishes and channel-layer sends are timed where
+they happen. Everything lands in in-process histograms that ``GET /metrics``
+renders in the Prometheus text format, so each worker process is scraped on
+its own.
+
+A ``METRICS_PROFILE_RATE`` fraction of requests runs under cProfile; those
+slower than ``METRICS_PROFILE_THRESHOLD`` seconds are written to
+``METRICS_PROFILE_DIR`` for ``python -m pstats`` or snakeviz.
+"""
+import bisect
+import contextvars
+import cProfile
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from celery.signals import after_task_publish, before_task_publish
+from django.conf import settings
+from django.utils import timezone
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                # Per-bucket counts (the last one is +Inf), then the sum
+                series = self.series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, *label_values):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def clear(self):
+        with self.lock:
+            self.series.clear()
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            series = {labels: list(values) for labels, values in self.series.items()}
+        for label_values, values in sorted(series.items()):
+            labels = [f'{name}="{escape(value)}"' for name, value in zip(self.labels, label_values)]
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values):
+                cumulative += count
+                bucket_labels = ','.join(labels + [f'le="{bound}"'])
+                lines.append(f'{self.name}_bucket{{{bucket_labels}}} {cumulative}')
+            suffix = '{' + ','.join(labels) + '}' if labels else ''
+            lines.append(f'{self.name}_sum{suffix} {values[-1]}')
+            lines.append(f'{self.name}_count{suffix} {cumulative}')
+        return '\n'.join(lines)
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+request_seconds = Histogram('http_request_duration_seconds', 'Time to respond, per view.',
+                            ('view', 'method', 'status'))
+request_queries = Histogram('http_request_db_queries', 'Database queries per request, per view.',
+                            ('view',), COUNT_BUCKETS)
+request_db_seconds = Histogram('http_request_db_seconds', 'Time in database queries per request, per view.',
+                               ('view',))
+request_serializer_seconds = Histogram('http_request_serializer_seconds',
+                                       'Time serializing responses per request, per view.', ('view',))
+consumer_seconds = Histogram('consumer_handler_duration_seconds', 'Time in each consumer handler.',
+                             ('consumer', 'handler'))
+celery_enqueue_seconds = Histogram('celery_enqueue_duration_seconds', 'Time to publish a task to the broker.',
+                                   ('task',))
+channel_publish_seconds = Histogram('channel_layer_publish_seconds', 'Time to send a batch of channel-layer messages.')
+
+HISTOGRAMS = (request_seconds, request_queries, request_db_seconds, request_serializer_seconds,
+              consumer_seconds, celery_enqueue_seconds, channel_publish_seconds)
+
+
+def render():
+    return '\n'.join(histogram.render() for histogram in HISTOGRAMS) + '\n'
+
+
+def clear():
+    for histogram in HISTOGRAMS:
+        histogram.clear()
+
+
+class RequestStats:
+    """What one request spent, filled in while it runs."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.serializer_seconds = 0.0
+        self.serializer_depth = 0
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_seconds += time.perf_counter() - start
+
+
+current_request = contextvars.ContextVar('current_request', default=None)
+
+
+class InstrumentedSerializerMixin:
+    """Adds the serializer's ``to_representation`` time to the current request."""
+
+    def to_representation(self, instance):
+        stats = current_request.get()
+        if stats is None or stats.serializer_depth:
+            # Nested fields are already inside the outermost serializer's time
+            return super().to_representation(instance)
+        stats.serializer_depth += 1
+        start = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            stats.serializer_depth -= 1
+            stats.serializer_seconds += time.perf_counter() - start
+
+
+class InstrumentedConsumerMixin:
+    """Times each message a consumer handles, labelled with its type."""
+
+    async def dispatch(self, message):
+        with consumer_seconds.time(type(self).__name__, message['type']):
+            await super().dispatch(message)
+
+
+class Profiler:
+    """Samples requests into cProfile and keeps the slow ones."""
+
+    @property
+    def rate(self):
+        return getattr(settings, 'METRICS_PROFILE_RATE', 0)
+
+    @property
+    def threshold(self):
+        return getattr(settings, 'METRICS_PROFILE_THRESHOLD', 0.5)
+
+    @property
+    def directory(self):
+        return getattr(settings, 'METRICS_PROFILE_DIR', settings.BASE_DIR / 'profiles')
+
+    def start(self):
+        if not self.rate or random.random() >= self.rate:
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler (or a concurrent sampled request) owns this thread
+            return None
+        return profile
+
+    def finish(self, profile, duration, view):
+        profile.disable()
+        if duration < self.threshold:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        name = f'{timezone.now():%Y%m%dT%H%M%S.%f}-{view.replace(":", "_")}-{int(duration * 1000)}ms.prof'
+        path = os.path.join(self.directory, name)
+        profile.dump_stats(path)
+        return path
+
+
+profiler = Profiler()
+
+# (task id, start) of the publish in progress; before and after run back to back in the
+# publishing thread, and a publish that fails is simply replaced by the next one
+_publishing = threading.local()
+
+
+@before_task_publish.connect
+def start_enqueue_timer(sender=None, headers=None, **kwargs):
+    _publishing.started = ((headers or {}).get('id'), time.perf_counter())
+
+
+@after_task_publish.connect
+def stop_enqueue_timer(sender=None, headers=None, **kwargs):
+    started, _publishing.started = getattr(_publishing, 'started', None), None
+    if started is not None and started[0] == (headers or {}).get('id'):
+        celery_enqueue_seconds.observe(time.perf_counter() - started[1], sender)
@@ -1,18 +1,49 @@
-from datetime import datetime
+import time
+
+from django.db import connection
 from django.utils.deprecation import MiddlewareMixin
-from .models import UserActivity
-from .tasks import send_activity_status_task
+
+from . import metrics
+from .dispatch import dispatcher
+from .presence import presence_buffer, presence_tracker
+
+
+class MetricsMiddleware:
+    """Records each request in ``users.metrics``; goes first so it covers the other middleware."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = metrics.RequestStats()
+        token = metrics.current_request.set(stats)
+        profile = metrics.profiler.start()
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(stats.record_query):
+                response = self.get_response(request)
+        finally:
+            duration = time.perf_counter() - start
+            metrics.current_request.reset(token)
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match is not None else 'unresolved'
+        if profile is not None:
+            metrics.profiler.finish(profile, duration, view)
+        metrics.request_seconds.observe(duration, view, request.method, response.status_code)
+        metrics.request_queries.observe(stats.queries, view)
+        metrics.request_db_seconds.observe(stats.db_seconds, view)
+        metrics.request_serializer_seconds.observe(stats.serializer_seconds, view)
+        return response
 
 
 class UserActivityMiddleware(MiddlewareMixin):
-    def process_request(self, request):
-        if request.user.is_authenticated:
-            UserActivity.objects.update_or_create(
-                user=request.user,
-                defaults={
-                    'last_activity': datetime.now(),
-                    'is_active': True
-                }
-            )
-
-            send_activity_status_task.delay(request.user.id)
+    def process_response(self, request, response):
+        # After the view, so users authenticated by DRF (bearer tokens) are seen too
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            # Activity is buffered and written to UserActivity in bulk by flush_presence_task;
+            # the same PRESENCE_GRANULARITY limits heartbeats to one per user and window
+            if presence_buffer.touch(user.id):
+                dispatcher.publish(presence_tracker.heartbeat(user.id))
+        return response
@@ -0,0 +1,50 @@
+# Generated by Django 5.1 on 2026-10-18 15:34
+
+from django.db import migrations, models
+
+
+def mirror(Friendship, connection):
+    """Give every friendship of ``Friendship`` exactly one row per direction.
+
+    Rows used to be stored in arbitrary (user1, user2) order, sometimes in
+    both. Self-friendships are dropped and the missing reverse of every pair
+    is inserted in one INSERT ... SELECT that copies the original row's
+    created_at, which auto_now_add would otherwise overwrite. Takes the model
+    so the benchmark can run it without a migration state.
+    """
+    Friendship.objects.filter(user1=models.F('user2')).delete()
+
+    qn = connection.ops.quote_name
+    table = qn(Friendship._meta.db_table)
+    user1, user2, created_at = (qn(Friendship._meta.get_field(name).column)
+                                for name in ('user1', 'user2', 'created_at'))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({user1}, {user2}, {created_at}) '
+            f'SELECT f.{user2}, f.{user1}, f.{created_at} FROM {table} f '
+            f'WHERE NOT EXISTS (SELECT 1 FROM {table} r WHERE r.{user1} = f.{user2} AND r.{user2} = f.{user1})'
+        )
+
+
+def mirror_friendships(apps, schema_editor):
+    mirror(apps.get_model('users', 'Friendship'), schema_editor.connection)
+
+
+def unmirror_friendships(apps, schema_editor):
+    Friendship = apps.get_model('users', 'Friendship')
+    Friendship.objects.filter(user1__gt=models.F('user2')).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_friendrequest_useractivity_friendship'),
+    ]
+
+    operations = [
+        migrations.RunPython(mirror_friendships, unmirror_friendships),
+        migrations.AddConstraint(
+            model_name='friendship',
+            constraint=models.CheckConstraint(condition=models.Q(('user1', models.F('user2')), _negated=True), name='friendship_not_self'),
+        ),
+    ]
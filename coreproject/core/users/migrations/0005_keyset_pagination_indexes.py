@@ -0,0 +1,21 @@
+# Generated by Django 5.1 on 2026-10-18 15:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_friendship_mirrored_edges'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='friendrequest',
+            index=models.Index(fields=['receiver', 'status', 'created_at', 'id'], name='friendrequest_inbox_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='friendship',
+            index=models.Index(fields=['user1', 'created_at', 'id'], name='friendship_recent_idx'),
+        ),
+    ]
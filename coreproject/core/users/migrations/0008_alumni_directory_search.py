@@ -0,0 +1,46 @@
+# Generated by Django 5.1 on 2026-10-18 16:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_friendsuggestion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlumniSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=16)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='alumniprofile',
+            index=models.Index(fields=['graduation_year', 'major'], name='alumni_year_major_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='alumniprofile',
+            index=models.Index(fields=['major'], name='alumni_major_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='alumniprofile',
+            index=models.Index(fields=['current_company'], name='alumni_company_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='alumniprofile',
+            index=models.Index(fields=['current_job_title'], name='alumni_job_title_idx'),
+        ),
+        migrations.AddField(
+            model_name='alumnisearchterm',
+            name='profile',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='users.alumniprofile'),
+        ),
+        migrations.AddConstraint(
+            model_name='alumnisearchterm',
+            constraint=models.UniqueConstraint(fields=('term', 'profile'), name='alumnisearchterm_term_profile_uniq'),
+        ),
+    ]
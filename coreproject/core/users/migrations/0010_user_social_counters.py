@@ -0,0 +1,49 @@
+# Generated by Django 5.1 on 2026-10-18 16:37
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    # Same expressions as users.counters.expected_counts, over the historical models
+    User = apps.get_model('users', 'User')
+    Friendship = apps.get_model('users', 'Friendship')
+    FriendRequest = apps.get_model('users', 'FriendRequest')
+
+    def count(queryset, column):
+        return Coalesce(models.Subquery(queryset.filter(**{column: models.OuterRef('pk')}).order_by()
+                                        .values(column).annotate(count=models.Count('pk')).values('count')),
+                        models.Value(0), output_field=models.IntegerField())
+
+    pending = FriendRequest.objects.filter(status='PENDING')
+    User.objects.update(
+        friends_count=count(Friendship.objects.all(), 'user1'),
+        pending_received_count=count(pending, 'receiver'),
+        pending_sent_count=count(pending, 'sender'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0009_notification_inbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='friends_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='pending_received_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='pending_sent_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
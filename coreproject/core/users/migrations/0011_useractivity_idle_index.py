@@ -0,0 +1,17 @@
+# Generated by Django 5.1 on 2026-10-18 16:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0010_user_social_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='useractivity',
+            index=models.Index(fields=['is_active', 'last_activity'], name='useractivity_idle_idx'),
+        ),
+    ]
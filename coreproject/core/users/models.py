@@ -1,7 +1,7 @@
 from django.contrib.auth.base_user import BaseUserManager
-from django.contrib.auth.hashers import make_password, check_password
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX, identify_hasher
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 
 
@@ -21,14 +21,44 @@ class User(AbstractUser):
     avatar = models.CharField(max_length=255)
     cover_image = models.CharField(max_length=255, blank=True, null=True)
 
+    # Maintained by users.counters, never by saving the user
+    friends_count = models.PositiveIntegerField(default=0, editable=False)
+    pending_received_count = models.PositiveIntegerField(default=0, editable=False)
+    pending_sent_count = models.PositiveIntegerField(default=0, editable=False)
+
+    DEFAULT_LECTURER_PASSWORD = "123456"
+
     def __str__(self):
         return f'{self.get_full_name()} - {self.role}'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._stored_password = instance.__dict__.get('password')
+        return instance
+
     def save(self, *args, **kwargs):
-        if not self.verified and self.role == User.Roles.LECTURER:
-            self.password = make_password("123456")
-        self.password = make_password(self.password)
+        # Hash only when a raw password was assigned since the row was loaded;
+        # set_password() and unchanged rows already hold a hash.
+        if self._state.adding and not self.verified and self.role == User.Roles.LECTURER:
+            self.set_password(self.DEFAULT_LECTURER_PASSWORD)
+        elif self.password_is_raw():
+            self.set_password(self.password or None)
         super().save(*args, **kwargs)
+        self._stored_password = self.password
+
+    def password_is_raw(self):
+        if self.password == getattr(self, '_stored_password', None):
+            return False
+        if not self.password:
+            return True
+        if self.password.startswith(UNUSABLE_PASSWORD_PREFIX):
+            return False
+        try:
+            identify_hasher(self.password)
+        except ValueError:
+            return True
+        return False
 
 
 class UserActivity(models.Model):
@@ -42,6 +72,20 @@ class UserActivity(models.Model):
     class Meta:
         verbose_name = 'User Activity'
         verbose_name_plural = 'User Activities'
+        indexes = [
+            # Range scanned by PresenceTracker.sweep for users gone idle
+            models.Index(fields=['is_active', 'last_activity'], name='useractivity_idle_idx'),
+        ]
+
+
+class MediaAsset(models.Model):
+    """An uploaded file, keyed by the SHA-256 of its content so repeats are stored once."""
+    content_hash = models.CharField(max_length=64, unique=True)
+    url = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.url
 
 
 class AlumniManager(BaseUserManager):
@@ -57,6 +101,25 @@ class AlumniProfile(models.Model):
     current_job_title = models.CharField(max_length=100)
     current_company = models.CharField(max_length=100)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['graduation_year', 'major'], name='alumni_year_major_idx'),
+            models.Index(fields=['major'], name='alumni_major_idx'),
+            models.Index(fields=['current_company'], name='alumni_company_idx'),
+            models.Index(fields=['current_job_title'], name='alumni_job_title_idx'),
+        ]
+
+
+class AlumniSearchTerm(models.Model):
+    """Inverted index row: ``profile`` has a word starting with ``term`` (see ``users.search``)."""
+    term = models.CharField(max_length=16)
+    profile = models.ForeignKey(AlumniProfile, related_name='search_terms', on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['term', 'profile'], name='alumnisearchterm_term_profile_uniq'),
+        ]
+
 
 class Alumni(User):
     objects = AlumniManager()
@@ -103,17 +166,121 @@ class FriendRequest(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['receiver', 'status', 'created_at', 'id'], name='friendrequest_inbox_idx'),
+        ]
+
     def __str__(self):
         return f"{self.sender} -> {self.receiver}"
 
 
+class Notification(models.Model):
+    class Kind(models.TextChoices):
+        FRIEND_REQUEST = "FRIEND_REQUEST", "Friend request"
+        FRIEND_REQUEST_ACCEPTED = "FRIEND_REQUEST_ACCEPTED", "Friend request accepted"
+
+    recipient = models.ForeignKey(User, related_name='notifications', on_delete=models.CASCADE)
+    kind = models.CharField(max_length=30, choices=Kind.choices)
+    payload = models.JSONField(default=dict)
+    # Not auto_now_add, so a batch can share one timestamp (see users.notifications)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['recipient', 'created_at', 'id'], name='notification_inbox_idx'),
+        ]
+
+
+class NotificationReadState(models.Model):
+    """Per-user high-water mark: notifications with ``id <= last_read_id`` have been read."""
+    user = models.OneToOneField(User, primary_key=True, related_name='notification_read_state',
+                                on_delete=models.CASCADE)
+    last_read_id = models.BigIntegerField(default=0)
+
+
+class FriendshipManager(models.Manager):
+    """Friendships are stored as one row per direction, so every lookup filters on
+    ``user1`` alone and is a range scan of the ``(user1, user2)`` unique index."""
+
+    def befriend(self, user_id, other_id):
+        return bool(self.befriend_many([(user_id, other_id)]))
+
+    def befriend_many(self, pairs):
+        """Stores both rows of every pair not already friends; returns those pairs.
+
+        Both users of every pair are locked first, in id order, so concurrent
+        calls for the same pair (in either direction) queue up and only the
+        first one sees it as new.
+        """
+        pairs = list({frozenset(pair): pair for pair in pairs}.values())
+        if not pairs:
+            return []
+        with transaction.atomic(savepoint=False):
+            list(User.objects.select_for_update().filter(id__in={user_id for pair in pairs for user_id in pair})
+                 .order_by('id').values_list('id', flat=True))
+            # A locking read, so MySQL's repeatable read does not answer from an older snapshot
+            existing = set(self.select_for_update().filter(
+                user1_id__in={a for a, _ in pairs}, user2_id__in={b for _, b in pairs}
+            ).values_list('user1_id', 'user2_id'))
+            pairs = [pair for pair in pairs if tuple(pair) not in existing]
+            self.bulk_create([
+                self.model(user1_id=a, user2_id=b) for pair in pairs for a, b in (pair, pair[::-1])
+            ], ignore_conflicts=True)
+        return pairs
+
+    def unfriend(self, user_id, other_id):
+        deleted, _ = self.filter(user1_id__in=(user_id, other_id), user2_id__in=(user_id, other_id)).delete()
+        return deleted > 0
+
+    def friend_ids(self, user_id):
+        return self.filter(user1_id=user_id).values_list('user2_id', flat=True)
+
+    def are_friends(self, user_id, other_id):
+        return self.filter(user1_id=user_id, user2_id=other_id).exists()
+
+
+class FriendSuggestion(models.Model):
+    """Precomputed "people you may know" entries, rewritten by ``users.suggestions.recompute``."""
+    user = models.ForeignKey(User, related_name='friend_suggestions', on_delete=models.CASCADE)
+    suggested = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    rank = models.PositiveSmallIntegerField()
+    mutual_friends = models.PositiveIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'rank'], name='friendsuggestion_rank_uniq'),
+        ]
+
+
 class Friendship(models.Model):
     user1 = models.ForeignKey(User, related_name='friendship_user1', on_delete=models.CASCADE)
     user2 = models.ForeignKey(User, related_name='friendship_user2', on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = FriendshipManager()
+
     class Meta:
         unique_together = ('user1', 'user2')
+        indexes = [
+            models.Index(fields=['user1', 'created_at', 'id'], name='friendship_recent_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(condition=~models.Q(user1=models.F('user2')), name='friendship_not_self'),
+        ]
 
     def __str__(self):
         return f"{self.user1} <-> {self.user2}"
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if adding:
+            # Keep the mirrored edge in step with rows created one at a time (e.g. from the admin)
+            Friendship.objects.bulk_create([Friendship(user1_id=self.user2_id, user2_id=self.user1_id)],
+                                           ignore_conflicts=True)
+
+    def delete(self, *args, **kwargs):
+        Friendship.objects.filter(user1_id=self.user2_id, user2_id=self.user1_id).delete()
+        return super().delete(*args, **kwargs)
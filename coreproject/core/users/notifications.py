@@ -0,0 +1,78 @@
+"""
+Stored notifications with offline replay.
+
+``notify_users`` writes one ``Notification`` per recipient in a single INSERT
+and hands the whole batch to ``users.dispatch`` for the recipients'
+``user_{id}`` groups, which sends it once the transaction commits, so
+rolled-back work never notifies. Events are encoded once here
+(see ``users.encoding``), not per receiving socket. Sockets that were not connected
+get what they missed when they next connect (see ``NotificationConsumer``);
+events carry the notification id so clients can drop duplicates.
+
+Read state is ``NotificationReadState``, a per-user high-water mark on
+notification ids: marking everything up to an id as read is a single-row
+UPDATE however many notifications it covers.
+"""
+from django.db import connection
+from django.utils import timezone
+
+from .dispatch import dispatcher
+from .encoding import encoded_event
+from .models import Notification, NotificationReadState
+
+REPLAY_LIMIT = 100
+
+
+def notification_group(user_id):
+    return f'user_{user_id}'
+
+
+def notification_event(notification):
+    return encoded_event('send_notification', {
+        'id': notification.id,
+        'kind': notification.kind,
+        'payload': notification.payload,
+    })
+
+
+def notify_users(kind, payloads):
+    """Store and, after commit, push one ``kind`` notification per ``{user_id: payload}`` item."""
+    if not payloads:
+        return []
+
+    created_at = timezone.now()
+    notifications = Notification.objects.bulk_create(
+        Notification(recipient_id=user_id, kind=kind, payload=payload, created_at=created_at)
+        for user_id, payload in payloads.items()
+    )
+    if not connection.features.can_return_rows_from_bulk_insert:
+        # MySQL does not report the new ids; the batch shares its timestamp
+        notifications = list(Notification.objects.filter(
+            recipient_id__in=list(payloads), kind=kind, created_at=created_at
+        ))
+
+    dispatcher.publish((notification_group(notification.recipient_id), notification_event(notification))
+                       for notification in notifications)
+    return notifications
+
+
+def last_read_id(user_id):
+    return NotificationReadState.objects.filter(user_id=user_id).values_list('last_read_id', flat=True).first() or 0
+
+
+def mark_read(user_id, up_to):
+    """Move ``user_id``'s high-water mark forward to ``up_to``; it never moves back."""
+    updated = NotificationReadState.objects.filter(user_id=user_id, last_read_id__lt=up_to) \
+        .update(last_read_id=up_to)
+    if not updated:
+        NotificationReadState.objects.get_or_create(user_id=user_id, defaults={'last_read_id': up_to})
+
+
+def unread_count(user_id):
+    return Notification.objects.filter(recipient_id=user_id, id__gt=last_read_id(user_id)).count()
+
+
+def unseen(user_id, since=0, limit=REPLAY_LIMIT):
+    """Oldest-first notifications past both the read mark and ``since``, at most ``limit``."""
+    after = max(last_read_id(user_id), since)
+    return list(Notification.objects.filter(recipient_id=user_id, id__gt=after).order_by('id')[:limit])
@@ -0,0 +1,264 @@
+"""
+Write-behind presence tracking.
+
+Authenticated requests only record the user's last activity timestamp in the
+shared store; ``PresenceBuffer.flush`` (run periodically by Celery beat) drains
+the buffer into ``UserActivity`` with bulk statements.
+
+Who is online is ``PresenceTracker``'s job. WebSocket heartbeats and HTTP
+activity refresh a per-user status key that expires after ``PRESENCE_TTL``
+seconds, and the refresh reports the previous status, so only transitions
+are published; repeated "active" pings never reach clients. Users whose
+heartbeats stop are found by ``PresenceTracker.sweep`` (Celery beat) through
+the ``(is_active, last_activity)`` index and marked offline in bulk, with one
+offline event each. ``PresenceTracker.stats`` counts how many updates were
+enqueued, how many were coalesced away (requests inside a user's
+``PRESENCE_GRANULARITY`` window included) and how many became events.
+"""
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .dispatch import dispatcher
+from .encoding import encoded_event
+from .graph import LOADED_MARKER, friend_graph, friends_key
+from .models import UserActivity
+from .store import get_store
+
+PRESENCE_BUFFER_KEY = 'presence:dirty'
+ONLINE_KEY = 'presence:online'
+STATS_KEY = 'presence:stats'
+
+PRESENCE_STATUSES = ('active', 'away', 'offline')
+
+
+def status_key(user_id):
+    return f'presence:status:{user_id}'
+
+
+def sockets_key(user_id):
+    return f'presence:sockets:{user_id}'
+
+
+def presence_group(user_id):
+    """Channel-layer group joined by the sockets of ``user_id``'s friends."""
+    return f'presence_{user_id}'
+
+
+def presence_event(user_id, status):
+    return encoded_event('presence.status', {
+        'user_id': user_id,
+        'status': status
+    })
+
+
+class PresenceBuffer:
+    # Upper bound on the per-process "last recorded" memo.
+    MAX_MEMO_SIZE = 100_000
+
+    def __init__(self):
+        self._recorded = {}
+        self._skipped = 0
+        self._lock = threading.Lock()
+
+    @property
+    def granularity(self):
+        return getattr(settings, 'PRESENCE_GRANULARITY', 60)
+
+    def touch(self, user_id, now=None):
+        """Record activity for ``user_id``; returns False when the write was skipped."""
+        now = time.time() if now is None else now
+
+        with self._lock:
+            last = self._recorded.get(user_id)
+            if last is not None and now - last < self.granularity:
+                # Counted into the shared stats in bulk (see flush_stats), not with a store write per request
+                self._skipped += 1
+                return False
+            if len(self._recorded) >= self.MAX_MEMO_SIZE:
+                self._recorded.clear()
+            self._recorded[user_id] = now
+
+        get_store().hset(PRESENCE_BUFFER_KEY, user_id, repr(now))
+        return True
+
+    def drain(self):
+        pipe = get_store().pipeline()
+        pipe.hgetall(PRESENCE_BUFFER_KEY)
+        pipe.delete(PRESENCE_BUFFER_KEY)
+        pending, _ = pipe.execute()
+        return {int(user_id): float(ts) for user_id, ts in pending.items()}
+
+    def flush_stats(self):
+        """Add this process's skipped touches to the enqueued updates in ``PresenceTracker.stats``."""
+        with self._lock:
+            skipped, self._skipped = self._skipped, 0
+        if skipped:
+            get_store().hincrby(STATS_KEY, 'enqueued', skipped)
+
+    def flush(self, batch_size=1000):
+        """Persist buffered timestamps; returns the number of users written."""
+        self.flush_stats()
+        pending = self.drain()
+        if not pending:
+            return 0
+
+        stamps = {
+            user_id: datetime.fromtimestamp(ts, tz=dt_timezone.utc)
+            for user_id, ts in pending.items()
+        }
+        granularity = timedelta(seconds=self.granularity)
+
+        with transaction.atomic():
+            existing = UserActivity.objects.filter(user_id__in=stamps).only('id', 'user_id', 'last_activity',
+                                                                             'is_active')
+            to_update = []
+            for activity in existing:
+                stamp = stamps.pop(activity.user_id)
+                if activity.is_active and activity.last_activity and activity.last_activity > stamp - granularity:
+                    continue
+                activity.last_activity = stamp
+                activity.is_active = True
+                to_update.append(activity)
+
+            UserActivity.objects.bulk_update(to_update, ['last_activity', 'is_active'], batch_size=batch_size)
+            UserActivity.objects.bulk_create(
+                [UserActivity(user_id=user_id, last_activity=stamp, is_active=True)
+                 for user_id, stamp in stamps.items()],
+                batch_size=batch_size,
+                ignore_conflicts=True,
+            )
+
+        return len(to_update) + len(stamps)
+
+    def forget(self):
+        with self._lock:
+            self._recorded.clear()
+            self._skipped = 0
+
+
+class PresenceTracker:
+    """Online status in the shared store, kept alive by heartbeats and expired by TTL.
+
+    Every method returns the events of the transitions it caused; callers
+    publish them (``dispatcher.publish`` from sync code, ``group_send`` from
+    consumers).
+    """
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'PRESENCE_TTL', 120)
+
+    def heartbeat(self, user_id, status='active'):
+        """Refresh ``user_id``'s status for another TTL."""
+        pipe = get_store().pipeline()
+        pipe.set(status_key(user_id), status, ex=self.ttl, get=True)
+        pipe.sadd(ONLINE_KEY, user_id)
+        pipe.hincrby(STATS_KEY, 'enqueued', 1)
+        previous, _, _ = pipe.execute()
+        if previous == status:
+            return []
+        get_store().hincrby(STATS_KEY, 'sent', 1)
+        return [(presence_group(user_id), presence_event(user_id, status))]
+
+    def connect(self, user_id):
+        get_store().incr(sockets_key(user_id))
+        return self.heartbeat(user_id)
+
+    def disconnect(self, user_id):
+        """Goes offline when the user's last socket closes; other tabs keep them online."""
+        if get_store().incr(sockets_key(user_id), -1) > 0:
+            return []
+        return self.go_offline([user_id])
+
+    def go_offline(self, user_ids):
+        pipe = get_store().pipeline()
+        for user_id in user_ids:
+            pipe.srem(ONLINE_KEY, user_id)
+            pipe.delete(status_key(user_id), sockets_key(user_id))
+        pipe.hincrby(STATS_KEY, 'enqueued', len(user_ids))
+        removed = pipe.execute()[:-1][::2]
+        # Whoever takes the user out of the online set publishes the transition, exactly once
+        events = [(presence_group(user_id), presence_event(user_id, 'offline'))
+                  for user_id, was_online in zip(user_ids, removed) if was_online]
+        if events:
+            get_store().hincrby(STATS_KEY, 'sent', len(events))
+        return events
+
+    def stats(self):
+        """Counters since the store (or ``reset_stats``) was last reset.
+
+        ``enqueued`` counts status updates: heartbeats, offline requests and
+        HTTP requests the per-user ``PRESENCE_GRANULARITY`` window kept from
+        becoming heartbeats. ``sent`` counts those that changed the status and
+        were published, and ``coalesced`` the rest, which reached no client.
+        Other processes' skipped requests arrive with their next buffer flush.
+        """
+        presence_buffer.flush_stats()
+        counters = {key: int(value) for key, value in get_store().hgetall(STATS_KEY).items()}
+        enqueued, sent = counters.get('enqueued', 0), counters.get('sent', 0)
+        return {'enqueued': enqueued, 'coalesced': enqueued - sent, 'sent': sent}
+
+    def reset_stats(self):
+        get_store().delete(STATS_KEY)
+
+    def online_ids(self):
+        return {int(user_id) for user_id in get_store().smembers(ONLINE_KEY)}
+
+    def online_friends(self, user_id):
+        """``{friend_id: status}`` for ``user_id``'s online friends.
+
+        The store intersects the shared friend set (see ``users.graph``) with the
+        online set, which costs O(min(friends, online)); only the hits are then
+        looked up, dropping any whose status expired before the next sweep.
+        """
+        key = friends_key(user_id)
+        pipe = get_store().pipeline()
+        pipe.sinter(key, ONLINE_KEY)
+        pipe.sismember(key, LOADED_MARKER)
+        online, loaded = pipe.execute()
+        if not loaded:
+            friend_graph.load(user_id)
+            online = get_store().sinter(key, ONLINE_KEY)
+
+        friend_ids = sorted(int(member) for member in online if member != LOADED_MARKER)
+        pipe = get_store().pipeline()
+        for friend_id in friend_ids:
+            pipe.get(status_key(friend_id))
+        return {friend_id: status for friend_id, status in zip(friend_ids, pipe.execute()) if status is not None}
+
+    def sweep(self, batch_size=1000):
+        """Mark users without a heartbeat for a TTL offline; returns how many were."""
+        cutoff = timezone.now() - timedelta(seconds=self.ttl)
+        idle = UserActivity.objects.filter(is_active=True, last_activity__lt=cutoff) \
+            .order_by('last_activity', 'id').values_list('id', 'user_id', 'last_activity')
+
+        swept, after = 0, Q()
+        while True:
+            batch = list(idle.filter(after)[:batch_size])
+            if not batch:
+                return swept
+            last_id, _, last_activity = batch[-1]
+            after = Q(last_activity__gt=last_activity) | Q(last_activity=last_activity, id__gt=last_id)
+
+            # The database lags heartbeats by up to a flush; a live status key wins
+            pipe = get_store().pipeline()
+            for _, user_id, _ in batch:
+                pipe.get(status_key(user_id))
+            expired = [user_id for (_, user_id, _), status in zip(batch, pipe.execute()) if status is None]
+            if not expired:
+                continue
+
+            UserActivity.objects.filter(user_id__in=expired, is_active=True, last_activity__lt=cutoff) \
+                .update(is_active=False)
+            dispatcher.publish(self.go_offline(expired))
+            swept += len(expired)
+
+
+presence_buffer = PresenceBuffer()
+presence_tracker = PresenceTracker()
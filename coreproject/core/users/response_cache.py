@@ -0,0 +1,94 @@
+"""
+Per-user response cache for the current-user and profile endpoints.
+
+Cached payloads are keyed by a per-user version counter kept in the shared
+store. Anything that changes a user or their profile bumps the counter after
+commit (see ``users.signals``), so stale entries are never read again and
+simply expire. Version keys expire too, after twice the body timeout, so ids
+that are looked up once (or never existed) do not stay in the store. A hit
+costs one store read and one cache read, no ORM queries.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .store import get_store
+
+
+def version_key(user_id):
+    return f'user:version:{user_id}'
+
+
+class ResponseCache:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')]
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300)
+
+    @property
+    def version_ttl(self):
+        # Outlives every body cached under the version
+        return 2 * self.timeout
+
+    def version(self, user_id):
+        version = get_store().get(version_key(user_id))
+        if version is None:
+            return self._initialize(user_id)
+        return int(version)
+
+    def bump(self, user_id):
+        self._initialize(user_id)
+        pipe = get_store().pipeline()
+        pipe.incr(version_key(user_id))
+        pipe.expire(version_key(user_id), self.version_ttl)
+        return pipe.execute()[0]
+
+    def _initialize(self, user_id):
+        # Counters start from the clock, not 0, so a store that lost its keys
+        # never hands out a version that still has entries in the cache; the
+        # same goes for a key that expired.
+        pipe = get_store().pipeline()
+        pipe.set(version_key(user_id), time.time_ns() // 1000, ex=self.version_ttl, nx=True)
+        pipe.get(version_key(user_id))
+        return int(pipe.execute()[1])
+
+    def key(self, name, user_id):
+        return f'response:{name}:{user_id}:{self.version(user_id)}'
+
+    def get(self, name, user_id):
+        key = self.key(name, user_id)
+        data = self.cache.get(key)
+        with self._lock:
+            if data is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+        return key, data
+
+    def set(self, key, data):
+        self.cache.set(key, data, self.timeout)
+
+    def reset_stats(self):
+        self._hits = self._misses = 0
+
+    def stats(self):
+        with self._lock:
+            hits, misses = self._hits, self._misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': hits / (hits + misses) if hits + misses else 0.0,
+        }
+
+
+response_cache = ResponseCache()
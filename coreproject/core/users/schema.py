@@ -0,0 +1,113 @@
+"""
+Prebuilt OpenAPI schema.
+
+``manage.py generate_schema`` introspects the API once with drf_yasg (which
+only the development settings profile installs) and writes ``openapi.json``
+and ``openapi.yaml`` to ``OPENAPI_SCHEMA_DIR``, where they are committed.
+Every profile serves those files as they are: each is read, hashed and
+gzipped once per version on disk, and clients holding the current ETag get a
+304. ``SchemaTests`` fails when the committed files fall behind the code.
+"""
+import gzip
+import hashlib
+import os
+import threading
+
+from django.conf import settings
+
+FORMATS = {
+    '.json': 'application/json',
+    '.yaml': 'application/yaml',
+}
+
+
+def schema_path(format):
+    return os.path.join(settings.OPENAPI_SCHEMA_DIR, f'openapi{format}')
+
+
+def api_info():
+    from drf_yasg import openapi
+
+    return openapi.Info(
+        title="Social Network API",
+        default_version='v1',
+        description="APIs for Social Media",
+        contact=openapi.Contact(email="2151010040chinh@ou.edu.vn"),
+        license=openapi.License(name="Trần Chinh@2023"),
+    )
+
+
+def generate():
+    """``{format: bytes}`` of the schema of the code as it is now."""
+    from drf_yasg.app_settings import swagger_settings
+    from drf_yasg.codecs import OpenAPICodecJson, OpenAPICodecYaml
+
+    generator = swagger_settings.DEFAULT_GENERATOR_CLASS(api_info())
+    schema = generator.get_schema(request=None, public=True)
+    return {
+        '.json': OpenAPICodecJson(validators=[], pretty=True).encode(schema) + b'\n',
+        '.yaml': OpenAPICodecYaml(validators=[]).encode(schema),
+    }
+
+
+def committed():
+    """``{format: bytes}`` of the schema files on disk; missing ones are ``None``."""
+    documents = {}
+    for format in FORMATS:
+        try:
+            with open(schema_path(format), 'rb') as fp:
+                documents[format] = fp.read()
+        except FileNotFoundError:
+            documents[format] = None
+    return documents
+
+
+def write(documents):
+    os.makedirs(settings.OPENAPI_SCHEMA_DIR, exist_ok=True)
+    for format, content in documents.items():
+        with open(schema_path(format), 'wb') as fp:
+            fp.write(content)
+
+
+def accepts_gzip(accept_encoding):
+    """Whether an ``Accept-Encoding`` header allows gzip, honouring q-values (``gzip;q=0`` refuses it)."""
+    qualities = {}
+    for coding in accept_encoding.split(','):
+        name, _, params = coding.partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name.strip().lower()] = quality
+    return qualities.get('gzip', qualities.get('*', 0.0)) > 0
+
+
+class SchemaFile:
+    """One schema file with its ETag and gzipped body, reloaded when the file changes."""
+
+    def __init__(self, format):
+        self.format = format
+        self.version = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        path = schema_path(self.format)
+        stat = os.stat(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            if version != self.version:
+                with open(path, 'rb') as fp:
+                    self.content = fp.read()
+                # mtime=0 keeps the gzipped bytes identical across workers
+                self.gzipped = gzip.compress(self.content, mtime=0)
+                # Weak: the same ETag covers the identity and gzip encodings
+                self.etag = f'W/"{hashlib.sha256(self.content).hexdigest()[:32]}"'
+                self.version = version
+        return self
+
+
+schema_files = {format: SchemaFile(format) for format in FORMATS}
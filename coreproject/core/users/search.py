@@ -0,0 +1,78 @@
+"""
+Alumni directory search over a built-in inverted index.
+
+Each profile has one ``AlumniSearchTerm`` row per distinct word prefix
+(``MIN_PREFIX`` to ``MAX_PREFIX`` characters) of its owner's name, major,
+company and job title. Name words are indexed a second time under
+``NAME_MARKER`` so the ``name`` filter can be scoped to them. A query word is
+one range of the ``(term, profile)`` index, and several words are ANDed by
+joining their posting lists in profile order, so a page costs a few index
+probes instead of a ``LIKE '%…%'`` scan. Words are lowercased and stripped of
+accents ("Nguyễn" matches "nguyen"); query words longer than ``MAX_PREFIX``
+match on their first ``MAX_PREFIX`` characters.
+
+Rows are rebuilt when a profile or its owner's name changes (see
+``users.signals``); ``manage.py index_alumni`` backfills existing profiles.
+"""
+import re
+import unicodedata
+
+from django.db.models import F
+
+from .models import AlumniProfile, AlumniSearchTerm
+
+MIN_PREFIX = 2
+MAX_PREFIX = 10
+NAME_MARKER = '@'
+NAME_FIELDS = ('first_name', 'last_name')
+PROFILE_FIELDS = ('major', 'current_company', 'current_job_title')
+
+
+def words(text):
+    text = unicodedata.normalize('NFKD', (text or '').replace('đ', 'd').replace('Đ', 'D'))
+    return re.findall(r'\w+', ''.join(char for char in text if not unicodedata.combining(char)).lower())
+
+
+def prefixes(word):
+    return {word[:length] for length in range(MIN_PREFIX, min(len(word), MAX_PREFIX) + 1)}
+
+
+def profile_terms(profile):
+    name_words = words(' '.join(getattr(profile.user, field) or '' for field in NAME_FIELDS))
+    other_words = words(' '.join(getattr(profile, field) or '' for field in PROFILE_FIELDS))
+
+    terms = set()
+    for word in name_words + other_words:
+        terms |= prefixes(word)
+    for word in name_words:
+        terms |= {NAME_MARKER + prefix for prefix in prefixes(word)}
+    return terms
+
+
+def query_terms(text, marker=''):
+    return sorted({marker + word[:MAX_PREFIX] for word in words(text) if len(word) >= MIN_PREFIX})
+
+
+def index_profiles(profiles):
+    """Rebuild the index rows of ``profiles``, which should have ``user`` loaded."""
+    profiles = list(profiles)
+    AlumniSearchTerm.objects.filter(profile_id__in=[profile.id for profile in profiles]).delete()
+    AlumniSearchTerm.objects.bulk_create(
+        (AlumniSearchTerm(term=term, profile_id=profile.id) for profile in profiles for term in profile_terms(profile)),
+        batch_size=5000,
+    )
+
+
+def search_alumni(q='', name='', **filters):
+    """Profiles matching every word of ``q`` (any field) and ``name``, and the exact ``filters``.
+
+    Results are annotated with ``position``, the profile id read from one
+    word's index rows, so ordering on it follows that index and stops at the
+    page size instead of sorting every match.
+    """
+    profiles = AlumniProfile.objects.filter(**{field: value for field, value in filters.items() if value})
+    terms = query_terms(q) + query_terms(name, NAME_MARKER)
+    for term in terms:
+        # One join per word, each a (term, profile) index lookup
+        profiles = profiles.filter(search_terms__term=term)
+    return profiles.annotate(position=F('search_terms__profile_id') if terms else F('id'))
@@ -1,26 +1,37 @@
 from rest_framework import serializers
 
+from .metrics import InstrumentedSerializerMixin
 from .models import *
 
+BULK_LIMIT = 100
 
-class UserSerializer(serializers.ModelSerializer):
+
+class InstrumentedModelSerializer(InstrumentedSerializerMixin, serializers.ModelSerializer):
+    pass
+
+
+class InstrumentedSerializer(InstrumentedSerializerMixin, serializers.Serializer):
+    pass
+
+
+class UserSerializer(InstrumentedModelSerializer):
     class Meta:
         model = User
         fields = ['username', 'email', 'first_name', 'last_name', 'phone_number', 'role',
-                  'avatar']
+                  'avatar', 'friends_count', 'pending_received_count', 'pending_sent_count']
         extra_kwargs = {
             'password': {'write_only': True},
             'role': {'read_only': True}
         }
 
 
-class AlumniProfileSerializer(serializers.ModelSerializer):
+class AlumniProfileSerializer(InstrumentedModelSerializer):
     class Meta:
         model = AlumniProfile
         fields = ['address', 'graduation_year', 'major', 'current_job_title', 'current_company']
 
 
-class LecturerProfileSerializer(serializers.ModelSerializer):
+class LecturerProfileSerializer(InstrumentedModelSerializer):
     class Meta:
         model = LecturerProfile
         fields = ['department', 'bio']
@@ -42,13 +53,23 @@ class LecturerSerializer(UserSerializer):
         fields = UserSerializer.Meta.fields + ['more']
 
 
-class UserFriendSerializer(serializers.ModelSerializer):
+class UserFriendSerializer(InstrumentedModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'first_name', 'last_name', 'avatar']
 
 
-class FriendRequestSerializer(serializers.ModelSerializer):
+class OnlineFriendSerializer(UserFriendSerializer):
+    status = serializers.SerializerMethodField()
+
+    class Meta(UserFriendSerializer.Meta):
+        fields = UserFriendSerializer.Meta.fields + ['status']
+
+    def get_status(self, user):
+        return self.context['statuses'][user.id]
+
+
+class FriendRequestSerializer(InstrumentedModelSerializer):
     sender = UserFriendSerializer()
     receiver = UserFriendSerializer()
 
@@ -57,10 +78,58 @@ class FriendRequestSerializer(serializers.ModelSerializer):
         fields = ['id', 'sender', 'receiver', 'created_at', 'status']
 
 
-class FriendshipSerializer(serializers.ModelSerializer):
+class FriendRequestBulkSendSerializer(InstrumentedSerializer):
+    receivers = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=BULK_LIMIT)
+
+
+class FriendRequestBulkActionSerializer(InstrumentedSerializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=BULK_LIMIT)
+
+
+class FriendshipSerializer(InstrumentedModelSerializer):
     user1 = UserFriendSerializer()
     user2 = UserFriendSerializer()
 
     class Meta:
         model = Friendship
         fields = ['id', 'user1', 'user2', 'created_at']
+
+
+class FriendSuggestionSerializer(InstrumentedModelSerializer):
+    suggested = UserFriendSerializer()
+
+    class Meta:
+        model = FriendSuggestion
+        fields = ['suggested', 'mutual_friends', 'score']
+
+
+class AlumniSearchSerializer(InstrumentedSerializer):
+    q = serializers.CharField(required=False, allow_blank=True, max_length=100)
+    name = serializers.CharField(required=False, allow_blank=True, max_length=100)
+    graduation_year = serializers.CharField(required=False, allow_blank=True, max_length=4)
+    major = serializers.CharField(required=False, allow_blank=True, max_length=100)
+    current_company = serializers.CharField(required=False, allow_blank=True, max_length=100)
+    current_job_title = serializers.CharField(required=False, allow_blank=True, max_length=100)
+
+
+class AlumniDirectorySerializer(InstrumentedModelSerializer):
+    user = UserFriendSerializer()
+
+    class Meta:
+        model = AlumniProfile
+        fields = ['id', 'user', 'graduation_year', 'major', 'current_company', 'current_job_title']
+
+
+class NotificationSerializer(InstrumentedModelSerializer):
+    read = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Notification
+        fields = ['id', 'kind', 'payload', 'created_at', 'read']
+
+    def get_read(self, notification):
+        return notification.id <= self.context.get('last_read_id', 0)
+
+
+class NotificationReadSerializer(InstrumentedSerializer):
+    up_to = serializers.IntegerField(required=False, min_value=0)
@@ -0,0 +1,58 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from oauth2_provider.models import AccessToken
+
+from .authentication import token_cache, token_key
+from .models import AlumniProfile, LecturerProfile, User
+from .response_cache import response_cache
+from .search import NAME_FIELDS, index_profiles
+
+
+@receiver([post_save, post_delete], sender=AccessToken)
+def evict_access_token(sender, instance, **kwargs):
+    # Revoking and refreshing both delete the old access token
+    token_cache.evict(token_key(instance.token))
+
+
+@receiver(post_save, sender=User)
+def evict_user_tokens(sender, instance, created, **kwargs):
+    if not created:
+        token_cache.evict_user(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=User)
+def bump_user_version(sender, instance, **kwargs):
+    transaction.on_commit(lambda: response_cache.bump(instance.pk))
+
+
+@receiver([post_save, post_delete], sender=AlumniProfile)
+@receiver([post_save, post_delete], sender=LecturerProfile)
+def bump_profile_version(sender, instance, **kwargs):
+    transaction.on_commit(lambda: response_cache.bump(instance.user_id))
+
+
+@receiver(post_save, sender=AlumniProfile)
+def index_alumni_profile(sender, instance, **kwargs):
+    index_profiles([instance])
+
+
+@receiver(post_init, sender=User)
+def remember_indexed_name(sender, instance, **kwargs):
+    # Read from __dict__ so deferred name fields are not loaded; they count as changed
+    instance._indexed_name = {field: instance.__dict__.get(field) for field in NAME_FIELDS}
+
+
+@receiver(post_save, sender=User)
+def reindex_alumni_name(sender, instance, created, update_fields=None, **kwargs):
+    saved = [field for field in NAME_FIELDS if update_fields is None or field in update_fields]
+    indexed = instance._indexed_name
+    changed = any(instance.__dict__.get(field) != indexed[field] for field in saved)
+    indexed.update({field: instance.__dict__.get(field) for field in saved})
+    # A new user has no profile yet; other saves only reindex when the name did change
+    if created or not changed:
+        return
+    profile = AlumniProfile.objects.filter(user=instance).first()
+    if profile is not None:
+        profile.user = instance
+        index_profiles([profile])
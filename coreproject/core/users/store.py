@@ -0,0 +1,195 @@
+"""
+Shared key/value store used by the presence and friend-graph code.
+
+In production this is Redis (``USERS_STORE_URL``). When the setting is empty an
+in-process ``LocalStore`` implementing the subset of Redis commands we use is
+returned instead, so tests and single-process development need no server.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+_store = None
+_store_lock = threading.Lock()
+
+
+class LocalStore:
+    """Thread-safe, in-process stand-in for the Redis commands used by the app.
+
+    Values are stored as strings, mirroring a client created with
+    ``decode_responses=True``.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._expires = {}
+        self._lock = threading.RLock()
+
+    def _get(self, key):
+        deadline = self._expires.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+        return self._data.get(key)
+
+    def pipeline(self, transaction=True):
+        return LocalPipeline(self)
+
+    def flushall(self):
+        with self._lock:
+            self._data.clear()
+            self._expires.clear()
+
+    def delete(self, *keys):
+        with self._lock:
+            deleted = 0
+            for key in keys:
+                if self._get(key) is not None:
+                    deleted += 1
+                self._data.pop(key, None)
+                self._expires.pop(key, None)
+            return deleted
+
+    def expire(self, key, seconds):
+        with self._lock:
+            if self._get(key) is None:
+                return False
+            self._expires[key] = time.monotonic() + seconds
+            return True
+
+    def ttl(self, key):
+        with self._lock:
+            if self._get(key) is None:
+                return -2
+            deadline = self._expires.get(key)
+            return -1 if deadline is None else max(round(deadline - time.monotonic()), 0)
+
+    def get(self, key):
+        with self._lock:
+            return self._get(key)
+
+    def set(self, key, value, ex=None, nx=False, get=False):
+        with self._lock:
+            previous = self._get(key)
+            if nx and previous is not None:
+                return None
+            self._data[key] = str(value)
+            if ex is None:
+                self._expires.pop(key, None)
+            else:
+                self._expires[key] = time.monotonic() + ex
+            return previous if get else True
+
+    def incr(self, key, amount=1):
+        with self._lock:
+            value = int(self._get(key) or 0) + amount
+            self._data[key] = str(value)
+            return value
+
+    def hincrby(self, name, key, amount=1):
+        with self._lock:
+            if self._get(name) is None:
+                self._data[name] = {}
+            bucket = self._data[name]
+            bucket[str(key)] = str(int(bucket.get(str(key), 0)) + amount)
+            return int(bucket[str(key)])
+
+    def hset(self, name, key=None, value=None, mapping=None):
+        items = dict(mapping or {})
+        if key is not None:
+            items[key] = value
+        with self._lock:
+            if self._get(name) is None:
+                self._data[name] = {}
+            bucket = self._data[name]
+            added = sum(1 for k in items if str(k) not in bucket)
+            bucket.update({str(k): str(v) for k, v in items.items()})
+            return added
+
+    def hgetall(self, name):
+        with self._lock:
+            return dict(self._get(name) or {})
+
+    def sadd(self, name, *values):
+        with self._lock:
+            if self._get(name) is None:
+                self._data[name] = set()
+            members = self._data[name]
+            added = {str(v) for v in values} - members
+            members.update(added)
+            return len(added)
+
+    def srem(self, name, *values):
+        with self._lock:
+            members = self._get(name)
+            if members is None:
+                return 0
+            removed = {str(v) for v in values} & members
+            members.difference_update(removed)
+            if not members:
+                self.delete(name)
+            return len(removed)
+
+    def scard(self, name):
+        with self._lock:
+            return len(self._get(name) or ())
+
+    def smembers(self, name):
+        with self._lock:
+            return set(self._get(name) or ())
+
+    def sismember(self, name, value):
+        with self._lock:
+            return str(value) in (self._get(name) or ())
+
+    def sinter(self, *names):
+        with self._lock:
+            # Like Redis, set.intersection walks the smaller set and probes the larger
+            return set.intersection(*(self._get(name) or set() for name in names))
+
+
+class LocalPipeline:
+    """Buffers commands and runs them atomically against a ``LocalStore``."""
+
+    def __init__(self, store):
+        self._store = store
+        self._commands = []
+
+    def __getattr__(self, name):
+        method = getattr(self._store, name)
+
+        def queue(*args, **kwargs):
+            self._commands.append((method, args, kwargs))
+            return self
+
+        return queue
+
+    def execute(self):
+        with self._store._lock:
+            results = [method(*args, **kwargs) for method, args, kwargs in self._commands]
+        self._commands = []
+        return results
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                url = getattr(settings, 'USERS_STORE_URL', None)
+                if url:
+                    import redis
+                    _store = redis.Redis.from_url(url, decode_responses=True)
+                else:
+                    _store = LocalStore()
+    return _store
+
+
+@receiver(setting_changed)
+def reset_store(*, setting, **kwargs):
+    global _store
+    if setting == 'USERS_STORE_URL':
+        _store = None
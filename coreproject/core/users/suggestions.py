@@ -0,0 +1,129 @@
+"""
+"People you may know", precomputed in batch.
+
+``recompute`` loads the friend graph into a sparse adjacency matrix ``A`` and
+walks it in blocks of ``FRIEND_SUGGESTIONS_BLOCK_SIZE`` users: ``A[block] · A``
+counts the mutual friends of every friend-of-friend pair, existing friends
+and the user themself are masked out, and a shared graduation year, major or
+company adds its ``COHORT_WEIGHTS`` entry to the score. The best
+``FRIEND_SUGGESTIONS_K`` candidates per user replace that block's rows in
+``FriendSuggestion``, which the suggestions endpoint reads through its
+``(user, rank)`` index.
+
+Users are addressed by their position in the sorted id array, so memory is
+the int32 adjacency matrix, one int32 code per user and cohort field, and one
+block's product; at a million users with a hundred friends each that is
+well under 2 GB.
+"""
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from scipy import sparse
+
+from .models import AlumniProfile, FriendSuggestion, Friendship, User
+
+COHORT_WEIGHTS = {
+    'graduation_year': 1.0,
+    'major': 1.0,
+    'current_company': 2.0,
+}
+
+CHUNK_SIZE = 100_000
+
+
+def load_user_ids():
+    return np.fromiter(User.objects.order_by('id').values_list('id', flat=True).iterator(chunk_size=CHUNK_SIZE),
+                       dtype=np.int64)
+
+
+def load_adjacency(user_ids):
+    """Symmetric CSR matrix of the friend graph; ``Friendship`` already stores both directions."""
+    rows, cols = [], []
+    edges = Friendship.objects.order_by('id').values_list('id', 'user1_id', 'user2_id')
+    last_id = 0
+    while True:
+        chunk = np.array(list(edges.filter(id__gt=last_id)[:CHUNK_SIZE]), dtype=np.int64).reshape(-1, 3)
+        if not len(chunk):
+            break
+        last_id = int(chunk[-1, 0])
+        rows.append(np.searchsorted(user_ids, chunk[:, 1]).astype(np.int32))
+        cols.append(np.searchsorted(user_ids, chunk[:, 2]).astype(np.int32))
+
+    rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.int32)
+    cols = np.concatenate(cols) if cols else np.empty(0, dtype=np.int32)
+    return sparse.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, cols)),
+                             shape=(len(user_ids), len(user_ids)))
+
+
+def load_cohorts(user_ids):
+    """One integer code per user and ``COHORT_WEIGHTS`` field; -1 where the user has no value."""
+    codes = {field: np.full(len(user_ids), -1, dtype=np.int32) for field in COHORT_WEIGHTS}
+    vocabularies = {field: {} for field in COHORT_WEIGHTS}
+
+    profiles = AlumniProfile.objects.values_list('user_id', *COHORT_WEIGHTS).iterator(chunk_size=CHUNK_SIZE)
+    while True:
+        chunk = [profile for _, profile in zip(range(CHUNK_SIZE), profiles)]
+        if not chunk:
+            break
+        positions = np.searchsorted(user_ids, [profile[0] for profile in chunk])
+        for column, field in enumerate(COHORT_WEIGHTS, start=1):
+            vocabulary = vocabularies[field]
+            codes[field][positions] = [
+                vocabulary.setdefault(value.strip().lower(), len(vocabulary)) if value and value.strip() else -1
+                for value in (profile[column] for profile in chunk)
+            ]
+    return codes
+
+
+def top_candidates(adjacency, cohorts, start, stop, k):
+    """Best ``k`` candidates for users ``start:stop`` as ``(users, candidates, mutual, scores, ranks)`` arrays."""
+    block = adjacency[start:stop]
+    mutual = block @ adjacency
+    mutual = (mutual - mutual.multiply(block)).tocoo()
+
+    users = mutual.row.astype(np.int64) + start
+    keep = (mutual.data > 0) & (mutual.col != users)
+    users, candidates, counts = users[keep], mutual.col[keep], mutual.data[keep]
+
+    scores = counts.astype(np.float32)
+    for field, weight in COHORT_WEIGHTS.items():
+        codes = cohorts[field]
+        scores += weight * ((codes[users] == codes[candidates]) & (codes[users] >= 0))
+
+    # Per user, best score first; ties go to the lower id so reruns are stable
+    order = np.lexsort((candidates, -scores, users))
+    users, candidates, counts, scores = users[order], candidates[order], counts[order], scores[order]
+    ranks = np.arange(len(users)) - np.searchsorted(users, users, side='left')
+    keep = ranks < k
+    return users[keep], candidates[keep], counts[keep], scores[keep], ranks[keep]
+
+
+def recompute(k=None, block_size=None):
+    """Rebuild every user's suggestions; returns the number of rows written."""
+    k = k or settings.FRIEND_SUGGESTIONS_K
+    block_size = block_size or settings.FRIEND_SUGGESTIONS_BLOCK_SIZE
+
+    user_ids = load_user_ids()
+    if not len(user_ids):
+        return 0
+    adjacency = load_adjacency(user_ids)
+    cohorts = load_cohorts(user_ids)
+
+    written = 0
+    for start in range(0, len(user_ids), block_size):
+        stop = min(start + block_size, len(user_ids))
+        users, candidates, counts, scores, ranks = top_candidates(adjacency, cohorts, start, stop, k)
+        with transaction.atomic():
+            FriendSuggestion.objects.filter(
+                user_id__gte=int(user_ids[start]), user_id__lte=int(user_ids[stop - 1])
+            ).delete()
+            FriendSuggestion.objects.bulk_create(
+                (FriendSuggestion(user_id=user_id, suggested_id=suggested_id, rank=rank,
+                                  mutual_friends=count, score=score)
+                 for user_id, suggested_id, rank, count, score in zip(
+                    user_ids[users].tolist(), user_ids[candidates].tolist(), ranks.tolist(),
+                    counts.tolist(), scores.tolist())),
+                batch_size=5000,
+            )
+        written += len(users)
+    return written
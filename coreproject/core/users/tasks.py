@@ -1,7 +1,42 @@
+import logging
+
 from celery import shared_task
-from .views import send_activity_status
+from .media import attach_user_media, discard_staged
+from .presence import presence_buffer, presence_tracker
+
+
+logger = logging.getLogger(__name__)
+
+MEDIA_UPLOAD_RETRIES = 5
+
+
+@shared_task
+def flush_presence_task():
+    return presence_buffer.flush()
 
 
 @shared_task
-def send_activity_status_task(user_id):
-    send_activity_status(user_id)
+def sweep_presence_task():
+    return presence_tracker.sweep()
+
+
+@shared_task(bind=True, max_retries=MEDIA_UPLOAD_RETRIES)
+def upload_user_media_task(self, user_id, field, path, content_hash):
+    try:
+        return attach_user_media(user_id, field, path, content_hash)
+    except Exception as exc:
+        if self.request.retries < self.max_retries:
+            # 10s, 20s, 40s, ... between attempts
+            raise self.retry(exc=exc, countdown=10 * 2 ** self.request.retries)
+        # The user keeps the placeholder; nothing will pick the staged file up any more
+        discard_staged([path])
+        logger.exception('Gave up uploading %s of user %s after %d retries', field, user_id, self.max_retries)
+        return None
+
+
+@shared_task
+def recompute_friend_suggestions_task():
+    # numpy and scipy are loaded by the worker that runs this, not by every importer of tasks
+    from .suggestions import recompute
+
+    return recompute()
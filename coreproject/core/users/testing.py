@@ -0,0 +1,44 @@
+import time
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class QueryBudget:
+    """Fails the block when it runs more than ``budget`` queries and records DB time.
+
+        with QueryBudget(2) as budget:
+            client.get(url)
+        budget.count, budget.db_time
+    """
+
+    def __init__(self, budget, using=DEFAULT_DB_ALIAS):
+        self.budget = budget
+        self.connection = connections[using]
+        self.queries = []
+
+    def __enter__(self):
+        self.queries = []
+        self._wrapper = self.connection.execute_wrapper(self._record)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._wrapper.__exit__(exc_type, exc_value, traceback)
+        if exc_type is None and self.budget is not None and self.count > self.budget:
+            statements = '\n'.join(f'{i}. {sql}' for i, (sql, _) in enumerate(self.queries, start=1))
+            raise AssertionError(f'{self.count} queries executed, budget is {self.budget}:\n{statements}')
+
+    def _record(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - start))
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def db_time(self):
+        return sum(duration for _, duration in self.queries)
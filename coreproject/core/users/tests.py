@@ -1,3 +1,1171 @@
-from django.test import TestCase
+import contextlib
+import gzip
+import importlib
+import io
+import json
+import os
+import pstats
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
-# Create your tests here.
+import msgpack
+
+from asgiref.sync import async_to_sync
+from celery.signals import after_task_publish, before_task_publish
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import AnonymousUser
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from oauth2_provider.models import AccessToken, Application
+from rest_framework.test import APIClient
+
+from . import benchmarks, counters, metrics, schema, tasks
+from .authentication import TokenAuthMiddleware, token_cache
+from .consumers import UserActivityConsumer
+from .counters import COUNTER_FIELDS, reconcile
+from .daos import FriendshipDAO
+from .dispatch import dispatcher
+from .encoding import binary_subscribers, decode_event, encoded_event
+from .graph import friend_graph
+from .media import stage_upload
+from .models import AlumniProfile, FriendRequest, FriendSuggestion, Friendship, Notification, User, UserActivity
+from .notifications import mark_read, notify_users
+from .presence import presence_buffer, presence_tracker
+from .response_cache import response_cache, version_key
+from .routing import websocket_urlpatterns
+from .suggestions import recompute
+from .testing import QueryBudget
+from .store import get_store
+
+
+mirror_migration = importlib.import_module('users.migrations.0004_friendship_mirrored_edges')
+
+
+def notifications_sent(get_channel_layer):
+    """``(group, message)`` of every notification sent through a mocked channel layer, presence aside."""
+    return [(call.args[0], decode_event(call.args[1]))
+            for call in get_channel_layer().group_send.call_args_list if call.args[0].startswith('user_')]
+
+
+@override_settings(USERS_STORE_URL='', CHANNEL_DISPATCH_BACKGROUND=False,
+                   CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class StoreTestCase(TestCase):
+    """Runs against the in-process store, reset between tests."""
+
+    def setUp(self):
+        get_store().flushall()
+        friend_graph.clear_local()
+        presence_buffer.forget()
+        binary_subscribers.forget()
+        response_cache.cache.clear()
+
+    def make_users(self, count, prefix='user'):
+        return [User.objects.create(username=f'{prefix}{i}', avatar='') for i in range(count)]
+
+
+class FriendGraphTests(StoreTestCase):
+
+    def test_loads_once_then_serves_from_cache(self):
+        a, b, c = self.make_users(3)
+        Friendship.objects.create(user1=a, user2=b)
+        Friendship.objects.create(user1=c, user2=a)
+
+        self.assertEqual(FriendshipDAO.get_friend_ids(a.id), {b.id, c.id})
+        friend_graph.clear_local()
+        with self.assertNumQueries(0):
+            self.assertEqual(FriendshipDAO.get_friend_ids(a.id), {b.id, c.id})
+
+    def test_empty_friend_set_is_cached(self):
+        a, = self.make_users(1)
+        self.assertEqual(FriendshipDAO.get_friend_ids(a.id), frozenset())
+        friend_graph.clear_local()
+        with self.assertNumQueries(0):
+            self.assertEqual(FriendshipDAO.get_friend_ids(a.id), frozenset())
+
+    def test_create_and_delete_update_both_sides(self):
+        a, b = self.make_users(2)
+        FriendshipDAO.get_friend_ids(a.id)
+        FriendshipDAO.get_friend_ids(b.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            FriendshipDAO.create_friendship(a, b)
+        with self.assertNumQueries(0):
+            self.assertTrue(FriendshipDAO.are_friends(a.id, b.id))
+            self.assertTrue(FriendshipDAO.are_friends(b.id, a.id))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(FriendshipDAO.delete_friendship(b, a))
+        friend_graph.clear_local()
+        with self.assertNumQueries(0):
+            self.assertFalse(FriendshipDAO.are_friends(a.id, b.id))
+            self.assertEqual(FriendshipDAO.get_friend_ids(b.id), frozenset())
+
+
+class FriendshipStorageTests(StoreTestCase):
+
+    def test_each_friendship_is_stored_once_per_direction(self):
+        a, b = self.make_users(2)
+        Friendship.objects.befriend(a.id, b.id)
+        Friendship.objects.befriend(b.id, a.id)
+
+        self.assertEqual(Friendship.objects.count(), 2)
+        self.assertEqual(list(Friendship.objects.friend_ids(a.id)), [b.id])
+        self.assertEqual(list(Friendship.objects.friend_ids(b.id)), [a.id])
+
+        self.assertTrue(Friendship.objects.unfriend(b.id, a.id))
+        self.assertFalse(Friendship.objects.filter(user1__in=(a, b)).exists())
+
+    def test_single_row_writes_keep_the_mirror(self):
+        a, b = self.make_users(2)
+        friendship = Friendship.objects.create(user1=a, user2=b)
+        self.assertTrue(Friendship.objects.are_friends(b.id, a.id))
+
+        friendship.delete()
+        self.assertEqual(Friendship.objects.count(), 0)
+
+    def test_mirroring_copies_created_at_and_leaves_the_model_alone(self):
+        a, b, c, d = self.make_users(4)
+        # Stored the old way: one row, either direction
+        Friendship.objects.bulk_create([Friendship(user1=a, user2=b)])
+        long_ago = timezone.now() - timezone.timedelta(days=365)
+        Friendship.objects.update(created_at=long_ago)
+
+        mirror_migration.mirror(Friendship, connection)
+        self.assertEqual(Friendship.objects.get(user1=b, user2=a).created_at, long_ago)
+
+        Friendship.objects.befriend(c.id, d.id)
+        self.assertGreater(Friendship.objects.get(user1=d, user2=c).created_at, long_ago)
+
+
+class KeysetPaginationTests(StoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user, *self.others = self.make_users(6)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def collect(self, url):
+        ids, pages = [], 0
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(any('COUNT(' in query['sql'] for query in queries.captured_queries))
+            ids += [row['id'] if 'id' in row else row['username'] for row in response.data['results']]
+            url, pages = response.data['next'], pages + 1
+        return ids, pages
+
+    def test_received_requests(self):
+        requests = [FriendRequest.objects.create(sender=other, receiver=self.user) for other in self.others]
+
+        ids, pages = self.collect('/api/v1/friend-request/received-requests/?pagination=cursor&page_size=2')
+        self.assertEqual(ids, [request.id for request in reversed(requests)])
+        self.assertEqual(pages, 3)
+
+        page = self.client.get('/api/v1/friend-request/received-requests/').data['results']
+        self.assertEqual([row['id'] for row in page], [request.id for request in reversed(requests)])
+
+    def test_list_friends(self):
+        for other in self.others:
+            Friendship.objects.befriend(self.user.id, other.id)
+
+        usernames, pages = self.collect('/api/v1/friendship/friends/?pagination=cursor&page_size=4')
+        self.assertEqual(usernames, [other.username for other in reversed(self.others)])
+        self.assertEqual(pages, 2)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/v1/friendship/friends/?cursor=garbage')
+        self.assertEqual(response.status_code, 404)
+
+
+class UserActivityConsumerTests(StoreTestCase):
+
+    async def connect(self, user, online=()):
+        communicator = WebsocketCommunicator(UserActivityConsumer.as_asgi(), '/ws/activity/')
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual(await communicator.receive_json_from(), {'type': 'snapshot', 'online': list(online)})
+        return communicator
+
+    async def test_status_changes_reach_friends_only(self):
+        alice, bob, carol = await database_sync_to_async(self.make_users)(3)
+        await database_sync_to_async(Friendship.objects.befriend)(alice.id, bob.id)
+
+        alice_socket = await self.connect(alice)
+        carol_socket = await self.connect(carol)
+        bob_socket = await self.connect(bob, online=[{'user_id': alice.id, 'status': 'active'}])
+        self.assertEqual(await alice_socket.receive_json_from(), {'user_id': bob.id, 'status': 'active'})
+
+        await alice_socket.send_json_to({'type': 'snapshot'})
+        self.assertEqual(await alice_socket.receive_json_from(),
+                         {'type': 'snapshot', 'online': [{'user_id': bob.id, 'status': 'active'}]})
+        self.assertTrue(await bob_socket.receive_nothing())
+
+        await bob_socket.send_json_to({'status': 'away'})
+        await bob_socket.send_json_to({'status': 'away'})
+        self.assertEqual(await alice_socket.receive_json_from(), {'user_id': bob.id, 'status': 'away'})
+        self.assertTrue(await alice_socket.receive_nothing())
+        self.assertTrue(await carol_socket.receive_nothing())
+        self.assertTrue(await bob_socket.receive_nothing())
+
+        await bob_socket.disconnect()
+        self.assertEqual(await alice_socket.receive_json_from(), {'user_id': bob.id, 'status': 'offline'})
+        await alice_socket.disconnect()
+        await carol_socket.disconnect()
+
+    async def test_msgpack_is_negotiated_per_connection(self):
+        alice, bob = await database_sync_to_async(self.make_users)(2)
+        await database_sync_to_async(Friendship.objects.befriend)(alice.id, bob.id)
+
+        communicator = WebsocketCommunicator(UserActivityConsumer.as_asgi(), '/ws/activity/', subprotocols=['msgpack'])
+        communicator.scope['user'] = alice
+        connected, subprotocol = await communicator.connect()
+        self.assertEqual(subprotocol, 'msgpack')
+        self.assertEqual(msgpack.unpackb(await communicator.receive_from()), {'type': 'snapshot', 'online': []})
+        bob_socket = await self.connect(bob, online=[{'user_id': alice.id, 'status': 'active'}])
+
+        self.assertEqual(msgpack.unpackb(await communicator.receive_from()), {'user_id': bob.id, 'status': 'active'})
+        await communicator.send_to(bytes_data=msgpack.packb({'status': 'away'}))
+        self.assertEqual(await bob_socket.receive_json_from(), {'user_id': alice.id, 'status': 'away'})
+        # Packed once by the publisher while a msgpack socket is open, and not at all after
+        self.assertIn('binary', encoded_event('presence.status', {}))
+        await communicator.disconnect()
+        await bob_socket.disconnect()
+        binary_subscribers.forget()
+        self.assertNotIn('binary', encoded_event('presence.status', {}))
+
+    async def test_bearer_tokens_authenticate_the_socket(self):
+        alice, = await database_sync_to_async(self.make_users)(1)
+        await database_sync_to_async(AccessToken.objects.create)(
+            user=alice, token='socket-token', scope='read write', expires=timezone.now() + timezone.timedelta(hours=1))
+        application = TokenAuthMiddleware(URLRouter(websocket_urlpatterns))
+
+        for path, headers in (('/ws/activity/', [(b'authorization', b'Bearer socket-token')]),
+                              ('/ws/activity/?access_token=socket-token', [])):
+            communicator = WebsocketCommunicator(application, path, headers=headers)
+            communicator.scope['user'] = AnonymousUser()
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected, path)
+            self.assertEqual(await communicator.receive_json_from(), {'type': 'snapshot', 'online': []})
+            await communicator.disconnect()
+
+        communicator = WebsocketCommunicator(application, '/ws/activity/?access_token=wrong-token')
+        connected, _ = await communicator.connect()
+        self.assertFalse(connected)
+
+    async def test_anonymous_connections_are_closed(self):
+        communicator = WebsocketCommunicator(UserActivityConsumer.as_asgi(), '/ws/activity/')
+        communicator.scope['user'] = AnonymousUser()
+        connected, _ = await communicator.connect()
+        self.assertFalse(connected)
+
+
+@mock.patch('users.dispatch.get_channel_layer')
+class PresenceTrackerTests(StoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.alice, self.bob = self.make_users(2)
+
+    def statuses(self, events):
+        return [decode_event(event)['status'] for _, event in events]
+
+    def test_only_transitions_are_published(self, get_channel_layer):
+        self.assertEqual(self.statuses(presence_tracker.heartbeat(self.alice.id)), ['active'])
+        self.assertEqual(presence_tracker.heartbeat(self.alice.id), [])
+        self.assertEqual(self.statuses(presence_tracker.heartbeat(self.alice.id, 'away')), ['away'])
+
+        # Two tabs: offline only when the last one closes
+        self.assertEqual(self.statuses(presence_tracker.connect(self.bob.id)), ['active'])
+        self.assertEqual(presence_tracker.connect(self.bob.id), [])
+        self.assertEqual(presence_tracker.disconnect(self.bob.id), [])
+        self.assertEqual(self.statuses(presence_tracker.disconnect(self.bob.id)), ['offline'])
+        self.assertEqual(presence_tracker.online_ids(), {self.alice.id})
+        self.assertEqual(presence_tracker.stats(), {'enqueued': 6, 'coalesced': 2, 'sent': 4})
+
+    def test_http_activity_is_a_heartbeat(self, get_channel_layer):
+        get_channel_layer.return_value.group_send = mock.AsyncMock()
+        client = APIClient()
+        client.force_authenticate(self.alice)
+        for _ in range(3):
+            with self.captureOnCommitCallbacks(execute=True):
+                client.get('/api/v1/notifications/unread-count/')
+        group, event = get_channel_layer().group_send.call_args.args
+        self.assertEqual((group, decode_event(event)['status']), (f'presence_{self.alice.id}', 'active'))
+        self.assertEqual(get_channel_layer().group_send.call_count, 1)
+        self.assertEqual(presence_tracker.online_ids(), {self.alice.id})
+        self.assertEqual(presence_tracker.stats(), {'enqueued': 3, 'coalesced': 2, 'sent': 1})
+
+    def test_sweep_marks_expired_users_offline_once(self, get_channel_layer):
+        get_channel_layer.return_value.group_send = mock.AsyncMock()
+        stale = timezone.now() - timezone.timedelta(seconds=presence_tracker.ttl + 1)
+        UserActivity.objects.bulk_create([UserActivity(user=self.alice, last_activity=stale, is_active=True),
+                                          UserActivity(user=self.bob, last_activity=stale, is_active=True)])
+        presence_tracker.heartbeat(self.alice.id)
+        presence_tracker.heartbeat(self.bob.id)
+        get_store().delete(f'presence:status:{self.alice.id}')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(presence_tracker.sweep(batch_size=1), 1)
+        self.assertEqual(list(UserActivity.objects.filter(is_active=True).values_list('user_id', flat=True)),
+                         [self.bob.id])
+        group, event = get_channel_layer().group_send.call_args.args
+        self.assertEqual((group, decode_event(event)['status']), (f'presence_{self.alice.id}', 'offline'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(presence_tracker.sweep(), 0)
+        self.assertEqual(get_channel_layer().group_send.call_count, 1)
+
+    def test_online_friends_intersects_presence_with_the_friend_set(self, get_channel_layer):
+        carol, dave, erin = self.make_users(3, prefix='friend')
+        for friend in (self.bob, carol, dave):
+            Friendship.objects.befriend(self.alice.id, friend.id)
+        for user in (self.bob, carol, erin):
+            presence_tracker.heartbeat(user.id)
+        presence_tracker.heartbeat(carol.id, 'away')
+        # Expired but not swept yet
+        get_store().delete(f'presence:status:{self.bob.id}')
+
+        # Loads the friend set on first use, then reads it from the store
+        self.assertEqual(presence_tracker.online_friends(self.alice.id), {carol.id: 'away'})
+        with self.assertNumQueries(0):
+            self.assertEqual(presence_tracker.online_friends(self.alice.id), {carol.id: 'away'})
+
+        client = APIClient()
+        client.force_authenticate(self.alice)
+        with self.assertNumQueries(1):
+            response = client.get('/api/v1/friendship/online/')
+        self.assertEqual([(friend['id'], friend['status']) for friend in response.json()], [(carol.id, 'away')])
+
+
+class UserPasswordTests(TestCase):
+
+    def test_saving_does_not_rehash(self):
+        user = User.objects.create_user(username='alice', password='secret', avatar='')
+        hashed = user.password
+        user.first_name = 'Alice'
+        user.save()
+        user = User.objects.get(pk=user.pk)
+        user.save()
+
+        self.assertEqual(User.objects.get(pk=user.pk).password, hashed)
+        self.assertTrue(user.check_password('secret'))
+
+    def test_raw_assignment_is_hashed(self):
+        user = User.objects.create_user(username='bob', password='secret', avatar='')
+        user.password = 'changed'
+        user.save()
+        self.assertTrue(User.objects.get(pk=user.pk).check_password('changed'))
+
+    def test_new_lecturers_get_the_default_password(self):
+        lecturer = User.objects.create(username='carol', role=User.Roles.LECTURER, avatar='')
+        self.assertTrue(lecturer.check_password(User.DEFAULT_LECTURER_PASSWORD))
+
+        lecturer.set_password('own-password')
+        lecturer.save()
+        self.assertTrue(User.objects.get(pk=lecturer.pk).check_password('own-password'))
+
+
+class RegistrationMediaTests(StoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.staging_dir = f'{media_root}/staging'
+        settings = override_settings(
+            MEDIA_ROOT=media_root,
+            MEDIA_STAGING_DIR=self.staging_dir,
+            MEDIA_STORAGE_BACKEND='users.media.LocalMediaStorage',
+            DEFAULT_AVATAR_URL='/static/default-avatar.png',
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def register(self, username, content, status_code=201):
+        avatar = SimpleUploadedFile('avatar.png', content, content_type='image/png') if isinstance(content, bytes) \
+            else content
+        with self.captureOnCommitCallbacks(execute=True):
+            response = APIClient().post('/api/v1/users/register/', {
+                'username': username, 'password': 'secret', 'email': f'{username}@example.com',
+                'first_name': username, 'last_name': 'Test', 'phone_number': '0123456789', 'avatar': avatar,
+            }, format='multipart')
+        self.assertEqual(response.status_code, status_code, response.data)
+        return response
+
+    @mock.patch.object(tasks.upload_user_media_task, 'delay',
+                       side_effect=lambda *args: tasks.upload_user_media_task.apply(args))
+    def test_avatar_is_uploaded_after_commit_and_deduplicated(self, delay):
+        response = self.register('alice', b'same bytes')
+        self.assertEqual(response.data['avatar'], '/static/default-avatar.png')
+        avatar = User.objects.get(username='alice').avatar
+        self.assertTrue(avatar.startswith('/media/avatar/'))
+
+        response = self.register('bob', b'same bytes')
+        self.assertEqual(response.data['avatar'], avatar)
+        self.assertEqual(User.objects.get(username='bob').avatar, avatar)
+        self.assertEqual(delay.call_count, 1)
+
+    def test_failed_uploads_are_retried_then_discarded(self):
+        path, content_hash = stage_upload(SimpleUploadedFile('avatar.png', b'bytes'))
+        user, = self.make_users(1)
+        with mock.patch('users.media.LocalMediaStorage.upload', side_effect=OSError) as upload, \
+                mock.patch('users.tasks.logger') as logger:
+            tasks.upload_user_media_task.apply((user.id, 'avatar', path, content_hash))
+        self.assertEqual(upload.call_count, tasks.MEDIA_UPLOAD_RETRIES + 1)
+        self.assertFalse(os.path.exists(path))
+        logger.exception.assert_called_once()
+        self.assertEqual(User.objects.get(pk=user.pk).avatar, user.avatar)
+
+    @mock.patch.object(tasks.upload_user_media_task, 'delay')
+    def test_rolled_back_registration_stages_nothing(self, delay):
+        with mock.patch('users.views.UserViewSet.get_serializer', side_effect=ValueError('boom')):
+            self.register('alice', b'new bytes', status_code=400)
+        self.assertFalse(User.objects.filter(username='alice').exists())
+        self.assertFalse(os.path.exists(self.staging_dir) and os.listdir(self.staging_dir))
+        delay.assert_not_called()
+
+    @mock.patch.object(tasks.upload_user_media_task, 'delay')
+    def test_avatar_url_is_kept(self, delay):
+        response = self.register('alice', 'https://example.com/alice.png')
+        self.assertEqual(response.data['avatar'], 'https://example.com/alice.png')
+        self.assertEqual(User.objects.get(username='alice').avatar, 'https://example.com/alice.png')
+        delay.assert_not_called()
+
+    def test_avatar_urls_must_be_https(self):
+        for i, avatar in enumerate(('javascript:alert(1)', 'http://example.com/a.png', 'not a url')):
+            self.register(f'user{i}', avatar, status_code=400)
+        self.assertFalse(User.objects.exists())
+
+
+class TokenCacheTests(StoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        token_cache.clear()
+        token_cache.reset_stats()
+        self.user = User.objects.create_user(username='alice', password='secret', avatar='', role=User.Roles.ADMIN)
+        application = Application.objects.create(
+            name='app', client_type=Application.CLIENT_CONFIDENTIAL,
+            authorization_grant_type=Application.GRANT_PASSWORD,
+        )
+        self.token = AccessToken.objects.create(
+            user=self.user, application=application, token='valid-token', scope='read write',
+            expires=timezone.now() + timezone.timedelta(hours=1),
+        )
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer valid-token')
+
+    def current_user(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/v1/users/current-user/')
+        return response, len(queries.captured_queries)
+
+    def test_second_request_skips_token_lookup(self):
+        response, cold_queries = self.current_user()
+        self.assertEqual(response.status_code, 200)
+        response, warm_queries = self.current_user()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['username'], 'alice')
+
+        self.assertLess(warm_queries, cold_queries)
+        stats = token_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+        self.assertEqual(stats['hit_ratio'], 0.5)
+
+    def test_revoked_token_is_evicted(self):
+        self.assertEqual(self.current_user()[0].status_code, 200)
+        self.token.revoke()
+        self.assertEqual(self.current_user()[0].status_code, 401)
+
+    def test_user_changes_are_not_served_stale(self):
+        self.current_user()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.first_name = 'Alicia'
+            self.user.save()
+        self.assertEqual(self.current_user()[0].data['first_name'], 'Alicia')
+
+
+class ResponseCacheTests(StoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        response_cache.reset_stats()
+        self.user = User.objects.create_user(username='alice', password='secret', avatar='')
+        self.profile = AlumniProfile.objects.create(user=self.user, graduation_year='2020', major='CS',
+                                                    current_job_title='Engineer', current_company='Acme')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_hits_do_not_touch_the_orm(self):
+        response = self.client.get('/api/v1/users/current-user/')
+        self.assertEqual(response.data['alumni']['current_company'], 'Acme')
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/v1/users/current-user/')
+        self.assertEqual(response.data['alumni']['current_company'], 'Acme')
+
+        self.client.get(f'/api/v1/users/{self.user.id}/')
+        with self.assertNumQueries(0):
+            response = self.client.get(f'/api/v1/users/{self.user.id}/')
+        self.assertEqual(response.data['username'], 'alice')
+
+        self.assertEqual(response_cache.stats(), {'hits': 2, 'misses': 2, 'hit_ratio': 0.5})
+
+    def test_profile_and_user_changes_bump_the_version(self):
+        self.client.get('/api/v1/users/current-user/')
+        self.client.get(f'/api/v1/users/{self.user.id}/')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile.current_company = 'Globex'
+            self.profile.save()
+        response = self.client.get('/api/v1/users/current-user/')
+        self.assertEqual(response.data['alumni']['current_company'], 'Globex')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.first_name = 'Alicia'
+            self.user.save()
+        self.assertEqual(self.client.get(f'/api/v1/users/{self.user.id}/').data['first_name'], 'Alicia')
+
+
+    def test_version_keys_expire(self):
+        missing_id = self.user.id + 1000
+        self.assertEqual(self.client.get(f'/api/v1/users/{missing_id}/').status_code, 404)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.first_name = 'Alicia'
+            self.user.save()
+        for user_id in (missing_id, self.user.id):
+            self.assertTrue(0 < get_store().ttl(version_key(user_id)) <= response_cache.version_ttl)
+
+
+class QueryBudgetTests(StoreTestCase):
+    """Every list endpoint runs a constant number of queries, whatever the page holds."""
+
+    BUDGETS = {
+        '/api/v1/friend-request/received-requests/': 2,
+        '/api/v1/friend-request/received-requests/?pagination=cursor': 1,
+        '/api/v1/friendship/': 2,
+        '/api/v1/friendship/friends/': 3,
+        '/api/v1/friendship/friends/?pagination=cursor': 1,
+        '/api/v1/users/suggestions/': 1,
+        '/api/v1/notifications/': 2,
+        '/api/v1/friendship/online/': 1,
+    }
+
+    def setUp(self):
+        super().setUp()
+        self.user, = self.make_users(1, prefix='owner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def grow_network(self, count, prefix):
+        for other in self.make_users(count, prefix=prefix):
+            FriendRequest.objects.create(sender=other, receiver=self.user)
+            Friendship.objects.befriend(self.user.id, other.id)
+            Notification.objects.create(recipient=self.user, kind=Notification.Kind.FRIEND_REQUEST,
+                                        payload={'sender_id': other.id})
+            presence_tracker.heartbeat(other.id)
+        ranked = FriendSuggestion.objects.filter(user=self.user).count()
+        FriendSuggestion.objects.bulk_create(
+            FriendSuggestion(user=self.user, suggested=stranger, rank=ranked + rank, mutual_friends=1, score=1.0)
+            for rank, stranger in enumerate(self.make_users(count, prefix=f'{prefix}stranger-'), start=1)
+        )
+        friend_graph.invalidate(self.user.id)
+
+    def test_list_endpoints_stay_within_budget(self):
+        for rows in (1, 9):
+            self.grow_network(rows, prefix=f'batch{rows}-')
+            for url, budget in self.BUDGETS.items():
+                with self.subTest(url=url, rows=rows), QueryBudget(budget) as queries:
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(queries.count, budget, url)
+
+
+class MetricsTests(StoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        metrics.clear()
+        self.alice, self.bob = self.make_users(2)
+        Friendship.objects.befriend(self.alice.id, self.bob.id)
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def series(self, histogram):
+        return {labels: (values[:-1], values[-1]) for labels, values in histogram.series.items()}
+
+    def test_requests_are_recorded_per_view_and_exported(self):
+        with QueryBudget(None) as budget:
+            self.client.get('/api/v1/friendship/friends/')
+        counts, _ = self.series(metrics.request_seconds)[('friendship-list-friends', 'GET', 200)]
+        self.assertEqual(sum(counts), 1)
+        counts, queries = self.series(metrics.request_queries)[('friendship-list-friends',)]
+        self.assertEqual(queries, budget.count)
+        _, serializer_seconds = self.series(metrics.request_serializer_seconds)[('friendship-list-friends',)]
+        self.assertGreater(serializer_seconds, 0)
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('# TYPE http_request_duration_seconds histogram', body)
+        self.assertIn('http_request_duration_seconds_count{view="friendship-list-friends",method="GET",status="200"} 1',
+                      body)
+        self.assertIn(f'http_request_db_queries_sum{{view="friendship-list-friends"}} {budget.count}', body)
+
+        with self.settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+    def test_slow_sampled_requests_are_profiled_to_disk(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with self.settings(METRICS_PROFILE_RATE=1, METRICS_PROFILE_THRESHOLD=0, METRICS_PROFILE_DIR=directory):
+            self.client.get('/api/v1/friendship/friends/')
+        with self.settings(METRICS_PROFILE_RATE=1, METRICS_PROFILE_THRESHOLD=60, METRICS_PROFILE_DIR=directory):
+            self.client.get('/api/v1/friendship/friends/')
+        [name] = os.listdir(directory)
+        self.assertIn('friendship-list-friends', name)
+        pstats.Stats(os.path.join(directory, name))
+
+    def test_consumers_tasks_and_channel_layer_are_timed(self):
+        async def connect():
+            communicator = WebsocketCommunicator(UserActivityConsumer.as_asgi(), '/ws/activity/')
+            communicator.scope['user'] = self.alice
+            await communicator.connect()
+            await communicator.receive_json_from()
+            await communicator.disconnect()
+
+        async_to_sync(connect)()
+        handlers = {labels[1] for labels in self.series(metrics.consumer_seconds)}
+        self.assertTrue({'websocket.connect', 'websocket.disconnect'} <= handlers)
+        self.assertIn((), self.series(metrics.channel_publish_seconds))
+
+        # task-0 failed to publish, so only its before signal fires
+        before_task_publish.send(sender='users.tasks.flush_presence_task', headers={'id': 'task-0'})
+        before_task_publish.send(sender='users.tasks.flush_presence_task', headers={'id': 'task-1'})
+        after_task_publish.send(sender='users.tasks.flush_presence_task', headers={'id': 'task-1'})
+        counts, _ = self.series(metrics.celery_enqueue_seconds)[('users.tasks.flush_presence_task',)]
+        self.assertEqual(sum(counts), 1)
+        self.assertIsNone(metrics._publishing.started)
+
+
+class BenchCommandTests(TestCase):
+
+    @mock.patch('users.management.commands.bench.benchmark_environment', lambda local: contextlib.nullcontext())
+    @mock.patch('users.benchmarks.load')
+    def test_runs_every_benchmark_by_default(self, load):
+        load.return_value.run.return_value = {'ok': True}
+        out = io.StringIO()
+        call_command('bench', '--local', stdout=out)
+        results = json.loads(out.getvalue())
+        self.assertEqual(set(results) - {'environment'}, set(benchmarks.BENCHMARKS))
+
+        with self.assertRaisesMessage(CommandError, 'Unknown benchmark(s): nope'):
+            call_command('bench', 'presence', 'nope')
+
+
+class SchemaTests(StoreTestCase):
+
+    def test_committed_schema_matches_the_code(self):
+        try:
+            documents = schema.generate()
+        except ImportError:
+            self.skipTest('drf_yasg is not installed')
+        self.assertEqual(schema.committed(), documents,
+                         'The API changed; run manage.py generate_schema and commit openapi/')
+
+    def test_schema_is_served_from_the_file_with_etag_and_gzip(self):
+        with open(schema.schema_path('.json'), 'rb') as fp:
+            content = fp.read()
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/swagger.json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, content)
+        etag = response['ETag']
+
+        response = self.client.get('/swagger.json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertIn('Accept-Encoding', response['Vary'])
+        response = self.client.get('/swagger.json', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), content)
+        self.assertEqual(response['ETag'], etag)
+        for refused in ('gzip;q=0, deflate', 'br, *;q=0', 'identity'):
+            response = self.client.get('/swagger.json', HTTP_ACCEPT_ENCODING=refused)
+            self.assertFalse(response.has_header('Content-Encoding'), refused)
+            self.assertEqual(response.content, content)
+            self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(
+            self.client.get('/swagger.json', HTTP_ACCEPT_ENCODING='*;q=0.5')['Content-Encoding'], 'gzip')
+        self.assertEqual(self.client.get('/swagger.yaml')['Content-Type'], 'application/yaml')
+
+
+@mock.patch('users.dispatch.get_channel_layer')
+class DispatcherTests(StoreTestCase):
+
+    def test_a_batch_is_one_callback_sent_after_commit(self, get_channel_layer):
+        get_channel_layer.return_value.group_send = mock.AsyncMock()
+        alice, bob = self.make_users(2)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            with transaction.atomic():
+                dispatcher.publish([(f'presence_{alice.id}', {}), (f'presence_{bob.id}', {})])
+            get_channel_layer().group_send.assert_not_called()
+        self.assertEqual(len(callbacks), 1)
+
+        callbacks[0]()
+        self.assertEqual([call.args[0] for call in get_channel_layer().group_send.call_args_list],
+                         [f'presence_{alice.id}', f'presence_{bob.id}'])
+
+    def test_rolled_back_batches_are_dropped(self, get_channel_layer):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                dispatcher.publish([('user_1', {'type': 'send_notification'})])
+                raise RuntimeError
+        self.assertEqual(callbacks, [])
+        get_channel_layer.assert_not_called()
+
+    @override_settings(CHANNEL_DISPATCH_BACKGROUND=True)
+    def test_background_thread_sends_and_survives_failures(self, get_channel_layer):
+        failed, sent = threading.Event(), threading.Event()
+
+        async def group_send(group, event):
+            if group == 'broken':
+                raise ConnectionError
+            sent.set()
+        get_channel_layer.return_value.group_send = group_send
+
+        with mock.patch('users.dispatch.logger') as logger:
+            logger.error.side_effect = lambda *args, **kwargs: failed.set()
+            dispatcher.submit([('broken', {})])
+            self.assertTrue(failed.wait(5))
+        dispatcher.submit([('user_1', {})])
+        self.assertTrue(sent.wait(5))
+
+
+@mock.patch('users.dispatch.get_channel_layer')
+class FriendRequestBulkTests(StoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user, *self.others = self.make_users(6)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, url, data):
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data['results'], len(queries.captured_queries)
+
+    def notified(self, get_channel_layer):
+        return {group: message['payload'] for group, message in notifications_sent(get_channel_layer)}
+
+    def test_bulk_send(self, get_channel_layer):
+        get_channel_layer.return_value.group_send = mock.AsyncMock()
+        friend, pending, rejected, new, *_ = self.others
+        Friendship.objects.befriend(self.user.id, friend.id)
+        FriendRequest.objects.create(sender=self.user, receiver=pending)
+        FriendRequest.objects.create(sender=self.user, receiver=rejected, status=FriendRequest.Status.REJECTED)
+
+        receivers = [friend.id, pending.id, rejected.id, new.id, new.id, self.user.id, 0]
+        results, queries = self.post('/api/v1/friend-request/bulk-send/', {'receivers': receivers})
+        self.assertEqual(results, [
+            {'receiver': friend.id, 'status': 'friends'},
+            {'receiver': pending.id, 'status': 'pending'},
+            {'receiver': rejected.id, 'status': 'resent'},
+            {'receiver': new.id, 'status': 'sent'},
+            {'receiver': self.user.id, 'status': 'self'},
+            {'receiver': 0, 'status': 'not_found'},
+        ])
+        self.assertEqual(FriendRequest.objects.filter(sender=self.user, status=FriendRequest.Status.PENDING).count(), 3)
+        self.assertEqual(set(self.notified(get_channel_layer)), {f'user_{rejected.id}', f'user_{new.id}'})
+
+        _, more_queries = self.post('/api/v1/friend-request/bulk-send/',
+                                    {'receivers': [user.id for user in self.make_users(20, prefix='more')]})
+        self.assertLessEqual(more_queries, queries)
+
+    def test_bulk_accept_and_reject(self, get_channel_layer):
+        get_channel_layer.return_value.group_send = mock.AsyncMock()
+        first, second, third, stranger, _ = self.others
+        accepted = [FriendRequest.objects.create(sender=sender, receiver=self.user) for sender in (first, first, second)]
+        rejected = FriendRequest.objects.create(sender=third, receiver=self.user)
+        processed = FriendRequest.objects.create(sender=stranger, receiver=self.user, status=FriendRequest.Status.REJECTED)
+        not_mine = FriendRequest.objects.create(sender=first, receiver=stranger)
+
+        results, _ = self.post('/api/v1/friend-request/bulk-accept/',
+                               {'ids': [request.id for request in accepted] + [processed.id, not_mine.id]})
+        self.assertEqual([result['status'] for result in results],
+                         ['accepted', 'accepted', 'accepted', 'processed', 'not_found'])
+        self.assertTrue(FriendshipDAO.are_friends(first.id, self.user.id))
+        self.assertTrue(FriendshipDAO.are_friends(self.user.id, second.id))
+        self.assertEqual(self.notified(get_channel_layer)[f'user_{first.id}']['friend_request_ids'],
+                         [accepted[0].id, accepted[1].id])
+        self.assertEqual(len(notifications_sent(get_channel_layer)), 2)
+
+        results, _ = self.post('/api/v1/friend-request/bulk-reject/', {'ids': [rejected.id, accepted[0].id]})
+        self.assertEqual([result['status'] for result in results], ['rejected', 'processed'])
+        self.assertFalse(FriendshipDAO.are_friends(third.id, self.user.id))
+        self.assertEqual(len(notifications_sent(get_channel_layer)), 2)
+
+
+@mock.patch('users.dispatch.get_channel_layer')
+class FriendRequestRespondTests(StoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.sender, self.receiver, self.stranger = self.make_users(3)
+        self.friend_request = FriendRequest.objects.create(sender=self.sender, receiver=self.receiver)
+        self.client = APIClient()
+        self.client.force_authenticate(self.receiver)
+
+    def post(self, action, client=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return (client or self.client).post(f'/api/v1/friend-request/{self.friend_request.id}/{action}/')
+
+    def test_pending_requests_are_accepted_once(self, get_channel_layer):
+        get_channel_layer.return_value.group_send = mock.AsyncMock()
+        with self.assertNumQueries(10):
+            self.assertEqual(self.post('accept').status_code, 200)
+        self.assertEqual(Friendship.objects.filter(user1__in=(self.sender, self.receiver)).count(), 2)
+        (group, message), = notifications_sent(get_channel_layer)
+        self.assertEqual(group, f'user_{self.sender.id}')
+        self.assertEqual(message['payload']['friend_request_ids'], [self.friend_request.id])
+
+        self.assertEqual(self.post('accept').status_code, 400)
+        self.assertEqual(self.post('reject').status_code, 400)
+        self.assertEqual(len(notifications_sent(get_channel_layer)), 1)
+
+    def test_only_the_receiver_can_respond(self, get_channel_layer):
+        get_channel_layer.return_value.group_send = mock.AsyncMock()
+        stranger = APIClient()
+        stranger.force_authenticate(self.stranger)
+        self.assertEqual(self.post('accept', stranger).status_code, 404)
+        self.assertEqual(self.post('reject').status_code, 200)
+        self.friend_request.refresh_from_db()
+        self.assertEqual(self.friend_request.status, FriendRequest.Status.REJECTED)
+        self.assertFalse(FriendshipDAO.are_friends(self.sender.id, self.receiver.id))
+        self.assertEqual(notifications_sent(get_channel_layer), [])
+
+
+class SocialCounterTests(StoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user, self.first, self.second = self.make_users(3)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def counts(self, user):
+        return User.objects.values_list(*COUNTER_FIELDS).get(id=user.id)
+
+    def test_counters_follow_requests_and_friendships(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/v1/friend-request/bulk-send/', {'receivers': [self.first.id, self.second.id]},
+                             format='json')
+        self.assertEqual(self.counts(self.user), (0, 0, 2))
+        self.assertEqual(self.counts(self.first), (0, 1, 0))
+
+        for receiver, action in ((self.first, 'accept'), (self.second, 'reject')):
+            client = APIClient()
+            client.force_authenticate(receiver)
+            friend_request = FriendRequest.objects.get(receiver=receiver)
+            with self.captureOnCommitCallbacks(execute=True):
+                client.post(f'/api/v1/friend-request/{friend_request.id}/{action}/')
+        self.assertEqual(self.counts(self.user), (1, 0, 0))
+        self.assertEqual(self.counts(self.first), (1, 0, 0))
+        self.assertEqual(self.counts(self.second), (0, 0, 0))
+
+        self.assertEqual(self.client.get(f'/api/v1/users/{self.user.id}/').data['pending_sent_count'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/v1/users/friends/', {'receiver': self.second.id})
+        user = self.client.get(f'/api/v1/users/{self.user.id}/').data
+        self.assertEqual((user['friends_count'], user['pending_sent_count']), (1, 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/v1/friendship/unfriend/', {'user_id': self.first.id})
+        self.assertEqual(self.counts(self.user), (0, 0, 1))
+        self.assertEqual(self.counts(self.first), (0, 0, 0))
+
+    def test_decrements_stop_at_zero(self):
+        User.objects.filter(id=self.first.id).update(friends_count=3)
+        with self.captureOnCommitCallbacks(execute=True):
+            # Drifted: self.user's count is already 0
+            counters.friendships_changed([(self.user.id, self.first.id), (self.second.id, self.first.id)], sign=-1)
+        self.assertEqual(self.counts(self.user), (0, 0, 0))
+        self.assertEqual(self.counts(self.first), (1, 0, 0))
+        self.assertEqual(self.counts(self.second), (0, 0, 0))
+
+    def test_reconcile_repairs_drift(self):
+        Friendship.objects.befriend(self.user.id, self.first.id)
+        FriendRequest.objects.create(sender=self.second, receiver=self.user)
+        User.objects.filter(id=self.second.id).update(friends_count=5)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(reconcile(batch_size=2), 3)
+        self.assertEqual(self.counts(self.user), (1, 1, 0))
+        self.assertEqual(self.counts(self.second), (0, 0, 1))
+        self.assertEqual(reconcile(), 0)
+
+
+@override_settings(USERS_STORE_URL='', CHANNEL_DISPATCH_BACKGROUND=False,
+                   CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+@mock.patch('users.dispatch.get_channel_layer')
+class FriendRequestConcurrencyTests(TransactionTestCase):
+    """Parallel accepts through real transactions, one connection per thread."""
+
+    THREADS = 8
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('needs a database that takes writes from several connections')
+
+    def accept_in_parallel(self, pairs):
+        barrier = threading.Barrier(self.THREADS)
+
+        def accept(receiver, request_id):
+            client = APIClient()
+            client.force_authenticate(receiver)
+            barrier.wait()
+            try:
+                return client.post(f'/api/v1/friend-request/{request_id}/accept/').status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(self.THREADS) as executor:
+            return list(executor.map(lambda pair: accept(*pair), pairs))
+
+    def test_parallel_accepts_of_one_request_have_one_winner(self, get_channel_layer):
+        get_channel_layer.return_value.group_send = mock.AsyncMock()
+        sender, receiver = (User.objects.create(username=f'racer{i}', avatar='') for i in range(2))
+        friend_request = FriendRequest.objects.create(sender=sender, receiver=receiver)
+
+        statuses = self.accept_in_parallel([(receiver, friend_request.id)] * self.THREADS)
+        self.assertEqual(sorted(statuses), [200] + [400] * (self.THREADS - 1))
+        self.assertEqual(Friendship.objects.count(), 2)
+        self.assertEqual(Notification.objects.filter(kind=Notification.Kind.FRIEND_REQUEST_ACCEPTED).count(), 1)
+        self.assertEqual(len(notifications_sent(get_channel_layer)), 1)
+
+    def test_parallel_accepts_of_distinct_requests_all_succeed(self, get_channel_layer):
+        get_channel_layer.return_value.group_send = mock.AsyncMock()
+        receiver = User.objects.create(username='popular', avatar='')
+        requests = [FriendRequest.objects.create(sender=User.objects.create(username=f'fan{i}', avatar=''),
+                                                 receiver=receiver) for i in range(self.THREADS)]
+
+        statuses = self.accept_in_parallel([(receiver, friend_request.id) for friend_request in requests])
+        self.assertEqual(statuses, [200] * self.THREADS)
+        self.assertEqual(Friendship.objects.filter(user1=receiver).count(), self.THREADS)
+        self.assertFalse(FriendRequest.objects.filter(status=FriendRequest.Status.PENDING).exists())
+
+    def test_mutual_accepts_befriend_and_count_once(self, get_channel_layer):
+        get_channel_layer.return_value.group_send = mock.AsyncMock()
+        accepts = []
+        for i in range(self.THREADS // 2):
+            a, b = (User.objects.create(username=f'mutual{i}-{side}', avatar='') for side in 'ab')
+            accepts += [(b, FriendRequest.objects.create(sender=a, receiver=b).id),
+                        (a, FriendRequest.objects.create(sender=b, receiver=a).id)]
+
+        statuses = self.accept_in_parallel(accepts)
+        self.assertEqual(statuses, [200] * self.THREADS)
+        self.assertEqual(Friendship.objects.count(), self.THREADS)
+        self.assertEqual(set(User.objects.values_list('friends_count', flat=True)), {1})
+
+
+class FriendSuggestionTests(StoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.a, self.b, self.c, self.d, self.e, self.loner = self.make_users(6)
+        for user, other in ((self.a, self.b), (self.a, self.c), (self.b, self.d), (self.c, self.d), (self.b, self.e)):
+            Friendship.objects.befriend(user.id, other.id)
+        for user, company in ((self.a, 'Acme'), (self.d, 'Initech'), (self.e, ' acme ')):
+            AlumniProfile.objects.create(user=user, graduation_year='2020' if user is self.d else '2019',
+                                         current_job_title='Engineer', current_company=company)
+        self.client = APIClient()
+        self.client.force_authenticate(self.a)
+
+    def suggested(self):
+        response = self.client.get('/api/v1/users/suggestions/')
+        self.assertEqual(response.status_code, 200)
+        return [(row['suggested']['id'], row['mutual_friends'], row['score']) for row in response.data]
+
+    def test_ranks_by_mutual_friends_and_cohort(self):
+        recompute(block_size=4)
+        # e shares one friend but the company and graduation year; d shares two friends
+        self.assertEqual(self.suggested(), [(self.e.id, 1, 4.0), (self.d.id, 2, 2.0)])
+        self.assertFalse(FriendSuggestion.objects.filter(user=self.loner).exists())
+
+        recompute(k=1)
+        self.assertEqual(self.suggested(), [(self.e.id, 1, 4.0)])
+
+    def test_new_friends_are_skipped_until_recompute(self):
+        recompute()
+        self.suggested()
+        with self.captureOnCommitCallbacks(execute=True):
+            FriendshipDAO.create_friendship(self.a, self.e)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.suggested(), [(self.d.id, 2, 2.0)])
+
+
+class AlumniDirectoryTests(StoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        people = [
+            ('Nguyễn Văn', 'An', '2019', 'Computer Science', 'Acme Corp', 'Backend Engineer'),
+            ('Trần', 'Bình', '2019', 'Economics', 'Nguyen Holdings', 'Analyst'),
+            ('Nguyễn Thị', 'Cúc', '2020', 'Computer Science', 'Initech', 'Data Engineer'),
+        ]
+        self.profiles = []
+        for i, (first_name, last_name, year, major, company, title) in enumerate(people):
+            user = User.objects.create(username=f'alumni{i}', first_name=first_name, last_name=last_name, avatar='')
+            self.profiles.append(AlumniProfile.objects.create(
+                user=user, graduation_year=year, major=major, current_company=company, current_job_title=title
+            ))
+        self.client = APIClient()
+        self.client.force_authenticate(self.profiles[0].user)
+
+    def search(self, **params):
+        response = self.client.get('/api/v1/alumni/', params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return [row['id'] for row in response.data['results']]
+
+    def test_word_prefixes_and_filters(self):
+        an, binh, cuc = (profile.id for profile in self.profiles)
+        self.assertEqual(self.search(q='nguy'), [an, binh, cuc])
+        self.assertEqual(self.search(q='NGUYEN engineer'), [an, cuc])
+        self.assertEqual(self.search(name='nguyen'), [an, cuc])
+        self.assertEqual(self.search(name='acme'), [])
+        self.assertEqual(self.search(q='engineer', graduation_year='2020', major='Computer Science'), [cuc])
+        self.assertEqual(self.search(current_company='Initech'), [cuc])
+
+    def test_profile_and_name_changes_are_reindexed(self):
+        profile = self.profiles[1]
+        profile.current_company = 'Globex'
+        profile.save()
+        self.assertEqual(self.search(q='globex'), [profile.id])
+
+        profile.user.last_name = 'Zhang'
+        profile.user.save()
+        self.assertEqual(self.search(name='zhang'), [profile.id])
+        self.assertEqual(self.search(name='binh'), [])
+
+    def test_saves_that_keep_the_name_skip_the_reindex(self):
+        user = User.objects.get(pk=self.profiles[1].user_id)
+        with mock.patch('users.signals.index_profiles') as index:
+            user.save()
+            user.last_login = timezone.now()
+            user.save(update_fields=['last_login'])
+            user.last_name = 'Zhang'
+            user.save(update_fields=['last_login'])
+            self.assertEqual(index.call_count, 0)
+            user.save(update_fields=['last_name'])
+            user.save()
+            self.assertEqual(index.call_count, 1)
+
+    def test_page_is_one_query(self):
+        with self.assertNumQueries(1):
+            self.client.get('/api/v1/alumni/', {'q': 'nguyen computer', 'page_size': 1})
+
+
+class NotificationInboxTests(StoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user, self.other = self.make_users(2)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_friend_requests_are_stored_and_read_by_high_water_mark(self):
+        other = APIClient()
+        other.force_authenticate(self.other)
+        with self.captureOnCommitCallbacks(execute=True):
+            other.post('/api/v1/users/friends/', {'receiver': self.user.id})
+        self.assertEqual(self.client.get('/api/v1/notifications/unread-count/').data, {'count': 1})
+
+        response = self.client.get('/api/v1/notifications/')
+        notification, = response.data['results']
+        self.assertEqual(notification['kind'], Notification.Kind.FRIEND_REQUEST)
+        self.assertEqual(notification['payload']['sender_id'], self.other.id)
+        self.assertFalse(notification['read'])
+
+        response = self.client.post('/api/v1/notifications/read/', {}, format='json')
+        self.assertEqual(response.data, {'last_read_id': notification['id']})
+        self.assertTrue(self.client.get('/api/v1/notifications/').data['results'][0]['read'])
+        with self.assertNumQueries(1):
+            mark_read(self.user.id, notification['id'] + 100)
+        with self.assertNumQueries(2):
+            mark_read(self.user.id, notification['id'])
+        self.assertEqual(self.client.get('/api/v1/notifications/unread-count/').data, {'count': 0})
+
+    def test_read_mark_is_clamped_to_the_newest_notification(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first, = notify_users(Notification.Kind.FRIEND_REQUEST, {self.user.id: {'sender_id': self.other.id}})
+        response = self.client.post('/api/v1/notifications/read/', {'up_to': 10 ** 12}, format='json')
+        self.assertEqual(response.data, {'last_read_id': first.id})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            notify_users(Notification.Kind.FRIEND_REQUEST, {self.user.id: {'sender_id': self.other.id}})
+        self.assertEqual(self.client.get('/api/v1/notifications/unread-count/').data, {'count': 1})
+
+    def test_rolled_back_notifications_are_neither_stored_nor_sent(self):
+        with mock.patch('users.dispatch.get_channel_layer') as get_channel_layer, \
+                self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    notify_users(Notification.Kind.FRIEND_REQUEST, {self.user.id: {}})
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(callbacks, [])
+        get_channel_layer.assert_not_called()
+        self.assertFalse(Notification.objects.exists())
+
+    async def test_unread_notifications_are_replayed_on_connect(self):
+        await database_sync_to_async(notify_users)(
+            Notification.Kind.FRIEND_REQUEST, {self.user.id: {'message': 'read'}})
+        first, = await database_sync_to_async(notify_users)(
+            Notification.Kind.FRIEND_REQUEST, {self.user.id: {'message': 'missed'}})
+        second, = await database_sync_to_async(notify_users)(
+            Notification.Kind.FRIEND_REQUEST, {self.user.id: {'message': 'missed too'}})
+        await database_sync_to_async(mark_read)(self.user.id, first.id - 1)
+
+        async def connect(user, query=''):
+            communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns),
+                                                 f'/ws/notifications/{self.user.id}/{query}')
+            communicator.scope['user'] = user
+            connected, _ = await communicator.connect()
+            self.assertEqual(connected, user == self.user)
+            return communicator
+
+        socket = await connect(self.user)
+        self.assertEqual(await socket.receive_json_from(), {
+            'id': first.id, 'kind': 'FRIEND_REQUEST', 'payload': {'message': 'missed'}})
+        self.assertEqual((await socket.receive_json_from())['id'], second.id)
+        self.assertTrue(await socket.receive_nothing())
+        await socket.disconnect()
+
+        socket = await connect(self.user, f'?since={first.id}')
+        self.assertEqual((await socket.receive_json_from())['id'], second.id)
+        self.assertTrue(await socket.receive_nothing())
+        await socket.disconnect()
+
+        # Anyone else is turned away before joining the group
+        with mock.patch.object(get_channel_layer(), 'group_add') as group_add:
+            await connect(self.other)
+            await connect(AnonymousUser())
+        group_add.assert_not_called()
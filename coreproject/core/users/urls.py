@@ -4,6 +4,9 @@ from .views import *
 router = DefaultRouter()
 router.register(r'users', UserViewSet, basename='user')
 router.register(r'friend-request', FriendRequestViewSet, basename='friend-request')
+router.register(r'friendship', FriendshipViewSet, basename='friendship')
+router.register(r'alumni', AlumniViewSet, basename='alumni')
+router.register(r'notifications', NotificationViewSet, basename='notification')
 
 urlpatterns = [
     path('v1/', include(router.urls))
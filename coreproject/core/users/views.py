@@ -1,20 +1,37 @@
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
+import hmac
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import URLValidator
 from django.db import transaction
 from django.db.models import Q
+from django.http import Http404, HttpResponse, HttpResponseForbidden
 from django.shortcuts import render
+from django.views.decorators.http import condition, require_GET
+from django.views.decorators.vary import vary_on_headers
 from rest_framework import viewsets, permissions, parsers, generics, status
 from rest_framework.decorators import action
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
-import cloudinary.uploader
 
+from . import counters, metrics
+from .daos import FriendRequestDAO, FriendshipDAO
+from .media import USER_MEDIA_FOLDERS, discard_staged, schedule_user_media
+from .notifications import last_read_id, mark_read, notify_users, unread_count
+from .paginators import AlumniDirectoryPagination, KeysetPagination
+from .presence import presence_tracker
+from .response_cache import response_cache
+from .schema import FORMATS, accepts_gzip, schema_files
+from .search import search_alumni
 from .serializers import *
 
 
 # Create your views here.
 
 
+avatar_url_validator = URLValidator(schemes=['https'])
+
+
 class UserViewSet(viewsets.ViewSet, generics.RetrieveAPIView):
     queryset = User.objects.all()
     serializer_class = UserSerializer
@@ -27,42 +44,83 @@ class UserViewSet(viewsets.ViewSet, generics.RetrieveAPIView):
 
         return self.permission_classes
 
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            user_id = int(kwargs[self.lookup_field])
+        except (KeyError, ValueError):
+            return super().retrieve(request, *args, **kwargs)
+
+        key, data = response_cache.get('retrieve', user_id)
+        if data is None:
+            data = super().retrieve(request, *args, **kwargs).data
+            response_cache.set(key, data)
+        return Response(data, status=status.HTTP_200_OK)
+
     @action(detail=False, methods=['get'], url_path='current-user')
     def current_user(self, request):
         user = request.user
 
+        # Cached per user version; a hit does not touch the ORM
+        key, data = response_cache.get('current-user', user.id)
+        if data is None:
+            data = self.current_user_data(user)
+            response_cache.set(key, data)
+        return Response(data, status=status.HTTP_200_OK)
+
+    def current_user_data(self, user):
         if user.role == User.Roles.ALUMNI:
             # Include Alumni profile information
             alumni_profile = user.alumniprofile
-            alumni_serializer = AlumniSerializer(alumni_profile)
-            return Response({
+            alumni_serializer = AlumniProfileSerializer(alumni_profile)
+            return {
                 "user": self.get_serializer(user).data,
                 "alumni": alumni_serializer.data
-            }, status=status.HTTP_200_OK)
+            }
 
         elif user.role == User.Roles.LECTURER:
             # Include Lecturer profile information
             lecturer_profile = user.lecturerprofile
-            lecturer_serializer = LecturerSerializer(lecturer_profile)
-            return Response({
+            lecturer_serializer = LecturerProfileSerializer(lecturer_profile)
+            return {
                 "user": self.get_serializer(user).data,
                 "lecturer": lecturer_serializer.data
-            }, status=status.HTTP_200_OK)
+            }
 
         # Return only user data if not Alumni or Lecturer
-        return Response(UserSerializer(user).data, status=status.HTTP_200_OK)
+        return UserSerializer(user).data
+
+    @action(detail=False, methods=['get'], url_path='suggestions')
+    def suggestions(self, request):
+        # Precomputed top-K; anyone befriended since the last recompute is skipped
+        friend_ids = FriendshipDAO.get_friend_ids(request.user.id)
+        suggestions = FriendSuggestion.objects.filter(user=request.user).select_related('suggested').only(
+            *FriendSuggestionSerializer.Meta.fields, 'rank',
+            *(f'suggested__{column}' for column in UserFriendSerializer.Meta.fields)
+        ).order_by('rank')
+
+        serializer = FriendSuggestionSerializer(
+            [suggestion for suggestion in suggestions if suggestion.suggested_id not in friend_ids], many=True
+        )
+        return Response(serializer.data, status=status.HTTP_200_OK)
 
     @action(detail=False, methods=['post'], url_path='register')
     def register_user(self, request):
         data = request.data
         password = data.get('password')
         if not password:
-            return Response({"error": "Password is required"}, status=status)
+            return Response({"error": "Password is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        avatar = data.get('avatar')
+        if isinstance(avatar, str) and avatar:
+            try:
+                avatar_url_validator(avatar)
+            except ValidationError:
+                return Response({"error": "Avatar must be an https URL"}, status=status.HTTP_400_BAD_REQUEST)
 
+        staged = []
         try:
             with transaction.atomic():
-                avatar = data.get('avatar')
-                res = cloudinary.uploader.upload(avatar, folder='avatar/')
+                # The user is committed with the placeholder avatar (or the URL it was given); uploads run after commit
                 new_user = User.objects.create_user(
                     username=data.get('username'),
                     password=password,
@@ -70,14 +128,21 @@ class UserViewSet(viewsets.ViewSet, generics.RetrieveAPIView):
                     first_name=data.get('first_name'),
                     last_name=data.get('last_name'),
                     phone_number=data.get('phone_number'),
-                    avatar=res['secure_url']
+                    avatar=avatar if isinstance(avatar, str) and avatar else settings.DEFAULT_AVATAR_URL
                 )
 
+                for field in USER_MEDIA_FOLDERS:
+                    uploaded_file = request.FILES.get(field)
+                    if uploaded_file:
+                        staged.append(schedule_user_media(new_user, field, uploaded_file))
+
                 serializer = self.get_serializer(new_user)
 
                 return Response(data=serializer.data, status=status.HTTP_201_CREATED)
 
         except Exception as e:
+            # Rolled back: nothing will upload what was staged
+            discard_staged(staged)
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
     @action(detail=False, methods=['post'], url_path='change-password')
@@ -116,7 +181,7 @@ class UserViewSet(viewsets.ViewSet, generics.RetrieveAPIView):
                     return Response(user_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
                 # Update the lecturer-specific fields
-                lecturer_serializer = LecturerSerializer(lecturer_profile, data=lecturer_data, partial=True)
+                lecturer_serializer = LecturerProfileSerializer(lecturer_profile, data=lecturer_data, partial=True)
                 if lecturer_serializer.is_valid():
                     lecturer_serializer.save()
                 else:
@@ -149,7 +214,7 @@ class UserViewSet(viewsets.ViewSet, generics.RetrieveAPIView):
                     return Response(user_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
                 # Update the alumni-specific fields
-                alumni_serializer = AlumniSerializer(alumni_profile, data=alumni_data, partial=True)
+                alumni_serializer = AlumniProfileSerializer(alumni_profile, data=alumni_data, partial=True)
                 if alumni_serializer.is_valid():
                     alumni_serializer.save()
                 else:
@@ -183,6 +248,7 @@ class UserViewSet(viewsets.ViewSet, generics.RetrieveAPIView):
                     # Tạo yêu cầu kết bạn mới
                 friend_request = FriendRequest(sender=sender, receiver=receiver)
                 friend_request.save()
+                counters.requests_changed([(sender.id, receiver.id)])
 
                 # Gửi thông báo thời gian thực
                 self.send_notification(friend_request)
@@ -199,6 +265,7 @@ class UserViewSet(viewsets.ViewSet, generics.RetrieveAPIView):
         if rejected_request:
             rejected_request.status = FriendRequest.Status.PENDING
             rejected_request.save()
+            counters.requests_changed([(sender.id, receiver.id)])
 
             # Gửi thông báo thời gian thực
             self.send_notification(rejected_request)
@@ -209,33 +276,52 @@ class UserViewSet(viewsets.ViewSet, generics.RetrieveAPIView):
         return FriendRequest.objects.filter(sender=sender, receiver=receiver, status=FriendRequest.Status.PENDING).exists()
 
     def send_notification(self, friend_request):
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f"user_{friend_request.receiver.id}",
-            {
-                'type': 'send_notification',
-                'payload': {
-                    'friend_request_id': friend_request.id,
-                    'sender_id': friend_request.sender.id,
-                    'message': "You have a new friend request"
-                }
+        notify_users(Notification.Kind.FRIEND_REQUEST, {
+            friend_request.receiver_id: {
+                'friend_request_id': friend_request.id,
+                'sender_id': friend_request.sender_id,
+                'message': "You have a new friend request"
             }
+        })
+
+
+class AlumniViewSet(viewsets.ViewSet, generics.ListAPIView):
+    """Alumni directory: ``?q=`` matches word prefixes in any field, ``?name=`` in names only,
+    and ``graduation_year``, ``major``, ``current_company``, ``current_job_title`` filter exactly."""
+    serializer_class = AlumniDirectorySerializer
+    pagination_class = AlumniDirectoryPagination
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        params = AlumniSearchSerializer(data=self.request.query_params)
+        params.is_valid(raise_exception=True)
+        return search_alumni(**params.validated_data).select_related('user').only(
+            *AlumniDirectorySerializer.Meta.fields,
+            *(f'user__{column}' for column in UserFriendSerializer.Meta.fields)
         )
 
 
 class FriendRequestViewSet(viewsets.ViewSet,
                            generics.RetrieveAPIView,
                            generics.CreateAPIView):
-    queryset = FriendRequest.objects.all()
+    queryset = FriendRequest.objects.select_related('sender', 'receiver')
     serializer_class = FriendRequestSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     @action(detail=False, methods=['get'], url_path='received-requests')
     def received_requests(self, request):
-        received_requests = self.get_queryset().filter(receiver=request.user, status=FriendRequest.Status.PENDING)
-
-        paginator = PageNumberPagination()
-        paginator.page_size = 10
+        received_requests = self.get_queryset().filter(
+            receiver=request.user, status=FriendRequest.Status.PENDING
+        ).only(
+            *FriendRequestSerializer.Meta.fields,
+            *(f'{field}__{column}' for field in ('sender', 'receiver') for column in UserFriendSerializer.Meta.fields)
+        ).order_by('-created_at', '-id')
+
+        if KeysetPagination.requested(request):
+            paginator = KeysetPagination()
+        else:
+            paginator = PageNumberPagination()
+            paginator.page_size = 10
         paginated_requests = paginator.paginate_queryset(received_requests, request)
 
         serializer = FriendRequestSerializer(paginated_requests, many=True)
@@ -243,52 +329,111 @@ class FriendRequestViewSet(viewsets.ViewSet,
 
     @action(detail=True, methods=['post'])
     def accept(self, request, pk=None):
-        request_instance = self.get_object()
-        if request_instance.status == FriendRequest.Status.PENDING:
-            return Response({'detail': 'Request already processed'}, status=status.HTTP_400_BAD_REQUEST)
-
-        request_instance.status = FriendRequest.Status.ACCEPTED
-        request_instance.save()
-
-        Friendship.objects.create(user1=request_instance.sender, user2=request_instance.receiver)
-
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f"user_{request_instance.sender.id}",
-            {
-                'type': 'send_notification',
-                'payload': {
-                    'message': f"Your friend request to {request_instance.receiver.username} has been accepted",
-                }
-            }
-        )
-
-        return Response({'status': 'Request accepted'}, status=status.HTTP_200_OK)
+        return self.respond(request, pk, accept=True)
 
     @action(detail=True, methods=['post'])
     def reject(self, request, pk=None):
-        request_instance = self.get_object()
-        if request_instance.status == FriendRequest.Status.PENDING:
+        return self.respond(request, pk, accept=False)
+
+    def respond(self, request, pk, accept):
+        try:
+            request_id = int(pk)
+        except (TypeError, ValueError):
+            raise Http404
+
+        with transaction.atomic():
+            result, sender_id = FriendRequestDAO.respond_to_request(request.user, request_id, accept)
+            if result == 'accepted':
+                notify_users(Notification.Kind.FRIEND_REQUEST_ACCEPTED, {
+                    sender_id: {
+                        'friend_request_ids': [request_id],
+                        'message': f"Your friend request to {request.user.username} has been accepted",
+                    }
+                })
+
+        if result == 'not_found':
+            raise Http404
+        if result == 'processed':
             return Response({'detail': 'Request already processed'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'status': f'Request {result}'}, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'], url_path='bulk-send')
+    def bulk_send(self, request):
+        serializer = FriendRequestBulkSendSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
 
-        request_instance.status = FriendRequest.Status.REJECTED
-        request_instance.save()
-        return Response({'status': 'Request rejected'}, status=status.HTTP_200_OK)
+        with transaction.atomic():
+            results, sent = FriendRequestDAO.send_requests(request.user, serializer.validated_data['receivers'])
+            notify_users(Notification.Kind.FRIEND_REQUEST, {
+                friend_request.receiver_id: {
+                    'friend_request_id': friend_request.id,
+                    'sender_id': request.user.id,
+                    'message': "You have a new friend request"
+                } for friend_request in sent
+            })
+
+        return Response({'results': [{'receiver': receiver_id, 'status': result}
+                                     for receiver_id, result in results.items()]}, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'], url_path='bulk-accept')
+    def bulk_accept(self, request):
+        return self.bulk_respond(request, accept=True)
+
+    @action(detail=False, methods=['post'], url_path='bulk-reject')
+    def bulk_reject(self, request):
+        return self.bulk_respond(request, accept=False)
+
+    def bulk_respond(self, request, accept):
+        serializer = FriendRequestBulkActionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        with transaction.atomic():
+            results, updated = FriendRequestDAO.respond_to_requests(
+                request.user, serializer.validated_data['ids'], accept
+            )
+            if accept:
+                # One notification per sender, however many of their requests were accepted
+                accepted = {}
+                for friend_request in updated:
+                    accepted.setdefault(friend_request.sender_id, []).append(friend_request.id)
+                notify_users(Notification.Kind.FRIEND_REQUEST_ACCEPTED, {
+                    sender_id: {
+                        'friend_request_ids': request_ids,
+                        'message': f"Your friend request to {request.user.username} has been accepted",
+                    } for sender_id, request_ids in accepted.items()
+                })
+
+        return Response({'results': [{'id': request_id, 'status': result}
+                                     for request_id, result in results.items()]}, status=status.HTTP_200_OK)
 
 
 class FriendshipViewSet(viewsets.ViewSet, generics.ListAPIView):
-    queryset = Friendship.objects.all()
+    queryset = Friendship.objects.select_related('user1', 'user2').only(
+        *FriendshipSerializer.Meta.fields,
+        *(f'{field}__{column}' for field in ('user1', 'user2') for column in UserFriendSerializer.Meta.fields)
+    ).order_by('-id')
+    serializer_class = FriendshipSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    def get_queryset(self):
+        return self.queryset.filter(user1=self.request.user)
+
     @action(detail=False, methods=['get'], url_path='friends')
     def list_friends(self, request):
         user = request.user
 
-        friends = User.objects.filter(
-            id__in =Friendship.objects.filter(user1=user).value('user2')
-        ) | User.objects.filter(
-            id__in=Friendship.objects.filter(user2=user).values('user1')
-        )
+        if KeysetPagination.requested(request):
+            # Pages through the (user1, created_at, id) index, newest friendships first
+            paginator = KeysetPagination()
+            friendships = paginator.paginate_queryset(
+                Friendship.objects.filter(user1=user).select_related('user2').only(
+                    'id', 'created_at', *(f'user2__{column}' for column in UserSerializer.Meta.fields)
+                ), request
+            )
+            serializer = UserSerializer([friendship.user2 for friendship in friendships], many=True)
+            return paginator.get_paginated_response(serializer.data)
+
+        friends = FriendshipDAO.get_friends(user.id).only('id', *UserSerializer.Meta.fields).order_by('id')
 
         paginator = PageNumberPagination()
         paginator.page_size = 10
@@ -297,6 +442,14 @@ class FriendshipViewSet(viewsets.ViewSet, generics.ListAPIView):
         serializer = UserSerializer(paginated_friends, many=True)
         return paginator.get_paginated_response(serializer.data)
 
+    @action(detail=False, methods=['get'], url_path='online')
+    def online_friends(self, request):
+        # Intersected in the store; only the friends who are online are read from the database
+        statuses = presence_tracker.online_friends(request.user.id)
+        friends = User.objects.filter(id__in=statuses).only(*UserFriendSerializer.Meta.fields).order_by('id')
+        serializer = OnlineFriendSerializer(friends, many=True, context={'statuses': statuses})
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
     @action(detail=False, methods=['post'], url_path='unfriend')
     def unfriend(self, request):
         try:
@@ -306,23 +459,20 @@ class FriendshipViewSet(viewsets.ViewSet, generics.ListAPIView):
 
             user_to_unfriend = User.objects.get(id=user_id_to_unfriend)
 
-            friendship = Friendship.objects.filter(
-                (Q(user1=request.user, user2=user_to_unfriend) | Q(user1=user_to_unfriend, user2=request.user))
-            ).first()
-
-            if not friendship:
-                return Response({'error': 'Friendship does not exist'}, status=status.HTTP_404_NOT_FOUND)
-
-            friendship.delete()
+            with transaction.atomic():
+                if not FriendshipDAO.delete_friendship(request.user, user_to_unfriend):
+                    return Response({'error': 'Friendship does not exist'}, status=status.HTTP_404_NOT_FOUND)
 
-            friend_request = FriendRequest.objects.filter(
-                Q(sender=request.user, receiver=user_to_unfriend) |
-                Q(sender=user_to_unfriend, receiver=request.user)
-            ).first()
+                friend_request = FriendRequest.objects.filter(
+                    Q(sender=request.user, receiver=user_to_unfriend) |
+                    Q(sender=user_to_unfriend, receiver=request.user)
+                ).first()
 
-            if friend_request:
-                friend_request.status = FriendRequest.Status.REJECTED
-                friend_request.save()
+                if friend_request:
+                    if friend_request.status == FriendRequest.Status.PENDING:
+                        counters.requests_changed([(friend_request.sender_id, friend_request.receiver_id)], -1)
+                    friend_request.status = FriendRequest.Status.REJECTED
+                    friend_request.save()
 
             return Response({'status': 'Unfriended and request status updated successfully'}, status=status.HTTP_200_OK)
         except User.DoesNotExist:
@@ -331,13 +481,71 @@ class FriendshipViewSet(viewsets.ViewSet, generics.ListAPIView):
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-def send_activity_status(user_id):
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
-        f"user_{user_id}",
-        {
-            'type': 'send_activity_status',
-            'user_id': user_id,
-            'status': 'active'
-        }
-    )
\ No newline at end of file
+class NotificationViewSet(viewsets.ViewSet, generics.ListAPIView):
+    """Newest-first inbox; ``read`` comes from the per-user high-water mark."""
+    serializer_class = NotificationSerializer
+    pagination_class = KeysetPagination
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return Notification.objects.filter(recipient=self.request.user)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if not getattr(self, 'swagger_fake_view', False):
+            # Schema generation has no user to look up
+            context['last_read_id'] = last_read_id(self.request.user.id)
+        return context
+
+    @action(detail=False, methods=['post'], url_path='read')
+    def read(self, request):
+        serializer = NotificationReadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        latest_id = self.get_queryset().order_by('-id').values_list('id', flat=True).first() or 0
+        up_to = serializer.validated_data.get('up_to')
+        # The mark never moves back, so an id past the newest notification would
+        # mark notifications that do not exist yet as read for good
+        up_to = latest_id if up_to is None else min(up_to, latest_id)
+
+        mark_read(request.user.id, up_to)
+        return Response({'last_read_id': last_read_id(request.user.id)}, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'], url_path='unread-count')
+    def unread_count(self, request):
+        return Response({'count': unread_count(request.user.id)}, status=status.HTTP_200_OK)
+
+
+@require_GET
+def metrics_export(request):
+    # Prometheus scrapes with "Authorization: Bearer <METRICS_TOKEN>" when one is configured
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def schema_etag(request, format):
+    try:
+        return schema_files[format].load().etag
+    except FileNotFoundError:
+        return None
+
+
+@require_GET
+@vary_on_headers('Accept-Encoding')
+@condition(etag_func=schema_etag)
+def openapi_schema(request, format):
+    # Built by `manage.py generate_schema`, never introspected per request
+    try:
+        schema = schema_files[format].load()
+    except FileNotFoundError:
+        raise Http404('Run manage.py generate_schema')
+
+    if accepts_gzip(request.headers.get('Accept-Encoding', '')):
+        response = HttpResponse(schema.gzipped, content_type=FORMATS[format])
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(schema.content, content_type=FORMATS[format])
+    response['ETag'] = schema.etag
+    response['Cache-Control'] = 'no-cache'
+    return response